@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" ascache.py
+
+    Copyright 2021 MC-6312
+
+    his file is part of AudioStat.
+
+    AudioStat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    AudioStat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with AudioStat.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+import os
+import os.path
+import sqlite3
+import threading
+
+from audiostat import *
+
+
+class MetadataCache():
+    """Дисковый кэш метаданных аудиофайлов (БД SQLite).
+
+    Ключ записи - полный путь к файлу; запись считается действительной,
+    если размер, время изменения (в наносекундах) и номер inode
+    файла совпадают с сохранёнными в записи.
+
+    Кроме того, в кэше хранятся списки содержимого каталогов
+    (см. lookup_dir()): запись считается действительной, пока не изменилось
+    время изменения каталога, а оно меняется при добавлении, удалении
+    и переименовании элементов каталога, но не при перезаписи файлов
+    "на месте" - записи о файлах такого каталога следует проверять
+    (см. lookup_dir_files()).
+
+    Одну БД могут одновременно использовать несколько процессов
+    (журнал в режиме WAL); каждый поток использует собственное
+    соединение с БД, close() закрывает соединения всех потоков.
+
+    Пути и имена элементов каталогов хранятся в БД как BLOB
+    (os.fsencode()) - в именах файлов бывают байты, которые
+    в UTF-8 не укладываются (os.scandir() отдаёт их суррогатами).
+
+    Поля:
+        dbPath  - строка, путь к файлу БД;
+        hits    - целое, кол-во файлов, параметры которых взяты из кэша;
+        misses  - целое, кол-во файлов, которые пришлось разбирать;
+                  hits и misses могут обновляться из нескольких потоков,
+                  так что их следует увеличивать методом count_lookup()."""
+
+    # при изменении структуры таблиц или состава полей AudioFileInfo.FIELDS
+    # значение следует увеличивать - старый кэш будет пересоздан
+    SCHEMA_VERSION = 5
+
+    # кол-во новых записей, после которого они сбрасываются в БД
+    COMMIT_INTERVAL = 512
+
+    # сколько ждать (в секундах) освобождения БД другим процессом
+    LOCK_TIMEOUT = 30.0
+
+    # через сколько проверенных записей prune() сообщает о ходе проверки
+    PRUNE_PROGRESS_STEP = 256
+
+    __FILES_COLUMNS = ('size', 'mtime', 'inode') + AudioFileInfo.FIELDS
+
+    def __init__(self, dbPath):
+        self.dbPath = dbPath
+
+        self.hits = 0
+        self.misses = 0
+
+        # соединения с БД потоков, ключи - threading.get_ident()
+        self.__dbs = dict()
+        self.__lock = threading.Lock()
+        # записи, ещё не сброшенные в БД
+        self.__pending = []
+        self.__pendingDirs = []
+
+        d = os.path.split(self.dbPath)[0]
+        if d:
+            os.makedirs(d, exist_ok=True)
+
+        self.__init_db(self.__get_db())
+
+    def __init_db(self, db):
+        if db.execute('PRAGMA user_version;').fetchone()[0] != self.SCHEMA_VERSION:
+            db.execute('DROP TABLE IF EXISTS files;')
+            db.execute('DROP TABLE IF EXISTS dirs;')
+            db.execute('PRAGMA user_version=%d;' % self.SCHEMA_VERSION)
+
+        db.execute('''CREATE TABLE IF NOT EXISTS files(
+            path BLOB PRIMARY KEY, dir BLOB, dev INTEGER,
+            size INTEGER, mtime INTEGER, inode INTEGER,
+            mime TEXT,
+            sampleRate INTEGER, channels INTEGER, bitsPerSample INTEGER,
+            bitRate INTEGER, missingTags INTEGER,
+            error TEXT, tagsRead INTEGER) WITHOUT ROWID;''')
+        db.execute('CREATE INDEX IF NOT EXISTS files_dir ON files(dir);')
+
+        # files, subdirs и links - имена элементов каталога, разделённые '/'
+        db.execute('''CREATE TABLE IF NOT EXISTS dirs(
+            path BLOB PRIMARY KEY,
+            mtime INTEGER, nEntries INTEGER,
+            files BLOB, subdirs BLOB, links BLOB) WITHOUT ROWID;''')
+        db.commit()
+
+    def __get_db(self):
+        """Возвращает соединение с БД для текущего потока."""
+
+        tid = threading.get_ident()
+
+        db = self.__dbs.get(tid)
+        if db is None:
+            # соединением пользуется только создавший его поток,
+            # а закрывать его может и другой (см. close())
+            db = sqlite3.connect(self.dbPath, timeout=self.LOCK_TIMEOUT,
+                check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL;')
+            db.execute('PRAGMA synchronous=NORMAL;')
+
+            with self.__lock:
+                self.__dbs[tid] = db
+
+        return db
+
+    def reset_counters(self):
+        with self.__lock:
+            self.hits = 0
+            self.misses = 0
+
+    def count_lookup(self, hit):
+        """Учёт попадания (hit == True) или промаха при поиске в кэше."""
+
+        with self.__lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @staticmethod
+    def stat_key(st):
+        """Возвращает кортеж (size, mtime, inode) из os.stat_result."""
+
+        return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def lookup(self, fpath, st, needTags=False):
+        """Поиск действительной записи в кэше.
+
+        Параметры:
+            fpath       - строка, полный путь к файлу;
+            st          - os.stat_result для файла;
+            needTags    - булевское, True - записи, сделанные
+                          без разбора тэгов (AudioFileInfo.tagsRead
+                          == False), считаются недействительными.
+
+        Возвращает экземпляр AudioFileInfo или None, если записи
+        нет или она устарела."""
+
+        r = self.__get_db().execute('SELECT %s FROM files WHERE path=?;' % ', '.join(self.__FILES_COLUMNS),
+            (os.fsencode(fpath),)).fetchone()
+
+        if r is None or tuple(r[:3]) != self.stat_key(st):
+            return
+
+        nfo = AudioFileInfo.new_from_fields(r[3:])
+        nfo.tagsRead = bool(nfo.tagsRead)
+
+        if needTags and not nfo.tagsRead:
+            return
+
+        return nfo
+
+    def store(self, fpath, st, nfo):
+        """Добавление или замена записи в кэше.
+        Записи сбрасываются в БД пачками, см. COMMIT_INTERVAL и commit().
+
+        Параметры:
+            fpath   - строка, полный путь к файлу;
+            st      - os.stat_result для файла;
+            nfo     - экземпляр AudioFileInfo."""
+
+        with self.__lock:
+            self.__pending.append((os.fsencode(fpath), os.fsencode(os.path.split(fpath)[0]), st.st_dev)
+                + self.stat_key(st) + nfo.get_fields())
+            flush = len(self.__pending) >= self.COMMIT_INTERVAL
+
+        if flush:
+            self.commit()
+
+    def commit(self):
+        """Сброс в БД накопленных методом store() записей."""
+
+        with self.__lock:
+            pending = self.__pending
+            self.__pending = []
+
+            pendingDirs = self.__pendingDirs
+            self.__pendingDirs = []
+
+        if pending or pendingDirs:
+            db = self.__get_db()
+
+            # записи о файлах - раньше записей о содержащих их каталогах
+            with db:
+                db.executemany('INSERT OR REPLACE INTO files(path, dir, dev, %s) VALUES (?, ?, ?%s);' % (
+                        ', '.join(self.__FILES_COLUMNS), ', ?' * len(self.__FILES_COLUMNS)),
+                    pending)
+
+                db.executemany('INSERT OR REPLACE INTO dirs(path, mtime, nEntries, files, subdirs, links) VALUES (?, ?, ?, ?, ?, ?);',
+                    pendingDirs)
+
+    def lookup_dir(self, dirpath, st):
+        """Поиск действительной записи о содержимом каталога.
+
+        Параметры:
+            dirpath - строка, полный путь к каталогу;
+            st      - os.stat_result для каталога.
+
+        Возвращает кортеж из трёх списков - имён файлов (всех элементов,
+        кроме каталогов), имён подкаталогов и имён символьных ссылок
+        (из первых двух списков), или None, если записи нет или каталог
+        изменился."""
+
+        r = self.__get_db().execute('SELECT mtime, nEntries, files, subdirs, links FROM dirs WHERE path=?;',
+            (os.fsencode(dirpath),)).fetchone()
+
+        if r is None or r[0] != st.st_mtime_ns:
+            return
+
+        files, subdirs, links = (os.fsdecode(v).split('/') if v else [] for v in r[2:])
+
+        if len(files) + len(subdirs) != r[1]:
+            # запись испорчена
+            return
+
+        return files, subdirs, links
+
+    def lookup_dir_files(self, dirpath):
+        """Возвращает словарь, где ключи - имена файлов каталога dirpath,
+        а значения - кортежи вида (st_dev, (size, mtime, inode),
+        AudioFileInfo) из кэша.
+
+        Записи НЕ проверяются - вызывающий должен сам сравнить
+        (size, mtime, inode) с stat_key() файла."""
+
+        r = {}
+
+        for row in self.__get_db().execute('SELECT path, dev, %s FROM files WHERE dir=?;' % ', '.join(self.__FILES_COLUMNS),
+                (os.fsencode(dirpath),)):
+            nfo = AudioFileInfo.new_from_fields(row[5:])
+            nfo.tagsRead = bool(nfo.tagsRead)
+
+            r[os.path.split(os.fsdecode(row[0]))[1]] = (row[1], tuple(row[2:5]), nfo)
+
+        return r
+
+    def store_dir(self, dirpath, st, files, subdirs, links):
+        """Добавление или замена записи о содержимом каталога.
+        Записи сбрасываются в БД вместе с записями о файлах (см. store()).
+
+        Параметры:
+            dirpath - строка, полный путь к каталогу;
+            st      - os.stat_result для каталога, полученный
+                      ДО чтения его содержимого;
+            files   - список имён файлов (всех элементов, кроме каталогов);
+            subdirs - список имён подкаталогов;
+            links   - список имён символьных ссылок из files и subdirs."""
+
+        with self.__lock:
+            self.__pendingDirs.append((os.fsencode(dirpath), st.st_mtime_ns,
+                len(files) + len(subdirs),
+                os.fsencode('/'.join(files)), os.fsencode('/'.join(subdirs)), os.fsencode('/'.join(links))))
+
+    def get_audio_file_info(self, fpath, st=None, headerOnly=False):
+        """Получение параметров файла из кэша, а если их там нет
+        или файл изменился - разбор файла и пополнение кэша.
+
+        Параметры:
+            fpath       - строка, полный путь к файлу;
+            st          - None или os.stat_result для файла;
+                          в случае None os.stat() вызывается здесь;
+            headerOnly  - булевское, см. read_audio_file_info().
+
+        Возвращает экземпляр AudioFileInfo."""
+
+        if st is None:
+            try:
+                st = os.stat(fpath)
+            except OSError:
+                # файл пропал или недоступен - пусть с ним разбирается mutagen,
+                # а в кэш такое не кладём
+                return read_audio_file_info(fpath, headerOnly)
+
+        nfo = self.lookup(fpath, st, not headerOnly)
+
+        self.count_lookup(nfo is not None)
+
+        if nfo is not None:
+            return nfo
+
+        nfo = read_audio_file_info(fpath, headerOnly)
+        self.store(fpath, st, nfo)
+
+        return nfo
+
+    def invalidate(self, fpath):
+        """Удаление записи о файле fpath из кэша."""
+
+        self.commit()
+
+        db = self.__get_db()
+        with db:
+            db.execute('DELETE FROM files WHERE path=?;', (os.fsencode(fpath),))
+            db.execute('DELETE FROM dirs WHERE path=?;', (os.fsencode(os.path.split(fpath)[0]),))
+
+    def invalidate_tree(self, dirpath):
+        """Удаление из кэша записей обо всех файлах в каталоге dirpath
+        и его подкаталогах."""
+
+        self.commit()
+
+        # у BLOB substr() считает байты
+        prefix = os.fsencode(os.path.join(dirpath, ''))
+        # LIKE здесь не годится - в путях могут быть '%' и '_'
+        db = self.__get_db()
+        with db:
+            db.execute('DELETE FROM files WHERE substr(path, 1, ?)=?;',
+                (len(prefix), prefix))
+            db.execute('DELETE FROM dirs WHERE path=? OR substr(path, 1, ?)=?;',
+                (os.fsencode(dirpath), len(prefix), prefix))
+
+    def clear(self):
+        """Полная очистка кэша."""
+
+        with self.__lock:
+            self.__pending.clear()
+            self.__pendingDirs.clear()
+
+        db = self.__get_db()
+        with db:
+            db.execute('DELETE FROM files;')
+            db.execute('DELETE FROM dirs;')
+
+        db.execute('VACUUM;')
+
+    def prune(self, stopfunc=None, progressfunc=None):
+        """Удаление записей о файлах и каталогах, которых больше нет
+        или которые изменились.
+
+        Параметры:
+            stopfunc    - None или функция без параметров, возвращающая
+                          True, если процесс следует прервать
+                          (записи, проверенные до этого, удаляются);
+            progressfunc - None или функция с двумя параметрами -
+                          кол-вом проверенных записей и общим
+                          кол-вом записей, вызывается после проверки
+                          каждых PRUNE_PROGRESS_STEP записей.
+
+        Возвращает количество удалённых записей."""
+
+        self.commit()
+
+        db = self.__get_db()
+
+        files = db.execute('SELECT path, size, mtime, inode FROM files;').fetchall()
+        dirs = db.execute('SELECT path, mtime FROM dirs;').fetchall()
+
+        ntotal = len(files) + len(dirs)
+        nchecked = 0
+
+        stale = []
+        staleDirs = []
+
+        for fpath, size, mtime, inode in files:
+            if stopfunc is not None and stopfunc():
+                break
+
+            nchecked += 1
+            if progressfunc is not None and nchecked % self.PRUNE_PROGRESS_STEP == 0:
+                progressfunc(nchecked, ntotal)
+
+            try:
+                if self.stat_key(os.stat(os.fsdecode(fpath))) == (size, mtime, inode):
+                    continue
+            except OSError:
+                pass
+
+            stale.append((fpath,))
+
+        for dirpath, mtime in dirs:
+            if stopfunc is not None and stopfunc():
+                break
+
+            nchecked += 1
+            if progressfunc is not None and nchecked % self.PRUNE_PROGRESS_STEP == 0:
+                progressfunc(nchecked, ntotal)
+
+            try:
+                if os.stat(os.fsdecode(dirpath)).st_mtime_ns == mtime:
+                    continue
+            except OSError:
+                pass
+
+            staleDirs.append((dirpath,))
+
+        with db:
+            db.executemany('DELETE FROM files WHERE path=?;', stale)
+            db.executemany('DELETE FROM dirs WHERE path=?;', staleDirs)
+
+        return len(stale)
+
+    def close(self):
+        """Сброс накопленных записей и закрытие соединений с БД
+        всех потоков. Вызывать следует, когда другие потоки
+        кэшем уже не пользуются."""
+
+        self.commit()
+
+        with self.__lock:
+            dbs = list(self.__dbs.values())
+            self.__dbs.clear()
+
+        for db in dbs:
+            db.close()
+
+
+if __name__ == '__main__':
+    print('[debugging %s]' % __file__)
+
+    import asconfig
+
+    cfg = asconfig.Config()
+    cfg.load()
+
+    cache = MetadataCache(cfg.pathCache)
+    print('%d stale entries pruned' % cache.prune())
+    cache.close()
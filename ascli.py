@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" ascli.py
+
+    Copyright 2021 MC-6312
+
+    his file is part of AudioStat.
+
+    AudioStat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    AudioStat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with AudioStat.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+# ВНИМАНИЕ! модуль не должен ни прямо, ни косвенно импортировать gi:
+# он предназначен для запуска там, где GTK нет и не будет
+
+
+import sys
+import os.path
+import sqlite3
+from argparse import ArgumentParser
+from time import monotonic
+
+from ascommon import *
+from audiostat import *
+from asconfig import *
+from ascache import *
+from asengine import *
+from aswalker import *
+from asscanner import *
+from asiosched import *
+from asexport import *
+
+
+class ScanOutput(ExportSink):
+    """Вывод результатов обхода каталога.
+
+    Экземпляр передаётся Scanner'у в качестве sink; в режиме NDJSON
+    записи о файлах и каталогах выводятся по мере поступления
+    (см. asexport.NDJSONExporter), по завершении обхода выводятся
+    суммарные таблицы. Кроме того, записи могут выгружаться
+    в файлы (см. asexport.ExportSink).
+
+    Поля:
+        asJSON  - булевское, True - вывод в формате NDJSON,
+                  иначе - простой текст;
+        summary     - экземпляр AudioSummary;
+        nDuplicates - целое, кол-во повторно встреченных файлов
+                      и каталогов (в summary не учитываются);
+        outf        - файловый объект для вывода."""
+
+    def __init__(self, asJSON, outf=sys.stdout, exporters=()):
+        """exporters - последовательность экземпляров
+        asexport.ResultsExporter для выгрузки в файлы."""
+
+        self.asJSON = asJSON
+        self.outf = outf
+
+        self.__jsonOutput = NDJSONExporter(None, outf) if asJSON else None
+
+        super().__init__(([self.__jsonOutput] if asJSON else []) + list(exporters))
+
+        self.summary = AudioSummary()
+        self.nDuplicates = 0
+
+    def __call__(self, events):
+        for event in events:
+            evtype = event[0]
+
+            if evtype == Scanner.EV_FILE:
+                self.summary.update_from_file(event[3])
+            elif evtype == Scanner.EV_DUPLICATE:
+                self.nDuplicates += 1
+
+        super().__call__(events)
+
+    # заголовки и функции отображения параметров суммарных таблиц
+    # (как на странице статистики GUI)
+    __TABLES = (('sampleRates', 'Sample rate (kHz)', disp_int_val_k, True),
+        ('bitsPerSample', 'Bits per sample', disp_int_val, True),
+        ('bitRates', 'Bitrate (kbps)', AudioSummary.bitrate_bucket_str, True),
+        ('totals', 'Summary', str, False))
+
+    def write_summary(self, nFiles, nParsed=0, waitTime=0.0, bytesRead=0, profile=None,
+            unreadableDirs=0):
+        """Вывод суммарных таблиц.
+
+        Параметры:
+            nFiles      - целое, общее кол-во найденных файлов;
+            nParsed     - целое, кол-во разобранных (не взятых из кэша) файлов;
+            waitTime    - вещественное, суммарное время ожидания
+                          ввода-вывода при их разборе (в секундах);
+            bytesRead   - целое, кол-во прочитанных при разборе байт;
+            profile     - None или экземпляр asprofile.ScanProfile;
+                          если указан, после суммарных таблиц выводится
+                          отчёт о времени этапов обхода (в режиме
+                          NDJSON - отдельной записью 'profile');
+            unreadableDirs - целое, кол-во каталогов, которые
+                          не удалось прочитать."""
+
+        waitPerFile = waitTime / nParsed if nParsed else 0.0
+        bytesPerFile = bytesRead // nParsed if nParsed else 0
+
+        if self.asJSON:
+            tables = dict()
+
+            for fldname, _, _, _sort in self.__TABLES:
+                tables[fldname] = [{'value':param, 'count':n, 'percent':pcts}
+                    for param, n, pcts in self.summary.get_table(getattr(self.summary, fldname), _sort)]
+
+            self.__jsonOutput.write_record('summary',
+                files=nFiles,
+                audioFiles=self.summary.nAudioFiles,
+                errors=self.summary.totals[AudioSummary.TS_WITH_ERRORS],
+                duplicates=self.nDuplicates,
+                unreadableDirs=unreadableDirs,
+                parsedFiles=nParsed,
+                ioWait=round(waitTime, 3),
+                ioWaitPerFile=round(waitPerFile, 6),
+                bytesRead=bytesRead,
+                bytesReadPerFile=bytesPerFile,
+                **tables)
+
+            if profile is not None:
+                self.__jsonOutput.write_record('profile', **profile.to_dict())
+        else:
+            print('Total files found: %d' % nFiles, file=self.outf)
+            print('Audio files: %d' % self.summary.nAudioFiles, file=self.outf)
+            print('Errors: %d' % self.summary.totals[AudioSummary.TS_WITH_ERRORS], file=self.outf)
+            print('Duplicates (not counted): %d' % self.nDuplicates, file=self.outf)
+            if unreadableDirs:
+                print('Unreadable directories (skipped): %d' % unreadableDirs, file=self.outf)
+            print('Files parsed: %d, I/O wait: %.2f s (%.2f ms/file)' % (nParsed,
+                waitTime, waitPerFile * 1000), file=self.outf)
+
+            if bytesRead:
+                print('Bytes read: %d (%d per file)' % (bytesRead, bytesPerFile), file=self.outf)
+
+            for fldname, title, tostr, _sort in self.__TABLES:
+                print('\n%s:' % title, file=self.outf)
+
+                for param, n, pcts in self.summary.get_table(getattr(self.summary, fldname), _sort):
+                    print('  %-16s %10d (%d%%)' % (tostr(param), n, pcts), file=self.outf)
+
+            if profile is not None:
+                print('\nScan profile:', file=self.outf)
+
+                for s in profile.get_report():
+                    print('  %s' % s if s else '', file=self.outf)
+
+
+def check_directories(paths):
+    """Проверка существования обходимых каталогов.
+    Возвращает False (выведя сообщения в stderr), если какой-то
+    из paths - не каталог или его нет."""
+
+    ok = True
+
+    for path in paths:
+        if not os.path.isdir(path):
+            print('"%s" is not a directory or does not exist' % path, file=sys.stderr)
+            ok = False
+
+    return ok
+
+
+def cmd_scan(cfg, args):
+    """Команда scan - обход каталога (или нескольких) со сбором статистики.
+    Без указания каталогов обходятся каталоги из Config.roots."""
+
+    if args.directory:
+        roots = [(rootdir, 0) for rootdir in args.directory]
+    elif args.workers is not None:
+        # --workers - для всех устройств
+        roots = [(rootdir, 0) for rootdir, _ in cfg.roots]
+    else:
+        roots = cfg.roots
+
+    if not roots:
+        print('No directories to scan (none given and no [roots] in configuration file)', file=sys.stderr)
+        return 2
+
+    if not check_directories([rootdir for rootdir, _ in roots]):
+        return 2
+
+    exporters = []
+
+    try:
+        for fpath in args.export:
+            exporters.append(new_exporter(fpath))
+    except (OSError, sqlite3.Error) as ex:
+        for exporter in exporters:
+            exporter.close()
+
+        print('Can not create export file - %s' % ex, file=sys.stderr)
+        return 2
+
+    output = ScanOutput(args.json, exporters=exporters)
+
+    cache = MetadataCache(cfg.pathCache) if cfg.useMetadataCache else None
+
+    def __new_engine(nworkers):
+        return ExtractionEngine(cfg.filter, nworkers or cfg.workers, cache, cfg.headerOnlyProbe,
+            cfg.ioOrder, cfg.ioWindow, cfg.prefetch,
+            cfg.politeScan, cfg.readRateLimit * 1024, cfg.idleIOPriority)
+
+    try:
+        if len(roots) == 1:
+            with __new_engine(roots[0][1]) as engine:
+                scanner = Scanner(engine, output, cfg.skipUnchangedDirs, cfg.symlinks)
+
+                try:
+                    scanner.scan(roots[0][0])
+                except KeyboardInterrupt:
+                    scanner.stop()
+                    return 1
+        else:
+            scanner = MultiScanner(roots, __new_engine, output, cfg.skipUnchangedDirs, cfg.symlinks)
+
+            try:
+                scanner.scan()
+            except KeyboardInterrupt:
+                return 1
+    finally:
+        if cache is not None:
+            cache.close()
+
+        output.close()
+
+    output.write_summary(scanner.nFiles, scanner.nParsedFiles, scanner.ioWaitTime,
+        scanner.nBytesRead, scanner.profile, scanner.nUnreadableDirs)
+
+    return 0
+
+
+def cmd_bench_io(cfg, args):
+    """Команда bench-io - сравнение скорости разбора файлов каталога
+    в разном порядке (см. модуль asiosched).
+
+    Перед каждым проходом файлы удаляются из страничного кэша,
+    так что время - это время чтения с диска; каталоги из кэша
+    не удаляются, кэш метаданных не используется."""
+
+    rootdir = args.directory
+
+    if not check_directories([rootdir]):
+        return 2
+
+    rotational = is_rotational(rootdir)
+    print('Device: %s' % ('unknown' if rotational is None else 'rotational' if rotational else 'non-rotational'))
+
+    fpaths = [entry.path for evtype, _, entry in walk_directory(rootdir, symlinks=cfg.symlinks)
+        if evtype == WALK_FILE]
+
+    # по умолчанию - без дочерних процессов: одновременное чтение
+    # несколькими процессами упорядоченность разбора сводит на нет
+    nworkers = 1 if args.workers is None else cfg.workers
+
+    print('Files: %d, workers: %d, batch window: %d, prefetch: %d, passes: %d\n' % (len(fpaths),
+        nworkers, cfg.ioWindow, cfg.prefetch, args.passes))
+
+    # первый обход - вхолостую: при нём загружаются модули mutagen
+    with ExtractionEngine(cfg.filter, nworkers, None, cfg.headerOnlyProbe) as engine:
+        Scanner(engine, lambda events: None, False, cfg.symlinks).scan(rootdir)
+
+    times = []
+
+    for order, ordername in enumerate(IO_ORDERS):
+        best = None
+        bestWait = 0.0
+
+        for _ in range(args.passes):
+            if not all([evict_file(fpath) for fpath in fpaths]):
+                print('Warning: some files were not evicted from the page cache', file=sys.stderr)
+
+            with ExtractionEngine(cfg.filter, nworkers, None, cfg.headerOnlyProbe,
+                    order, cfg.ioWindow, cfg.prefetch,
+                    cfg.politeScan, cfg.readRateLimit * 1024, cfg.idleIOPriority) as engine:
+                scanner = Scanner(engine, lambda events: None, False, cfg.symlinks)
+
+                t0 = monotonic()
+
+                try:
+                    scanner.scan(rootdir)
+                except KeyboardInterrupt:
+                    scanner.stop()
+                    return 1
+
+                t = monotonic() - t0
+
+            if best is None or t < best:
+                best = t
+                bestWait = scanner.ioWaitTime
+
+        times.append(best)
+
+        print('  %-10s %8.3f s %10.1f files/s %6.2fx   I/O wait %8.3f s' % (ordername, best,
+            len(fpaths) / best if best else 0.0,
+            times[0] / best if best else 0.0,
+            bestWait))
+
+    return 0
+
+
+def main(argv):
+    """Разбор параметров командной строки и выполнение команды.
+    Возвращает код завершения процесса."""
+
+    parser = ArgumentParser(prog=os.path.split(sys.argv[0])[1],
+        description='%s - audio file statistics' % TITLE_VERSION)
+
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    # параметры, общие для всех команд
+    common = ArgumentParser(add_help=False)
+    common.add_argument('--workers', type=int, default=None,
+        help='number of metadata extraction processes (0 - number of CPUs)')
+    common.add_argument('--symlinks', choices=SYMLINKS_POLICIES, default=None,
+        help='follow symbolic links: never, only pointing inside the directory, or always')
+    common.add_argument('--full-parse', action='store_true',
+        help='always parse tags, even if the filter does not need them')
+    common.add_argument('--io-window', type=int, default=None, metavar='N',
+        help='number of files (from several directories) ordered by disk location together')
+    common.add_argument('--prefetch', type=int, default=None, metavar='N',
+        help='prefetch headers of up to N files ahead of the parser (0 - disable)')
+    common.add_argument('--polite', action='store_true',
+        help='polite parsing: no readahead, drop the parsed data from the page cache')
+    common.add_argument('--idle-io', action='store_true',
+        help='parse files with the idle I/O priority')
+    common.add_argument('--max-read-rate', type=int, default=None, metavar='KIB',
+        help='limit file read rate to KIB KiB/s (0 - unlimited)')
+    common.add_argument('--no-config', action='store_true',
+        help='do not load settings from the configuration file')
+    common.add_argument('--filter', action='append', default=[], metavar='NAME=VALUE',
+        help='set filter parameter (see [filters] section of the configuration file)')
+
+    p = subparsers.add_parser('scan', parents=[common],
+        help='scan directories and print statistics')
+    p.add_argument('directory', nargs='*',
+        help='directories to scan (default - [roots] from the configuration file); '
+        'directories on different devices are scanned in parallel')
+    p.add_argument('--json', action='store_true',
+        help='write per-file and per-directory records and the summary as NDJSON')
+    p.add_argument('--no-cache', action='store_true',
+        help='do not use the metadata cache')
+    p.add_argument('--full-rescan', action='store_true',
+        help='read all directories, even those unchanged since the previous scan')
+    p.add_argument('--io-order', choices=IO_ORDERS, default=None,
+        help='parse files in directory order, or ordered by inode number or physical location on disk')
+    p.add_argument('--export', action='append', default=[], metavar='FILE',
+        help='also write per-file and per-directory records to FILE while scanning; '
+        'format is chosen by extension: %s' % ', '.join('/'.join(exts) for exts in EXPORT_EXTENSIONS.values()))
+    p.set_defaults(func=cmd_scan)
+
+    p = subparsers.add_parser('bench-io', parents=[common],
+        help='compare file parsing speed in directory, inode and physical order (cold page cache)')
+    p.add_argument('directory', help='directory to scan')
+    p.add_argument('--passes', type=int, default=1,
+        help='number of passes for each order (the best time is shown)')
+    p.set_defaults(func=cmd_bench_io, no_cache=True, full_rescan=True, io_order=None, export=[])
+
+    args = parser.parse_args(argv)
+
+    # пути с байтами, не укладывающимися в кодировку (os.scandir()
+    # отдаёт их суррогатами), в простом тексте выводятся как есть,
+    # а не роняют вывод; в NDJSON они экранируются (см.
+    # asexport.NDJSONExporter), и stdout остаётся строгим - вывод
+    # --json должен быть правильным UTF-8
+    for f in (sys.stderr,) if getattr(args, 'json', False) else (sys.stdout, sys.stderr):
+        if hasattr(f, 'reconfigure'):
+            f.reconfigure(errors='surrogateescape')
+
+    cfg = Config()
+
+    try:
+        if not args.no_config:
+            cfg.load()
+
+        if args.workers is not None:
+            cfg.workers = args.workers
+
+        if args.no_cache:
+            cfg.useMetadataCache = False
+
+        if args.full_rescan:
+            cfg.skipUnchangedDirs = False
+
+        if args.symlinks is not None:
+            cfg.symlinks = SYMLINKS_POLICIES.index(args.symlinks)
+
+        if args.full_parse:
+            cfg.headerOnlyProbe = False
+
+        if args.io_order is not None:
+            cfg.ioOrder = IO_ORDERS.index(args.io_order)
+
+        if args.io_window is not None:
+            cfg.ioWindow = max(0, args.io_window)
+
+        if args.prefetch is not None:
+            cfg.prefetch = max(0, args.prefetch)
+
+        if args.polite:
+            cfg.politeScan = True
+
+        if args.idle_io:
+            cfg.idleIOPriority = True
+
+        if args.max_read_rate is not None:
+            cfg.readRateLimit = max(0, args.max_read_rate)
+
+        for fpath in args.export:
+            if get_export_format(fpath) is None:
+                raise ValueError('unknown export file format "%s"' % fpath)
+
+        for fpar in args.filter:
+            pname, sep, v = fpar.partition('=')
+
+            if not sep or pname not in AudioFileFilter.PARAMETERS:
+                raise ValueError('invalid filter parameter "%s"' % fpar)
+
+            cfg.filter.set_parameter_str(pname, v)
+    except ValueError as ex:
+        parser.error(str(ex))
+
+    return args.func(cfg, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
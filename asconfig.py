@@ -28,6 +28,8 @@ from configparser import ConfigParser
 
 from audiostat import *
 from ascommon import *
+from aswalker import SYMLINKS_FOLLOW, SYMLINKS_POLICIES
+from asiosched import IO_ORDER_NONE, IO_ORDERS
 
 
 class Config(Representable):
@@ -37,11 +39,97 @@ class Config(Representable):
         lastDirectory:
             строка, путь к последнему просканированному каталогу;
 
+        useMetadataCache:
+            булевское, True - использовать дисковый кэш метаданных
+            аудиофайлов (см. модуль ascache);
+        pathCache:
+            строка, путь к файлу кэша метаданных;
+
+        workers:
+            целое, кол-во процессов для извлечения метаданных;
+            0 - по кол-ву процессоров, 1 - без дочерних процессов;
+
+        headerOnlyProbe:
+            булевское, True - если фильтру не нужны тэги, параметры
+            потока FLAC, WAV, AIFF, WavPack и APE извлекаются
+            из заголовков файлов, без разбора mutagen'ом (см. модуль
+            asprobe); столбец "Mis. tags" при этом не заполняется;
+
+        watchChanges:
+            булевское, True - после обхода отслеживать изменения
+            в каталоге и обновлять статистику (см. модуль aswatch);
+
+        skipUnchangedDirs:
+            булевское, True - не читать заново каталоги, которые
+            не менялись с прошлого обхода (нужен кэш метаданных;
+            см. asscanner.Scanner);
+
+        symlinks:
+            целое, aswalker.SYMLINKS_*, переход по символьным ссылкам
+            при обходе; в файле настроек - одно из названий
+            aswalker.SYMLINKS_POLICIES;
+
+        ioOrder:
+            целое, asiosched.IO_ORDER_*, порядок разбора файлов
+            (см. asengine.ExtractionEngine); в файле настроек - одно
+            из названий asiosched.IO_ORDERS;
+
+        ioWindow:
+            целое, кол-во файлов, упорядочиваемых вместе
+            (см. asengine.ExtractionEngine.ioWindow);
+
+        prefetch:
+            целое, на сколько файлов вперёд запрашивать упреждающее
+            чтение при разборе (см. asiosched.Prefetcher); 0 - не запрашивать;
+
+        politeScan:
+            булевское, True - "вежливый" разбор файлов: без упреждающего
+            чтения, с удалением прочитанного из страничного кэша
+            (см. asengine.ExtractionEngine.polite);
+
+        idleIOPriority:
+            булевское, True - разбирать файлы с приоритетом
+            ввода-вывода "idle";
+
+        readRateLimit:
+            целое, ограничение скорости чтения при разборе файлов
+            в КиБ/с; 0 - без ограничения;
+
+        roots:
+            список кортежей вида (путь к каталогу, кол-во процессов) -
+            каталоги для совместного обхода (см. asscanner.MultiScanner);
+            каталоги на одном устройстве обходятся по очереди,
+            на разных - одновременно; кол-во процессов - для устройства,
+            на котором лежит каталог (из нескольких значений для одного
+            устройства берётся наибольшее), 0 - как в поле workers;
+
         filterParams:
             экземпляр класса FilterParams."""
 
     __S_SETTINGS = 'settings'
     __V_LASTDIR = 'lastDirectory'
+    __V_USECACHE = 'useMetadataCache'
+    __V_WORKERS = 'workers'
+    __V_HEADERONLY = 'headerOnlyProbe'
+    __V_WATCH = 'watchChanges'
+    __V_SKIPUNCHANGED = 'skipUnchangedDirs'
+    __V_SYMLINKS = 'followSymlinks'
+    __V_IOORDER = 'ioOrder'
+    __V_IOWINDOW = 'ioBatchWindow'
+    __V_PREFETCH = 'prefetchWindow'
+    __V_POLITE = 'politeScan'
+    __V_IDLEIO = 'idleIOPriority'
+    __V_READRATE = 'readRateLimit'
+
+    WORKERS_MAX = 256
+
+    IO_WINDOW_MAX = 1000000
+    PREFETCH_MAX = 1024
+    READ_RATE_MAX = 16777216
+
+    __S_ROOTS = 'roots'
+    __V_ROOT = 'root%d'
+    __V_ROOTWORKERS = 'workers%d'
 
     __S_FILTERS = 'filters'
 
@@ -51,6 +139,29 @@ class Config(Representable):
         #
         self.lastDirectory = os.path.expanduser('~')
 
+        self.useMetadataCache = True
+
+        self.workers = 0
+
+        self.headerOnlyProbe = True
+
+        self.watchChanges = False
+
+        self.skipUnchangedDirs = True
+
+        self.symlinks = SYMLINKS_FOLLOW
+
+        self.ioOrder = IO_ORDER_NONE
+        self.ioWindow = 256
+
+        self.prefetch = 16
+
+        self.politeScan = False
+        self.idleIOPriority = False
+        self.readRateLimit = 0
+
+        self.roots = []
+
         #
         # параметры фильтрации
         #
@@ -64,12 +175,16 @@ class Config(Representable):
         if sys.platform == 'linux':
             # ...а если дистрибутив не XDG-совместимый, то это не моя проблема
             self.pathConfig = os.path.expanduser('~/.config/audiostat.cfg')
+            self.pathCache = os.path.expanduser('~/.cache/audiostat/metadata.sqlite')
         elif sys.platform == 'win32':
             # для винды и так сойдёт
             self.pathConfig = os.path.join(os.environ['USERPROFILE'], 'audiostat.cfg')
+            self.pathCache = os.path.join(os.environ.get('LOCALAPPDATA', os.environ['USERPROFILE']),
+                'audiostat', 'metadata.sqlite')
         else:
             # тут предполагаем что-то *nix-образное, пусть даже и макось
             self.pathConfig = os.path.expanduser('~/.audiostat.cfg')
+            self.pathCache = os.path.expanduser('~/.audiostat-cache.sqlite')
 
     def load(self):
         if not os.path.exists(self.pathConfig):
@@ -87,6 +202,64 @@ class Config(Representable):
         self.lastDirectory = os.path.expanduser(cfg.get(self.__S_SETTINGS,
             self.__V_LASTDIR, fallback=self.lastDirectory))
 
+        self.useMetadataCache = cfg.getboolean(self.__S_SETTINGS,
+            self.__V_USECACHE, fallback=self.useMetadataCache)
+
+        self.workers = str_to_int(cfg.get(self.__S_SETTINGS,
+            self.__V_WORKERS, fallback=str(self.workers)), 0, self.WORKERS_MAX)
+
+        self.headerOnlyProbe = cfg.getboolean(self.__S_SETTINGS,
+            self.__V_HEADERONLY, fallback=self.headerOnlyProbe)
+
+        self.watchChanges = cfg.getboolean(self.__S_SETTINGS,
+            self.__V_WATCH, fallback=self.watchChanges)
+
+        self.skipUnchangedDirs = cfg.getboolean(self.__S_SETTINGS,
+            self.__V_SKIPUNCHANGED, fallback=self.skipUnchangedDirs)
+
+        s = cfg.get(self.__S_SETTINGS, self.__V_SYMLINKS, fallback='').strip().lower()
+        if s in SYMLINKS_POLICIES:
+            self.symlinks = SYMLINKS_POLICIES.index(s)
+
+        s = cfg.get(self.__S_SETTINGS, self.__V_IOORDER, fallback='').strip().lower()
+        if s in IO_ORDERS:
+            self.ioOrder = IO_ORDERS.index(s)
+
+        self.ioWindow = str_to_int(cfg.get(self.__S_SETTINGS,
+            self.__V_IOWINDOW, fallback=str(self.ioWindow)), 0, self.IO_WINDOW_MAX)
+
+        self.prefetch = str_to_int(cfg.get(self.__S_SETTINGS,
+            self.__V_PREFETCH, fallback=str(self.prefetch)), 0, self.PREFETCH_MAX)
+
+        self.politeScan = cfg.getboolean(self.__S_SETTINGS,
+            self.__V_POLITE, fallback=self.politeScan)
+
+        self.idleIOPriority = cfg.getboolean(self.__S_SETTINGS,
+            self.__V_IDLEIO, fallback=self.idleIOPriority)
+
+        self.readRateLimit = str_to_int(cfg.get(self.__S_SETTINGS,
+            self.__V_READRATE, fallback=str(self.readRateLimit)), 0, self.READ_RATE_MAX)
+
+        # каталоги для совместного обхода
+        self.roots = []
+
+        if cfg.has_section(self.__S_ROOTS):
+            n = 1
+
+            while True:
+                s = cfg.get(self.__S_ROOTS, self.__V_ROOT % n, fallback=None)
+                if s is None:
+                    break
+
+                nworkers = str_to_int(cfg.get(self.__S_ROOTS,
+                    self.__V_ROOTWORKERS % n, fallback='0'), 0, self.WORKERS_MAX)
+
+                s = s.strip()
+                if s:
+                    self.roots.append((os.path.expanduser(s), nworkers))
+
+                n += 1
+
         # фильтрация
         for pname in AudioFileFilter.PARAMETERS:
             s = cfg.get(self.__S_FILTERS, pname, fallback=None)
@@ -105,10 +278,29 @@ class Config(Representable):
 
         # основные
         cfg.set(self.__S_SETTINGS, self.__V_LASTDIR, self.lastDirectory)
+        cfg.set(self.__S_SETTINGS, self.__V_USECACHE, str(self.useMetadataCache))
+        cfg.set(self.__S_SETTINGS, self.__V_WORKERS, str(self.workers))
+        cfg.set(self.__S_SETTINGS, self.__V_HEADERONLY, str(self.headerOnlyProbe))
+        cfg.set(self.__S_SETTINGS, self.__V_WATCH, str(self.watchChanges))
+        cfg.set(self.__S_SETTINGS, self.__V_SKIPUNCHANGED, str(self.skipUnchangedDirs))
+        cfg.set(self.__S_SETTINGS, self.__V_SYMLINKS, SYMLINKS_POLICIES[self.symlinks])
+        cfg.set(self.__S_SETTINGS, self.__V_IOORDER, IO_ORDERS[self.ioOrder])
+        cfg.set(self.__S_SETTINGS, self.__V_IOWINDOW, str(self.ioWindow))
+        cfg.set(self.__S_SETTINGS, self.__V_PREFETCH, str(self.prefetch))
+        cfg.set(self.__S_SETTINGS, self.__V_POLITE, str(self.politeScan))
+        cfg.set(self.__S_SETTINGS, self.__V_IDLEIO, str(self.idleIOPriority))
+        cfg.set(self.__S_SETTINGS, self.__V_READRATE, str(self.readRateLimit))
 
         # фильтрация
         for pname in AudioFileFilter.PARAMETERS:
             cfg.set(self.__S_FILTERS, pname, self.filter.get_parameter_str(pname))
+
+        if self.roots:
+            cfg.add_section(self.__S_ROOTS)
+
+            for n, (rootdir, nworkers) in enumerate(self.roots, 1):
+                cfg.set(self.__S_ROOTS, self.__V_ROOT % n, rootdir)
+                cfg.set(self.__S_ROOTS, self.__V_ROOTWORKERS % n, str(nworkers))
         #
         with open(self.pathConfig, 'w+') as f:
             cfg.write(f)
@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" asengine.py
+
+    Copyright 2021 MC-6312
+
+    his file is part of AudioStat.
+
+    AudioStat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    AudioStat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with AudioStat.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+import os
+import multiprocessing
+from time import monotonic, thread_time
+
+from audiostat import *
+from asiosched import *
+from asprofile import *
+
+
+#
+# то, что исполняется в дочерних процессах
+#
+
+# экземпляр AudioFilterPlan, создаётся при запуске процесса
+_workerPlan = None
+# булевское; True - возвращать поля и для отфильтрованных файлов
+# (они нужны для пополнения кэша метаданных)
+_workerKeepRejected = False
+# целое, см. ExtractionEngine.prefetch
+_workerPrefetch = 0
+# экземпляр asiosched.ReadTracker
+_workerTracker = None
+
+
+def _new_tracker(polite, maxReadRate):
+    """Возвращает экземпляр asiosched.ReadTracker (см. ExtractionEngine.polite
+    и maxReadRate); прочитанные байты учитываются всегда."""
+
+    return ReadTracker(polite, RateLimiter(maxReadRate) if maxReadRate else None)
+
+
+def _worker_init(filterParams, keepRejected, headerOnly, prefetch,
+        polite, maxReadRate, idleIO):
+    """Инициализация дочернего процесса.
+
+    Параметры:
+        filterParams    - None (без фильтрации) или словарь, где
+                          ключи - имена параметров AudioFileFilter,
+                          а значения - строки
+                          (см. AudioFileFilter.get_parameter_str());
+        keepRejected    - булевское, см. _workerKeepRejected;
+        headerOnly      - булевское, см. AudioFilterPlan;
+        prefetch        - целое, см. _workerPrefetch;
+        polite,
+        maxReadRate,
+        idleIO          - см. поля ExtractionEngine; maxReadRate -
+                          ограничение для одного процесса."""
+
+    global _workerPlan, _workerKeepRejected, _workerPrefetch, _workerTracker
+
+    if filterParams is None:
+        ffilter = None
+    else:
+        ffilter = AudioFileFilter()
+
+        for pname, v in filterParams.items():
+            ffilter.set_parameter_str(pname, v)
+
+    _workerPlan = AudioFilterPlan(ffilter, headerOnly)
+    _workerKeepRejected = keepRejected
+    _workerPrefetch = prefetch
+    _workerTracker = _new_tracker(polite, maxReadRate)
+
+    if idleIO:
+        set_idle_io_priority()
+
+
+def _read_file_info(plan, fpath, tracker):
+    """Разбор файла fpath.
+
+    tracker - экземпляр asiosched.ReadTracker.
+
+    Возвращает кортеж из экземпляра AudioFileInfo и кортежа вида
+    (phase, seconds, wait, nbytes, error), где
+        phase   - asprofile.PH_PROBE, если параметры взяты из заголовка
+                  файла, иначе - asprofile.PH_PARSE;
+        seconds - время разбора (в секундах);
+        wait    - время ожидания ввода-вывода - время разбора
+                  за вычетом процессорного времени потока;
+        nbytes  - кол-во прочитанных байт;
+        error   - булевское, True, если файл разобрать не удалось."""
+
+    t0 = monotonic()
+    c0 = thread_time()
+
+    tracker.reset()
+
+    nfo = plan.read_file_info(fpath, tracker)
+
+    seconds = monotonic() - t0
+
+    return nfo, (PH_PARSE if nfo.tagsRead or nfo.error else PH_PROBE,
+        seconds, max(0.0, seconds - (thread_time() - c0)),
+        tracker.nBytes, bool(nfo.error))
+
+
+def _worker_extract(batch):
+    """Разбор пачки файлов.
+
+    Параметры:
+        batch   - список кортежей вида (индекс, путь к файлу).
+
+    Возвращает список кортежей вида (индекс, passed, fields, stats, ftime), где
+        passed  - булевское, True, если файл прошёл фильтрацию;
+        fields  - None или кортеж значений полей AudioFileInfo.FIELDS;
+        stats   - счётчики разбора файла (см. _read_file_info());
+        ftime   - время фильтрации (в секундах)."""
+
+    r = []
+
+    with _new_prefetcher([fpath for _, fpath in batch], _workerPrefetch) as prefetcher:
+        for ix, fpath in batch:
+            nfo, stats = _read_file_info(_workerPlan, fpath, _workerTracker)
+            prefetcher.done()
+
+            t0 = monotonic()
+            passed = _workerPlan.filter_file_info(nfo)
+            ftime = monotonic() - t0
+
+            r.append((ix, passed,
+                nfo.get_fields() if (passed or _workerKeepRejected) else None,
+                stats, ftime))
+
+    return r
+
+
+class _NoPrefetcher():
+    """Заменитель asiosched.Prefetcher, когда упреждающее чтение
+    не нужно."""
+
+    def done(self, n=1):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        pass
+
+
+def _new_prefetcher(fpaths, window):
+    if window > 0 and len(fpaths) > 1:
+        return Prefetcher(fpaths, window)
+
+    return _NoPrefetcher()
+
+
+class ExtractionEngine():
+    """Извлечение метаданных из аудиофайлов пулом дочерних процессов.
+
+    Дочерние процессы запускаются один раз (при вызове start())
+    и сразу получают параметры фильтрации; mutagen в них уже загружен.
+    Пути к файлам отправляются процессам пачками, результаты
+    возвращаются в виде кортежей значений полей AudioFileInfo.FIELDS.
+
+    Если nWorkers == 1, всё делается в текущем процессе
+    (результаты полностью совпадают с результатами работы пула).
+
+    Поля:
+        filter      - экземпляр AudioFileFilter или None (см. AudioFilterPlan);
+        plan        - экземпляр AudioFilterPlan, полученный из filter
+                      при создании экземпляра ExtractionEngine;
+                      изменения filter после этого не учитываются;
+        cache       - None или экземпляр ascache.MetadataCache;
+                      кэш используется только в текущем процессе;
+        nWorkers    - целое, кол-во дочерних процессов;
+        headerOnly  - булевское, см. AudioFilterPlan;
+        ioOrder     - asiosched.IO_ORDER_*, порядок разбора файлов:
+                      файлы, переданные get_audio_files_info() за раз
+                      (кроме найденных в кэше), разбираются в порядке
+                      расположения на диске;
+        ioWindow    - целое, сколько файлов (из нескольких каталогов)
+                      asscanner.Scanner накапливает, прежде чем отдать
+                      их get_audio_files_info(), если ioOrder
+                      не IO_ORDER_NONE; 0 - файлы каждого каталога
+                      отдаются отдельно;
+        prefetch    - целое, на сколько файлов вперёд запрашивать
+                      упреждающее чтение (см. asiosched.Prefetcher);
+                      0 - не запрашивать; при polite == True
+                      всегда 0 - упреждающее чтение "вежливости"
+                      противоречит;
+        polite      - булевское, True - "вежливый" разбор: файлы читаются
+                      без упреждающего чтения ОС, прочитанное после
+                      разбора удаляется из страничного кэша
+                      (см. asiosched.ReadTracker);
+        maxReadRate - целое, ограничение скорости чтения при разборе
+                      (байт в секунду, на все процессы вместе);
+                      0 - без ограничения;
+        idleIO      - булевское, True - разбирающие файлы процессы
+                      и поток, из которого вызван start(), получают
+                      приоритет ввода-вывода "idle";
+        nParsed     - целое, кол-во разобранных файлов (без найденных
+                      в кэше);
+        waitTime    - вещественное, суммарное время ожидания
+                      ввода-вывода при разборе файлов (в секундах);
+                      время разбора файла за вычетом процессорного
+                      времени - это в основном ожидание чтения с диска
+                      или из сети;
+        bytesRead   - целое, кол-во байт, прочитанных при разборе файлов;
+        profile     - экземпляр asprofile.ScanProfile: время разбора
+                      (из заголовков и полного), фильтрации и работы
+                      с кэшем, счётчики по типам файлов, самые
+                      медленные файлы; Scanner, использующий engine,
+                      добавляет туда свои замеры.
+
+    При упорядоченном разборе дочерние процессы всё равно читают
+    файлы одновременно, так что для жёсткого диска лучше уменьшить
+    их кол-во (вплоть до nWorkers == 1)."""
+
+    # максимальное кол-во файлов в одной пачке
+    BATCH_SIZE = 32
+
+    def __init__(self, ffilter, nworkers=0, cache=None, headerOnly=False,
+            ioOrder=IO_ORDER_NONE, ioWindow=0, prefetch=0,
+            polite=False, maxReadRate=0, idleIO=False):
+        """Параметры:
+            ffilter     - экземпляр AudioFileFilter или None;
+            nworkers    - целое, кол-во дочерних процессов;
+                          0 - по кол-ву процессоров;
+            cache       - None или экземпляр ascache.MetadataCache;
+            headerOnly, ioOrder,
+            ioWindow, prefetch,
+            polite, maxReadRate,
+            idleIO      - см. соответствующие поля."""
+
+        self.filter = ffilter
+        self.cache = cache
+        self.nWorkers = nworkers if nworkers > 0 else (os.cpu_count() or 1)
+        self.headerOnly = headerOnly
+        self.ioOrder = ioOrder
+        self.ioWindow = ioWindow
+        self.polite = polite
+        self.prefetch = 0 if polite else prefetch
+        self.maxReadRate = maxReadRate
+        self.idleIO = idleIO
+
+        self.nParsed = 0
+        self.waitTime = 0.0
+        self.bytesRead = 0
+        self.profile = ScanProfile()
+
+        # для разбора в текущем процессе
+        self.__tracker = _new_tracker(polite, maxReadRate)
+        self.plan = AudioFilterPlan(ffilter, headerOnly)
+
+        self.__pool = None
+
+    def start(self):
+        if self.idleIO:
+            set_idle_io_priority()
+
+        if self.nWorkers < 2 or self.__pool is not None:
+            return
+
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            # fork из процесса с GTK - так себе идея,
+            # а forkserver сам по себе не тащит ничего лишнего,
+            # и mutagen загружается в нём один раз
+            ctx = multiprocessing.get_context('forkserver')
+            ctx.set_forkserver_preload(['audiostat'])
+        else:
+            ctx = multiprocessing.get_context('spawn')
+
+        if self.filter is None:
+            filterParams = None
+        else:
+            filterParams = {pname:self.filter.get_parameter_str(pname) for pname in AudioFileFilter.PARAMETERS}
+
+        self.__pool = ctx.Pool(self.nWorkers,
+            initializer=_worker_init,
+            initargs=(filterParams, self.cache is not None, self.headerOnly, self.prefetch,
+                self.polite, self.maxReadRate // self.nWorkers, self.idleIO))
+
+    def close(self):
+        if self.__pool is not None:
+            self.__pool.terminate()
+            self.__pool.join()
+            self.__pool = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def __get_batches(self, todo):
+        """Разбиение списка todo на пачки примерно одинакового размера
+        так, чтобы работа досталась по возможности всем процессам."""
+
+        nbatch = min(self.BATCH_SIZE, max(1, len(todo) // self.nWorkers))
+
+        return [todo[i:i + nbatch] for i in range(0, len(todo), nbatch)]
+
+    def __lookup_cache(self, entry, st):
+        """Возвращает экземпляр AudioFileInfo или None,
+        если в кэше ничего подходящего нет."""
+
+        t0 = monotonic()
+
+        nfo = self.cache.lookup(entry.path, st)
+
+        if nfo is not None and not self.plan.is_complete(nfo):
+            nfo = None
+
+        self.cache.count_lookup(nfo is not None)
+
+        self.profile.add_since(PH_CACHE, t0)
+
+        return nfo
+
+    def __account(self, fpath, stats):
+        """Учёт разбора файла fpath; stats - см. _read_file_info()."""
+
+        phase, seconds, wait, nbytes, error = stats
+
+        self.nParsed += 1
+        self.waitTime += wait
+        self.bytesRead += nbytes
+
+        self.profile.add_file(fpath, phase, seconds, nbytes, error)
+
+    def __filter(self, nfo):
+        """Фильтрация с учётом затраченного времени."""
+
+        t0 = monotonic()
+        passed = self.plan.filter_file_info(nfo)
+        self.profile.add_since(PH_FILTER, t0)
+
+        return passed
+
+    def get_audio_files_info(self, entries):
+        """Генератор, извлекающий метаданные из файлов.
+
+        Параметры:
+            entries - последовательность экземпляров os.DirEntry
+                      (напр. полученных от aswalker.walk_directory()).
+
+        Для каждого файла возвращает кортеж вида (fpath, nfo), где
+        nfo - экземпляр AudioFileInfo, если файл - поддерживаемого
+        типа и прошёл фильтрацию, иначе - None.
+        Порядок файлов в результатах может не совпадать с порядком
+        в entries."""
+
+        # кортежи вида (путь к файлу, os.stat_result или None)
+        todo = []
+        # номера inode файлов из todo (при упорядоченном разборе)
+        inodes = None if self.ioOrder == IO_ORDER_NONE else []
+
+        for entry in entries:
+            fpath = entry.path
+
+            if not self.plan.check_file(fpath):
+                yield fpath, None
+                continue
+
+            st = None
+
+            if self.cache is not None:
+                try:
+                    # DirEntry.stat() закэширован и не дёргает ФС лишний раз
+                    st = entry.stat()
+                except OSError:
+                    pass
+                else:
+                    # раз уж stat есть - заодно проверяем размер
+                    if not self.plan.check_file(fpath, st):
+                        yield fpath, None
+                        continue
+
+                    nfo = self.__lookup_cache(entry, st)
+
+                    if nfo is not None:
+                        yield fpath, nfo if self.__filter(nfo) else None
+                        continue
+
+            todo.append((fpath, st))
+
+            if inodes is not None:
+                # у os.DirEntry номер inode есть и без stat()
+                inodes.append(entry.inode() if st is None else st.st_ino)
+
+        if not todo:
+            return
+
+        if inodes is not None and len(todo) > 1:
+            keys = get_order_keys(self.ioOrder, [(fpath, ino) for (fpath, _), ino in zip(todo, inodes)])
+            todo = [todo[ix] for ix in sorted(range(len(todo)), key=keys.__getitem__)]
+
+        def __store(ix, nfo):
+            fpath, st = todo[ix]
+
+            if st is not None:
+                t0 = monotonic()
+                self.cache.store(fpath, st, nfo)
+                self.profile.add_since(PH_CACHE, t0)
+
+        if self.__pool is None:
+            # упреждающее чтение - своё у каждого дочернего процесса
+            # (см. _worker_extract()), а тут - в текущем
+            with _new_prefetcher([fpath for fpath, _ in todo], self.prefetch) as prefetcher:
+                for ix, (fpath, _) in enumerate(todo):
+                    nfo, stats = _read_file_info(self.plan, fpath, self.__tracker)
+                    prefetcher.done()
+
+                    self.__account(fpath, stats)
+
+                    if self.cache is not None:
+                        __store(ix, nfo)
+
+                    yield fpath, nfo if self.__filter(nfo) else None
+        else:
+            batches = self.__get_batches([(ix, fpath) for ix, (fpath, _) in enumerate(todo)])
+
+            for results in self.__pool.imap_unordered(_worker_extract, batches):
+                for ix, passed, fields, stats, ftime in results:
+                    nfo = None if fields is None else AudioFileInfo.new_from_fields(fields)
+
+                    self.__account(todo[ix][0], stats)
+                    self.profile.add_time(PH_FILTER, ftime)
+
+                    if self.cache is not None:
+                        __store(ix, nfo)
+
+                    yield todo[ix][0], nfo if passed else None
+
+
+if __name__ == '__main__':
+    print('[debugging %s]' % __file__)
+
+    import asconfig
+    from aswalker import *
+
+    cfg = asconfig.Config()
+    cfg.load()
+
+    entries = [entry for evtype, _, entry in walk_directory(cfg.lastDirectory) if evtype == WALK_FILE]
+
+    with ExtractionEngine(cfg.filter, cfg.workers, headerOnly=cfg.headerOnlyProbe,
+            ioOrder=cfg.ioOrder) as engine:
+        for fpath, nfo in engine.get_audio_files_info(entries):
+            if nfo:
+                print(fpath, nfo)
@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" asexport.py
+
+    Copyright 2021 MC-6312
+
+    his file is part of AudioStat.
+
+    AudioStat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    AudioStat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with AudioStat.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+# ВНИМАНИЕ! модуль не должен ни прямо, ни косвенно импортировать gi:
+# он используется и из ascli
+
+
+import os
+import os.path
+import csv
+import json
+import sqlite3
+
+from audiostat import *
+from asscanner import *
+
+
+# поля AudioStreamInfo в выгружаемых записях
+STREAM_INFO_FIELDS = ('lossy', 'resolution', 'sampleRate', 'channels',
+    'bitsPerSample', 'bitRate', 'missingTags')
+
+# поля AudioFileInfo, не входящие в STREAM_INFO_FIELDS
+FILE_INFO_FIELDS = ('mime', 'error', 'tagsRead')
+
+# столбцы для минимальных и максимальных значений параметров каталогов
+DIR_MIN_FIELDS = tuple('min' + name[0].upper() + name[1:] for name in STREAM_INFO_FIELDS)
+DIR_MAX_FIELDS = tuple('max' + name[0].upper() + name[1:] for name in STREAM_INFO_FIELDS)
+
+
+def stream_info_dict(nfo):
+    """Возвращает словарь со значениями полей экземпляра
+    AudioStreamInfo."""
+
+    return {name:getattr(nfo, name) for name in STREAM_INFO_FIELDS}
+
+
+def file_info_dict(nfo):
+    """Возвращает словарь со значениями полей экземпляра
+    AudioFileInfo."""
+
+    d = stream_info_dict(nfo)
+
+    for name in FILE_INFO_FIELDS:
+        d[name] = getattr(nfo, name)
+
+    return d
+
+
+def escape_path(path):
+    """Возвращает строку path (или None, если path - None), в которой
+    байты имени, не укладывающиеся в UTF-8 (os.scandir() отдаёт их
+    суррогатами, см. os.fsdecode()), заменены на "\\xNN"
+    (для форматов, где нужен правильный текст)."""
+
+    if path is None:
+        return
+
+    return os.fsencode(path).decode('utf-8', 'backslashreplace')
+
+
+def sqlite_path(path):
+    """Возвращает path (или None, если path - None) в виде значения
+    для SQLite: саму строку, если она укладывается в UTF-8, иначе -
+    байты имени (os.fsencode()), которые SQLite хранит как BLOB.
+    В отличие от escape_path() преобразование обратимо, и разные
+    пути не дают одинаковых значений."""
+
+    if path is None:
+        return
+
+    try:
+        path.encode('utf-8')
+    except UnicodeEncodeError:
+        return os.fsencode(path)
+
+    return path
+
+
+def dir_info_values(dirinfo):
+    """Возвращает кортеж значений полей DIR_MIN_FIELDS + DIR_MAX_FIELDS
+    экземпляра AudioDirectoryInfo."""
+
+    return tuple(getattr(dirinfo.minInfo, name) for name in STREAM_INFO_FIELDS)\
+        + tuple(getattr(dirinfo.maxInfo, name) for name in STREAM_INFO_FIELDS)
+
+
+class ResultsExporter():
+    """Базовый класс выгрузки результатов обхода в файл.
+
+    Записи выводятся по одной, по мере поступления, ничего
+    не накапливая (кроме небольших буферов), так что расход памяти
+    не зависит от кол-ва файлов.
+
+    Экземпляр может использоваться как менеджер контекста
+    (по выходе вызывается close()).
+
+    Поля:
+        fpath   - строка, путь к файлу (или None, если вывод -
+                  в уже открытый файловый объект)."""
+
+    def __init__(self, fpath):
+        self.fpath = fpath
+
+    def write_file(self, path, nfo):
+        """Запись о файле.
+
+        path    - строка, полный путь к файлу;
+        nfo     - экземпляр AudioFileInfo."""
+
+        raise NotImplementedError
+
+    def write_duplicate(self, path, isDir, origPath):
+        """Запись о повторно встреченном файле или каталоге
+        (параметры - как у события Scanner.EV_DUPLICATE)."""
+
+        raise NotImplementedError
+
+    def write_dir(self, path, dirinfo):
+        """Запись о каталоге.
+
+        path    - строка, полный путь к каталогу;
+        dirinfo - экземпляр AudioDirectoryInfo (сводные параметры
+                  каталога вместе с подкаталогами)."""
+
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class NDJSONExporter(ResultsExporter):
+    """Выгрузка в формате NDJSON: по объекту JSON на строку,
+    тип записи - в поле "type" ("file", "duplicate" или "directory");
+    записи - такие же, как у "audiostat scan --json"."""
+
+    def __init__(self, fpath, outf=None):
+        """fpath    - путь к файлу;
+        outf        - None или уже открытый файловый объект
+                      (тогда fpath не используется и файл
+                      не закрывается)."""
+
+        super().__init__(fpath)
+
+        self.__ownFile = outf is None
+        self.outf = open(fpath, 'w', encoding='utf-8') if outf is None else outf
+
+    def write_record(self, rectype, **fields):
+        rec = {'type':rectype}
+        rec.update(fields)
+
+        # байты имён файлов, не укладывающиеся в UTF-8 (суррогаты,
+        # см. escape_path()), выводятся в виде "\udcNN" - это правильный
+        # JSON, а json.loads() и os.fsencode() вернут исходные байты
+        print(json.dumps(rec, ensure_ascii=False).encode('utf-8', 'backslashreplace').decode('utf-8'),
+            file=self.outf)
+
+    def write_file(self, path, nfo):
+        self.write_record('file', path=path, **file_info_dict(nfo))
+
+    def write_duplicate(self, path, isDir, origPath):
+        self.write_record('duplicate', path=path, directory=isDir, original=origPath)
+
+    def write_dir(self, path, dirinfo):
+        self.write_record('directory',
+            path=path,
+            files=dirinfo.nFiles,
+            errors=dirinfo.nErrors,
+            min=stream_info_dict(dirinfo.minInfo),
+            max=stream_info_dict(dirinfo.maxInfo))
+
+    def close(self):
+        if self.__ownFile:
+            self.outf.close()
+        else:
+            self.outf.flush()
+
+
+class CSVExporter(ResultsExporter):
+    """Выгрузка в CSV (одна таблица с заголовком).
+
+    Тип записи - в столбце "type" ("file", "duplicate" или "directory");
+    у файлов заполнены столбцы STREAM_INFO_FIELDS и FILE_INFO_FIELDS,
+    у каталогов - files, errors, DIR_MIN_FIELDS и DIR_MAX_FIELDS,
+    у повторов - directory и original. Булевские значения выводятся
+    как 0 и 1, отсутствующие - пустыми строками; текстовые значения -
+    через escape_path() (файл - в правильном UTF-8)."""
+
+    COLUMNS = ('type', 'path') + STREAM_INFO_FIELDS + FILE_INFO_FIELDS\
+        + ('files', 'errors') + DIR_MIN_FIELDS + DIR_MAX_FIELDS\
+        + ('directory', 'original')
+
+    # пустые значения для столбцов, не относящихся к записи
+    __NO_FILE_INFO = ('',) * (len(STREAM_INFO_FIELDS) + len(FILE_INFO_FIELDS))
+    __NO_DIR_INFO = ('',) * (2 + len(DIR_MIN_FIELDS) + len(DIR_MAX_FIELDS))
+    __NO_DUPLICATE_INFO = ('', '')
+
+    @staticmethod
+    def __value(v):
+        if v is None:
+            return ''
+
+        return int(v) if isinstance(v, bool) else v
+
+    def __init__(self, fpath):
+        super().__init__(fpath)
+
+        self.__outf = open(fpath, 'w', encoding='utf-8', newline='')
+        self.__writer = csv.writer(self.__outf)
+        self.__writer.writerow(self.COLUMNS)
+
+    def write_file(self, path, nfo):
+        self.__writer.writerow(('file', escape_path(path))
+            + tuple(self.__value(getattr(nfo, name)) for name in STREAM_INFO_FIELDS)
+            + (escape_path(nfo.mime), self.__value(escape_path(nfo.error)), int(nfo.tagsRead))
+            + self.__NO_DIR_INFO + self.__NO_DUPLICATE_INFO)
+
+    def write_duplicate(self, path, isDir, origPath):
+        self.__writer.writerow(('duplicate', escape_path(path))
+            + self.__NO_FILE_INFO + self.__NO_DIR_INFO
+            + (int(isDir), self.__value(escape_path(origPath))))
+
+    def write_dir(self, path, dirinfo):
+        self.__writer.writerow(('directory', escape_path(path)) + self.__NO_FILE_INFO
+            + (dirinfo.nFiles, dirinfo.nErrors)
+            + tuple(map(self.__value, dir_info_values(dirinfo)))
+            + self.__NO_DUPLICATE_INFO)
+
+    def close(self):
+        self.__outf.close()
+
+
+class SQLiteExporter(ResultsExporter):
+    """Выгрузка в БД SQLite: таблицы files, directories и duplicates;
+    по числовым столбцам files и directories создаются индексы.
+
+    Существующий файл БД перезаписывается. Записи вставляются
+    пачками по INSERT_BATCH в одной транзакции, индексы создаются
+    после вставки всех записей (в close()).
+
+    Текст SQLite должен быть правильным UTF-8, поэтому пути
+    записываются через sqlite_path() (имена с байтами, не укладывающимися
+    в UTF-8, - как BLOB), а mimetype и сообщения об ошибках (в которых
+    тоже бывают пути) - через escape_path()."""
+
+    INSERT_BATCH = 1024
+
+    FILES_COLUMNS = ('path',) + STREAM_INFO_FIELDS + FILE_INFO_FIELDS
+    DIRS_COLUMNS = ('path', 'files', 'errors') + DIR_MIN_FIELDS + DIR_MAX_FIELDS
+    DUPLICATES_COLUMNS = ('path', 'directory', 'original')
+
+    # столбцы с индексами
+    __FILES_INDEXED = ('resolution', 'sampleRate', 'channels',
+        'bitsPerSample', 'bitRate', 'missingTags')
+    __DIRS_INDEXED = ('files', 'errors') + tuple(name for name in DIR_MIN_FIELDS + DIR_MAX_FIELDS
+        if name[3:] in ('Resolution', 'SampleRate', 'Channels', 'BitsPerSample', 'BitRate'))
+
+    __TEXT_COLUMNS = {'path', 'mime', 'error', 'original'}
+
+    def __init__(self, fpath):
+        super().__init__(fpath)
+
+        if os.path.exists(fpath):
+            os.remove(fpath)
+
+        self.__db = sqlite3.connect(fpath)
+        # БД создаётся заново, так что при сбое её не жалко
+        self.__db.execute('PRAGMA journal_mode=OFF;')
+        self.__db.execute('PRAGMA synchronous=OFF;')
+
+        # ключи - имена таблиц, значения - списки ещё не вставленных строк
+        self.__pending = dict()
+        self.__inserts = dict()
+
+        for table, columns in (('files', self.FILES_COLUMNS),
+                ('directories', self.DIRS_COLUMNS),
+                ('duplicates', self.DUPLICATES_COLUMNS)):
+            self.__db.execute('CREATE TABLE %s(%s);' % (table,
+                ', '.join('%s %s' % (name, 'TEXT' if name in self.__TEXT_COLUMNS else 'INTEGER')
+                    for name in columns)))
+
+            self.__pending[table] = []
+            self.__inserts[table] = 'INSERT INTO %s VALUES (%s);' % (table,
+                ', '.join('?' * len(columns)))
+
+    def __insert(self, table, row):
+        rows = self.__pending[table]
+        rows.append(row)
+
+        if len(rows) >= self.INSERT_BATCH:
+            self.__db.executemany(self.__inserts[table], rows)
+            rows.clear()
+
+    def write_file(self, path, nfo):
+        self.__insert('files', (sqlite_path(path),)
+            + tuple(getattr(nfo, name) for name in STREAM_INFO_FIELDS)
+            + (escape_path(nfo.mime), escape_path(nfo.error), nfo.tagsRead))
+
+    def write_duplicate(self, path, isDir, origPath):
+        self.__insert('duplicates', (sqlite_path(path), isDir, sqlite_path(origPath)))
+
+    def write_dir(self, path, dirinfo):
+        self.__insert('directories', (sqlite_path(path), dirinfo.nFiles, dirinfo.nErrors)
+            + dir_info_values(dirinfo))
+
+    def close(self):
+        if self.__db is None:
+            return
+
+        try:
+            for table, rows in self.__pending.items():
+                if rows:
+                    self.__db.executemany(self.__inserts[table], rows)
+                    rows.clear()
+
+            self.__db.execute('CREATE UNIQUE INDEX files_path ON files(path);')
+            self.__db.execute('CREATE UNIQUE INDEX directories_path ON directories(path);')
+
+            for table, columns in (('files', self.__FILES_INDEXED),
+                    ('directories', self.__DIRS_INDEXED)):
+                for name in columns:
+                    self.__db.execute('CREATE INDEX %s_%s ON %s(%s);' % (table, name, table, name))
+
+            self.__db.commit()
+        finally:
+            self.__db.close()
+            self.__db = None
+
+
+# форматы выгрузки: названия, классы и расширения имён файлов
+EXPORT_FORMATS = ('csv', 'ndjson', 'sqlite')
+
+EXPORTERS = {'csv':CSVExporter,
+    'ndjson':NDJSONExporter,
+    'sqlite':SQLiteExporter}
+
+EXPORT_EXTENSIONS = {'csv':('.csv',),
+    'ndjson':('.ndjson', '.jsonl', '.json'),
+    'sqlite':('.sqlite', '.sqlite3', '.db')}
+
+
+def get_export_format(fpath):
+    """Возвращает название формата выгрузки (одно из EXPORT_FORMATS)
+    по расширению имени файла fpath или None, если расширение
+    незнакомое."""
+
+    ext = os.path.splitext(fpath)[1].lower()
+
+    for fmt, exts in EXPORT_EXTENSIONS.items():
+        if ext in exts:
+            return fmt
+
+
+def new_exporter(fpath, fmt=None):
+    """Создаёт экземпляр ResultsExporter для выгрузки в файл fpath.
+
+    fmt - None или одно из EXPORT_FORMATS; если None - формат
+    определяется по расширению имени файла.
+
+    При незнакомом формате генерирует исключение ValueError."""
+
+    if fmt is None:
+        fmt = get_export_format(fpath)
+
+    if fmt not in EXPORTERS:
+        raise ValueError('unknown export format for file "%s"' % fpath)
+
+    return EXPORTERS[fmt](fpath)
+
+
+class ExportSink():
+    """Передача событий Scanner (или ScanResults.replay()) экземплярам
+    ResultsExporter. Экземпляр передаётся Scanner'у в качестве sink.
+
+    Записи о каталогах выводятся по завершении обхода каталога,
+    только для каталогов, в которых (с подкаталогами) есть аудиофайлы;
+    у "виртуального" корня MultiScanner'а пути нет, и записи о нём
+    не выводятся.
+
+    Поля:
+        exporters   - список экземпляров ResultsExporter;
+        dirPaths    - словарь, где ключи - Scanner.dirId, значения -
+                      полные пути к ещё не законченным каталогам."""
+
+    def __init__(self, exporters=()):
+        self.exporters = list(exporters)
+
+        self.dirPaths = dict()
+
+    def __call__(self, events):
+        for event in events:
+            evtype = event[0]
+
+            if evtype == Scanner.EV_DIR_ENTER:
+                _, dirId, _, _, fdir = event
+                self.dirPaths[dirId] = fdir
+
+            elif evtype == Scanner.EV_FILE:
+                _, dirId, fname, nfo = event
+
+                if self.exporters:
+                    fpath = os.path.join(self.dirPaths[dirId], fname)
+
+                    for exporter in self.exporters:
+                        exporter.write_file(fpath, nfo)
+
+            elif evtype == Scanner.EV_DUPLICATE:
+                _, dirId, name, isDir, origPath = event
+
+                if self.exporters:
+                    fpath = os.path.join(self.dirPaths[dirId], name)
+
+                    for exporter in self.exporters:
+                        exporter.write_duplicate(fpath, isDir, origPath)
+
+            elif evtype == Scanner.EV_DIR_DONE:
+                _, dirId, dirinfo = event
+
+                fdir = self.dirPaths.pop(dirId)
+
+                if dirinfo.nFiles and fdir:
+                    for exporter in self.exporters:
+                        exporter.write_dir(fdir, dirinfo)
+
+    def close(self):
+        """Закрытие всех экспортёров (даже если при закрытии какого-то
+        из них произошла ошибка; первая ошибка генерируется повторно)."""
+
+        error = None
+
+        for exporter in self.exporters:
+            try:
+                exporter.close()
+            except Exception as ex:
+                if error is None:
+                    error = ex
+
+        if error is not None:
+            raise error
+
+
+if __name__ == '__main__':
+    print('[debugging %s]' % __file__)
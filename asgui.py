@@ -0,0 +1,1162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" asgui.py
+
+    Copyright 2021 MC-6312
+
+    his file is part of AudioStat.
+
+    AudioStat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    AudioStat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with AudioStat.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+import sys
+import threading
+import sqlite3
+from time import monotonic
+from traceback import print_exception
+
+from gtktools import *
+from gi.repository import Gtk, GLib
+from gi.repository.GLib import markup_escape_text
+
+
+import mutagen
+
+from warnings import warn
+
+from collections import OrderedDict
+
+from ascommon import *
+from audiostat import *
+from asconfig import *
+from ascache import *
+from asengine import *
+from asscanner import *
+from asprofile import *
+from asresults import *
+from asstatsmodel import *
+from aswatch import *
+from asexport import *
+
+
+class _CachePruning():
+    """Прерывание фоновой проверки кэша метаданных
+    (см. MainWnd.mnuMainPruneCache_activate()) - так же,
+    как обхода: методом stop()."""
+
+    def __init__(self):
+        self.__stopEvent = threading.Event()
+
+    def stop(self):
+        self.__stopEvent.set()
+
+    def is_stopped(self):
+        return self.__stopEvent.is_set()
+
+
+class MainWnd():
+    PAGE_START, PAGE_PROGRESS, PAGE_STATS = range(3)
+
+    # столбцы TreeModel списка типов файлов
+    FTC_CHECKED, FTC_NAME = range(2)
+
+
+    def wnd_destroy(self, widget, data=None):
+        #!!!
+        self.stop_scanning()
+        self.stop_watching()
+
+        #!!!
+        self.cfg.save()
+
+        Gtk.main_quit()
+
+    def __init__(self):
+        self.cfg = Config()
+        self.cfg.load()
+
+        resldr = get_resource_loader()
+        uibldr = get_gtk_builder(resldr, 'audiostat.ui')
+
+        self.window = uibldr.get_object('wndMain')
+
+        headerBar = uibldr.get_object('headerBar')
+
+        headerBar.set_title(TITLE)
+        headerBar.set_subtitle('v%s' % VERSION)
+
+        isize = Gtk.IconSize.lookup(Gtk.IconSize.DIALOG)[1] * 4 #!!!
+        logo = resldr.load_pixbuf('images/audiostat.svg', isize, isize)
+        self.window.set_icon(logo)
+
+        self.iconLossyAudio = load_system_icon('network-cellular-signal-weak-symbolic', Gtk.IconSize.MENU, False, symbolic=True)
+        self.iconMissingTags = load_system_icon('dialog-warning', Gtk.IconSize.MENU, False, symbolic=True)
+        self.iconErrors = load_system_icon('dialog-error', Gtk.IconSize.MENU, False, symbolic=True)
+
+        # индекс в кортеже - AudioStreamInfo.RESOLUTION_*
+        self.resolutionIcons = tuple(map(lambda s: load_system_icon(s, Gtk.IconSize.MENU, symbolic=True),
+            ('non-starred', 'semi-starred', 'starred')))
+
+        # значки для таблицы прочей статистики
+        self.summaryIcons = dict(zip(AudioSummary.TS_BY_RES, self.resolutionIcons))
+        self.summaryIcons[AudioSummary.TS_LOSSY] = self.iconLossyAudio
+        self.summaryIcons[AudioSummary.TS_MISTAGS] = self.iconMissingTags
+        self.summaryIcons[AudioSummary.TS_WITH_ERRORS] = self.iconErrors
+
+        #
+        self.pages, self.btnRun, self.btnRefilter, self.boxFileCtls, self.btnCopyPath = get_ui_widgets(uibldr,
+            'pages', 'btnRun', 'btnRefilter', 'boxFileCtls', 'btnCopyPath')
+
+        self.clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
+
+        #
+        # start page
+        #
+        self.fcStartDir = uibldr.get_object('fcStartDir')
+        # потому как текущая версия Glade (3.38.x) - косяк на косяке
+        self.fcStartDir.set_action(Gtk.FileChooserAction.SELECT_FOLDER)
+
+        #
+        # фильтрация по типам файлов
+        self.chkFilterFileTypes, self.swFilterFileTypes = get_ui_widgets(uibldr,
+            'chkFilterFileTypes', 'swFilterFileTypes')
+        self.tvFilterFileTypes = TreeViewShell.new_from_uibuilder(uibldr, 'tvFilterFileTypes')
+
+        self.chkFilterFileTypes.set_active(self.cfg.filter.byFileTypes)
+
+        self.swFilterFileTypes.set_min_content_height(WIDGET_BASE_HEIGHT * 10)
+        self.swFilterFileTypes.set_sensitive(self.cfg.filter.byFileTypes)
+
+        for ftname, ftexts in AUDIO_FILE_TYPES:
+            self.tvFilterFileTypes.store.append((ftexts & self.cfg.filter.fileTypes,
+                ftname))
+
+        #
+        # фильтрация по формату - без потерь/с потерями
+        self.chkFilterByLossless, self.cboxFilterLossless = get_ui_widgets(uibldr,
+            'chkFilterByLossless', 'cboxFilterLossless')
+
+        # здесь и далее - названия виджетов примерно соответствуют полям AudioFileFilter,
+        # и их состояние прямо здесь устанавливается из содержимого конфига
+        self.chkFilterByLossless.set_active(self.cfg.filter.byLossless)
+        self.cboxFilterLossless.set_sensitive(self.cfg.filter.byLossless)
+
+        self.cboxFilterLossless.set_active(int(self.cfg.filter.onlyLossless))
+
+        #
+        # фильтрация по разрешению
+        self.chkFilterByResolution, self.cboxFilterResolution = get_ui_widgets(uibldr,
+            'chkFilterByResolution', 'cboxFilterResolution')
+
+        self.chkFilterByResolution.set_active(self.cfg.filter.byResolution)
+        self.cboxFilterResolution.set_sensitive(self.cfg.filter.byResolution)
+
+        self.cboxFilterResolution.set_active(self.cfg.filter.resolution)
+
+        #
+        # фильтрация по битрейту
+        self.chkFilterByBitrate, self.gridFilterByBitrate,\
+        self.rbtnFilterBRLowerThan, self.rbtnFilterBRGreaterThan,\
+        self.spinFilterBitrateMax, self.spinFilterBitrateMin,\
+        adjEntFilterBitrateGreater, adjEntFilterBitrateLower = get_ui_widgets(uibldr,
+            'chkFilterByBitrate', 'gridFilterByBitrate',
+            'rbtnFilterBRLowerThan', 'rbtnFilterBRGreaterThan',
+            'spinFilterBitrateMax', 'spinFilterBitrateMin',
+            'adjEntFilterBitrateGreater', 'adjEntFilterBitrateLower')
+
+        for adj in (adjEntFilterBitrateGreater, adjEntFilterBitrateLower):
+            adj.set_upper(AudioStreamInfo.BITRATE_MAX)
+            adj.set_lower(AudioStreamInfo.BITRATE_MIN)
+
+        self.chkFilterByBitrate.set_active(self.cfg.filter.byBitrate)
+        self.gridFilterByBitrate.set_sensitive(self.cfg.filter.byBitrate)
+
+        if self.cfg.filter.bitrateLowerThan:
+            rb = self.rbtnFilterBRLowerThan
+        else:
+            rb = self.rbtnFilterBRGreaterThan
+
+        self.spinFilterBitrateMax.set_value(self.cfg.filter.bitrateLowerThanValue)
+        self.spinFilterBitrateMin.set_value(self.cfg.filter.bitrateGreaterThanValue)
+
+        rb.set_active(True)
+
+        #
+        # фильтрация по наличию параметров аудиопотока
+        self.chkFilterByContainsStreamParams, self.cboxFilterContainsStreamParams = get_ui_widgets(uibldr,
+            'chkFilterByContainsStreamParams', 'cboxFilterContainsStreamParams')
+
+        self.chkFilterByContainsStreamParams.set_active(self.cfg.filter.byContainsStreamParameters)
+        self.cboxFilterContainsStreamParams.set_sensitive(self.cfg.filter.byContainsStreamParameters)
+
+        self.cboxFilterContainsStreamParams.set_active(int(self.cfg.filter.onlyContainsStreamParameters))
+
+        #
+        # фильтрация по наличию ошибок в метаданных
+        self.chkFilterByErrors, self.cboxFilterErrors = get_ui_widgets(uibldr,
+            'chkFilterByErrors', 'cboxFilterErrors')
+
+        self.chkFilterByErrors.set_active(self.cfg.filter.byErrors)
+        self.cboxFilterErrors.set_sensitive(self.cfg.filter.byErrors)
+
+        self.cboxFilterErrors.set_active(self.cfg.filter.onlyWithErrors)
+
+        #
+        # фильтрация по наличию важных тэгов
+        self.chkFilterByTags, self.cboxFilterTags = get_ui_widgets(uibldr,
+            'chkFilterByTags', 'cboxFilterTags')
+
+        self.chkFilterByTags.set_active(self.cfg.filter.byMissingTags)
+        self.cboxFilterTags.set_sensitive(self.cfg.filter.byMissingTags)
+
+        self.cboxFilterTags.set_active(int(self.cfg.filter.onlyMissingTags))
+
+        #
+        # progress page
+        #
+        self.labProgressPath, self.labProgressFiles,\
+        self.labProgressAudioFiles, self.labProgressErrors,\
+        self.progressBar = get_ui_widgets(uibldr,
+            'labProgressPath', 'labProgressFiles', 'labProgressAudioFiles',
+            'labProgressErrors', 'progressBar')
+
+        self.labProgressCacheHits, self.labProgressCacheMisses = get_ui_widgets(uibldr,
+            'labProgressCacheHits', 'labProgressCacheMisses')
+
+        self.labProgressIOWait = uibldr.get_object('labProgressIOWait')
+
+        #
+        # stats page
+        #
+        swStats = uibldr.get_object('swStats')
+        _ = WIDGET_BASE_HEIGHT * 32
+        swStats.set_min_content_height(_)
+        swStats.set_size_request(-1, _)
+
+        self.tvStats = TreeViewShell.new_from_uibuilder(uibldr, 'tvStats')
+        self.tvStats.view.set_size_request(WIDGET_BASE_WIDTH * 128, -1)
+
+        # отчёт о времени этапов последнего обхода (см. __scan_finished())
+        self.expScanProfile, self.labScanProfile = get_ui_widgets(uibldr,
+            'expScanProfile', 'labScanProfile')
+
+        uibldr.get_object('swScanProfile').set_min_content_height(WIDGET_BASE_HEIGHT * 16)
+
+        # значения в StatsTreeModel хранятся "как есть",
+        # отображаются они функциями отображения ячеек
+        for colname, crname, colMin, tostr in (
+                ('colStatsSampleRate', 'crStatsSampleRate', StatsTreeModel.STC_SAMPLERATE_MIN, disp_int_range_k),
+                ('colStatsChannels', 'crStatsChannels', StatsTreeModel.STC_CHANNELS_MIN, disp_int_range),
+                ('colStatsBits', 'crStatsBits', StatsTreeModel.STC_BITSPERSAMPLE_MIN, disp_int_range),
+                ('colStatsBitrate', 'crStatsBitrate', StatsTreeModel.STC_BITRATE_MIN, disp_int_range)):
+            uibldr.get_object(colname).set_cell_data_func(uibldr.get_object(crname),
+                self.__stats_range_cell_data, (colMin, tostr))
+
+        for colname, crname, flag, icon in (
+                ('colStatsLossy', 'crStatsLossy', StatsTreeModel.SRF_LOSSY, self.iconLossyAudio),
+                ('colStatsMissingTags', 'crStatsMissingTags', StatsTreeModel.SRF_MISSINGTAGS, self.iconMissingTags),
+                ('colStatsErrors', 'crStatsErrors', StatsTreeModel.SRF_ERRORS, self.iconErrors)):
+            uibldr.get_object(colname).set_cell_data_func(uibldr.get_object(crname),
+                self.__stats_flag_cell_data, (flag, icon))
+
+        uibldr.get_object('colStatsRes').set_cell_data_func(uibldr.get_object('crStatsRes'),
+            self.__stats_resolution_cell_data)
+
+        #
+        # сортировка дерева статистики - щелчком по заголовку столбца
+        self.statsSortKey = ResultsTree.SORT_NAME
+        self.statsSortDescending = False
+
+        # ключи - ResultsTree.SORT_*, значения - Gtk.TreeViewColumn
+        self.statsSortColumns = dict()
+
+        for colname, sortKey in (('colStatsName', ResultsTree.SORT_NAME),
+                ('colStatsSampleRate', ResultsTree.SORT_SAMPLERATE),
+                ('colStatsChannels', ResultsTree.SORT_CHANNELS),
+                ('colStatsBits', ResultsTree.SORT_BITSPERSAMPLE),
+                ('colStatsBitrate', ResultsTree.SORT_BITRATE)):
+            col = uibldr.get_object(colname)
+            col.connect('clicked', self.colStats_clicked, sortKey)
+            self.statsSortColumns[sortKey] = col
+
+        self.__update_stats_sort_indicators()
+
+        self.tvSummary = TreeViewShell.new_from_uibuilder(uibldr, 'tvSummary')
+        self.tvSampleRates = TreeViewShell.new_from_uibuilder(uibldr, 'tvSampleRates')
+        self.tvBitsPerSample = TreeViewShell.new_from_uibuilder(uibldr, 'tvBitsPerSample')
+        self.tvBitRates = TreeViewShell.new_from_uibuilder(uibldr, 'tvBitRates')
+
+        #
+        #
+        self.dlgAbout = uibldr.get_object('dlgAbout')
+        self.dlgAbout.set_logo(logo)
+        self.dlgAbout.set_program_name(TITLE)
+        #self.dlgAbout.set_comments(SUB_TITLE)
+        self.dlgAbout.set_version('v%s' % VERSION)
+        self.dlgAbout.set_copyright(COPYLEFT)
+        self.dlgAbout.set_website(URL)
+        self.dlgAbout.set_website_label(URL)
+
+        #
+        self.scanId = 0
+        self.scanner = None
+        self.scanThread = None
+
+        # экземпляр ScanProfile - замеры текущего обхода, сделанные
+        # в потоке GUI (остальное - у self.scanner.profile)
+        self.guiProfile = None
+
+        # экземпляр ScanResults - нефильтрованные результаты последнего
+        # завершённого обхода, или None
+        self.results = None
+
+        # отслеживание изменений в каталоге после обхода (см. start_watching())
+        self.watcher = None
+        self.watchThread = None
+
+        self.mnuMainWatch = uibldr.get_object('mnuMainWatch')
+        self.mnuMainWatch.set_active(self.cfg.watchChanges)
+
+        self.window.show_all()
+        self.__go_to_start_page()
+
+        uibldr.connect_signals(self)
+
+    def mnuMainAbout_activate(self, wgt):
+        self.dlgAbout.show_all()
+        self.dlgAbout.run()
+        self.dlgAbout.hide()
+
+    def mnuMainPruneCache_activate(self, wgt):
+        """Удаление из кэша метаданных записей об исчезнувших
+        и изменившихся файлах.
+
+        Для проверки записей нужен stat() каждого файла, что на большой
+        (или сетевой) фонотеке надолго, поэтому проверка выполняется
+        в фоновом потоке (см. __prune_thread()) так же, как обход:
+        со страницей прогресса и кнопкой "Stop"."""
+
+        page = self.pages.get_current_page()
+
+        if page == self.PAGE_PROGRESS:
+            # пока идёт обход (или та же проверка), кэш не трогаем
+            return
+
+        self.scanId += 1
+
+        self.btnRun.set_label('Stop')
+        self.btnRefilter.set_visible(False)
+        self.pages.set_current_page(self.PAGE_PROGRESS)
+
+        for lab in (self.labProgressFiles, self.labProgressAudioFiles, self.labProgressErrors,
+                self.labProgressCacheHits, self.labProgressCacheMisses, self.labProgressIOWait):
+            lab.set_text('')
+
+        self.labProgressPath.set_text('Pruning metadata cache')
+        self.progressBar.set_fraction(0.0)
+
+        # stop_scanning() прерывает и проверку
+        self.scanner = _CachePruning()
+
+        self.scanThread = threading.Thread(target=self.__prune_thread,
+            args=(self.scanner, self.scanId, page),
+            daemon=True)
+        self.scanThread.start()
+
+    def __prune_thread(self, pruning, scanId, page):
+        """Фоновый поток проверки записей кэша метаданных.
+        page - номер страницы, на которую следует вернуться по окончании."""
+
+        def __progress(nchecked, ntotal):
+            GLib.idle_add(self.__prune_progress, scanId, nchecked, ntotal)
+
+        try:
+            try:
+                cache = MetadataCache(self.cfg.pathCache)
+                try:
+                    msg = '%d stale entries removed' % cache.prune(pruning.is_stopped, __progress)
+                finally:
+                    cache.close()
+            except (OSError, sqlite3.Error) as ex:
+                msg = 'Can not prune metadata cache - %s' % ex
+        except Exception:
+            GLib.idle_add(self.handle_unhandled, *sys.exc_info())
+            return
+
+        GLib.idle_add(self.__prune_finished, scanId, page, msg)
+
+    def __prune_progress(self, scanId, nchecked, ntotal):
+        """Отображение хода проверки кэша, вызывается в потоке GUI."""
+
+        if scanId != self.scanId:
+            return False
+
+        self.labProgressPath.set_text('Pruning metadata cache: %d of %d entries checked' % (nchecked, ntotal))
+        self.progressBar.set_fraction(float(nchecked) / ntotal)
+
+        return False
+
+    def __prune_finished(self, scanId, page, msg):
+        """Завершение проверки кэша, вызывается в потоке GUI."""
+
+        if scanId != self.scanId:
+            # проверка была прервана
+            return False
+
+        self.scanThread.join()
+        self.scanThread = None
+
+        if page == self.PAGE_STATS and self.results is not None:
+            self.__go_to_stats_page()
+        else:
+            self.__go_to_start_page()
+
+        msg_dialog(self.window, 'Prune metadata cache', msg, Gtk.MessageType.INFO)
+
+        return False
+
+    def mnuMainWatch_toggled(self, wgt):
+        self.cfg.watchChanges = wgt.get_active()
+
+        if not self.cfg.watchChanges:
+            self.stop_watching()
+        elif self.results is not None and self.results.rootdir and self.scanThread is None:
+            self.start_watching()
+
+    def mnuMainAddRoot_activate(self, wgt):
+        """Добавление выбранного каталога в список каталогов
+        для совместного обхода."""
+
+        rootdir = os.path.abspath(self.cfg.lastDirectory)
+
+        if rootdir not in (os.path.abspath(r) for r, _ in self.cfg.roots):
+            self.cfg.roots.append((rootdir, 0))
+
+        msg_dialog(self.window, 'Scan roots',
+            '\n'.join(r for r, _ in self.cfg.roots), Gtk.MessageType.INFO)
+
+    def mnuMainClearRoots_activate(self, wgt):
+        self.cfg.roots.clear()
+
+    def mnuMainScanRoots_activate(self, wgt):
+        if not self.cfg.roots:
+            msg_dialog(self.window, 'Scan roots',
+                'No directories added to scan roots', Gtk.MessageType.INFO)
+            return
+
+        if self.pages.get_current_page() == self.PAGE_PROGRESS:
+            self.stop_scanning()
+            self.scanId += 1
+
+        self.__start_scan(self.cfg.roots)
+
+    def mnuMainClearCache_activate(self, wgt):
+        cache = MetadataCache(self.cfg.pathCache)
+        try:
+            cache.clear()
+        finally:
+            cache.close()
+
+    # фильтрация по типам файлов
+    def chkFilterFileTypes_toggled(self, cb):
+        self.cfg.filter.byFileTypes = cb.get_active()
+        self.swFilterFileTypes.set_sensitive(self.cfg.filter.byFileTypes)
+
+    def __toggle_filetype(self, path):
+        itr = self.tvFilterFileTypes.store.get_iter(path)
+        ix = path.get_indices()[0]
+
+        v = not self.tvFilterFileTypes.store.get_value(itr, self.FTC_CHECKED)
+        self.tvFilterFileTypes.store.set_value(itr, self.FTC_CHECKED, v)
+
+        if v:
+            self.cfg.filter.fileTypes |= AUDIO_FILE_TYPES[ix].exts
+        else:
+            self.cfg.filter.fileTypes -= AUDIO_FILE_TYPES[ix].exts
+
+    def crFFTcheck_toggled(self, crt, path):
+        """Переключение чекбокса в списке типов файлов"""
+
+        # path приезжает как строка!
+        self.__toggle_filetype(Gtk.TreePath.new_from_string(path))
+
+    def tvFilterFileTypes_row_activated(self, tv, path, col):
+        """Двойной клик по строке в списке типов файлов"""
+
+        # path приезжает как Gtk.TreePath
+        # (см. метод выше - ай спасибо гномеры за "единообразие!")
+        self.__toggle_filetype(path)
+
+    # фильтрация по формату (с потерями/без потерь)
+    def chkFilterByLossless_toggled(self, cb):
+        self.cfg.filter.byLossless = cb.get_active()
+        self.cboxFilterLossless.set_sensitive(self.cfg.filter.byLossless)
+
+    def cboxFilterLossless_changed(self, cbox):
+        self.cfg.filter.onlyLossless = cbox.get_active() > 0
+
+    # фильтрация по наличию ошибок
+    def chkFilterByErrors_toggled(self, cb):
+        self.cfg.filter.byErrors = cb.get_active()
+        self.cboxFilterErrors.set_sensitive(self.cfg.filter.byErrors)
+
+    def cboxFilterErrors_changed(self, cbox):
+        self.cfg.filter.onlyWithErrors = cbox.get_active() > 0
+
+    # фильтрация по разрешению аудио
+    def chkFilterByResolution_toggled(self, cb):
+        self.cfg.filter.byResolution = cb.get_active()
+        self.cboxFilterResolution.set_sensitive(self.cfg.filter.byResolution)
+
+    def cboxFilterResolution_changed(self, cbox):
+        self.cfg.filter.resolution = cbox.get_active()
+
+    # фильтрация по битрейту
+    def chkFilterByBitrate_toggled(self, cb):
+        self.cfg.filter.byBitrate = cb.get_active()
+        self.gridFilterByBitrate.set_sensitive(self.cfg.filter.byBitrate)
+
+    def rbtnFilterBRLowerThan_toggled(self, rb):
+        self.cfg.filter.bitrateLowerThan = rb.get_active()
+
+    def rbtnFilterBRGreaterThan_toggled(self, rb):
+        self.cfg.filter.bitrateLowerThan = not rb.get_active()
+
+    def spinFilterBitrateMax_value_changed(self, sb):
+        self.cfg.filter.bitrateLowerThanValue = sb.get_value_as_int()
+
+    def spinFilterBitrateMin_value_changed(self, sb):
+        self.cfg.filter.bitrateGreaterThanValue = sb.get_value_as_int()
+
+    # фильтрация по наличию параметров аудиопотока
+    def chkFilterByContainsStreamParams_toggled(self, cb):
+        self.cfg.filter.byContainsStreamParameters = cb.get_active()
+        self.cboxFilterContainsStreamParams.set_sensitive(self.cfg.filter.byContainsStreamParameters)
+
+    def cboxFilterContainsStreamParams_changed(self, cbox):
+        self.cfg.filter.onlyContainsStreamParameters = cbox.get_active() > 0
+
+    # фильтрация по наличию важных тэгов
+    def chkFilterByTags_toggled(self, cb):
+        self.cfg.filter.byMissingTags = cb.get_active()
+        self.cboxFilterTags.set_sensitive(self.cfg.filter.byMissingTags)
+
+    def cboxFilterTags_changed(self, cbox):
+        self.cfg.filter.onlyMissingTags = cbox.get_active() > 0
+
+    def scan_statistics(self, roots=None):
+        """Сбор статистики.
+        Обход каталога выполняется в фоновом потоке (см. __scan_thread()),
+        результаты пачками попадают в __scan_events().
+
+        roots - None (обход каталога cfg.lastDirectory) или список
+        каталогов для совместного обхода (см. Config.roots)."""
+
+        self.stop_scanning()
+        self.stop_watching()
+
+        self.results = None
+
+        self.cache = MetadataCache(self.cfg.pathCache) if self.cfg.useMetadataCache else None
+
+        #
+        # собираем статистику
+        #
+        print('*** Starting collecting statistics in %s' % (self.cfg.lastDirectory if not roots
+            else ', '.join(rootdir for rootdir, _ in roots)), file=sys.stderr)
+
+        # номер текущего обхода - дабы не путать события от прерванного
+        # обхода с событиями от нового
+        self.scanId += 1
+
+        self.guiProfile = ScanProfile()
+
+        # обход - без фильтрации: фильтруются уже готовые результаты
+        # (см. show_statistics()), так что после смены параметров
+        # фильтрации повторный обход не нужен;
+        # тэги разбираем, только если они нужны текущему фильтру
+        headerOnly = self.cfg.headerOnlyProbe and not self.cfg.filter.needs_tags()
+
+        def __new_engine(nworkers):
+            return ExtractionEngine(None, nworkers or self.cfg.workers, self.cache, headerOnly,
+                self.cfg.ioOrder, self.cfg.ioWindow, self.cfg.prefetch,
+                self.cfg.politeScan, self.cfg.readRateLimit * 1024, self.cfg.idleIOPriority)
+
+        scanId = self.scanId
+
+        def __scan_sink(events):
+            # вызывается в фоновом потоке
+            results(events)
+            GLib.idle_add(self.__scan_events, scanId, events)
+
+        if roots:
+            # у каждого устройства - свой ExtractionEngine (см. MultiScanner)
+            engine = None
+            results = ScanResults('', AudioFilterPlan(None, headerOnly))
+
+            self.scanner = MultiScanner(roots, __new_engine, __scan_sink,
+                self.cfg.skipUnchangedDirs, self.cfg.symlinks)
+        else:
+            engine = __new_engine(0)
+            results = ScanResults(self.cfg.lastDirectory, engine.plan)
+
+            self.scanner = Scanner(engine, __scan_sink, self.cfg.skipUnchangedDirs, self.cfg.symlinks)
+
+        self.scanThread = threading.Thread(target=self.__scan_thread,
+            args=(self.scanner, engine, self.cache, scanId, results),
+            daemon=True)
+        self.scanThread.start()
+
+    def stop_scanning(self):
+        """Прерывание фонового обхода каталога (если он запущен)."""
+
+        if self.scanThread is not None:
+            self.scanner.stop()
+            self.scanThread.join()
+            self.scanThread = None
+
+    def start_watching(self):
+        """Запуск отслеживания изменений в каталоге последнего обхода.
+        Изменившиеся файлы разбираются в фоновом потоке
+        (см. __watch_thread()), обновления вносятся в результаты
+        обхода в __watch_updates()."""
+
+        self.stop_watching()
+
+        self.watcher = DirectoryWatcher(self.results.rootdir)
+
+        self.watchThread = threading.Thread(target=self.__watch_thread,
+            args=(self.watcher, self.scanId, not self.results.fullParse),
+            daemon=True)
+        self.watchThread.start()
+
+    def stop_watching(self):
+        if self.watchThread is not None:
+            self.watcher.stop()
+            self.watchThread.join()
+            self.watchThread = None
+
+            self.watcher.close()
+            self.watcher = None
+
+    def __watch_thread(self, watcher, scanId, headerOnly):
+        """Фоновый поток отслеживания изменений."""
+
+        # соединение с БД кэша - своё для каждого потока
+        cache = MetadataCache(self.cfg.pathCache) if self.cfg.useMetadataCache else None
+
+        try:
+            try:
+                watcher.start()
+
+                # изменений обычно немного - пул процессов ни к чему
+                with ExtractionEngine(None, 1, cache, headerOnly) as engine:
+                    updater = LiveUpdater(engine)
+
+                    while True:
+                        changes = watcher.wait_changes()
+                        if changes is None:
+                            break
+
+                        GLib.idle_add(self.__watch_updates, scanId, updater.collect(changes))
+            finally:
+                if cache is not None:
+                    cache.close()
+        except Exception:
+            GLib.idle_add(self.handle_unhandled, *sys.exc_info())
+
+    def __watch_updates(self, scanId, updates):
+        """Внесение изменений в результаты обхода, вызывается в потоке GUI."""
+
+        if scanId != self.scanId or self.results is None:
+            return False
+
+        if not apply_updates(self.results, updates):
+            print('*** Too many changes, rescanning', file=sys.stderr)
+
+            if self.pages.get_current_page() == self.PAGE_STATS:
+                self.__start_scan()
+            else:
+                # на начальной странице результаты больше не годятся
+                self.stop_watching()
+                self.results = None
+                self.__update_refilter_sensitivity()
+
+            return False
+
+        if self.pages.get_current_page() == self.PAGE_STATS:
+            self.show_statistics(True)
+
+        return False
+
+    def __scan_thread(self, scanner, engine, cache, scanId, results):
+        """Фоновый поток обхода каталога.
+        Если engine == None, scanner - экземпляр MultiScanner."""
+
+        try:
+            try:
+                if engine is None:
+                    dirinfo = scanner.scan()
+                else:
+                    engine.start()
+
+                    dirinfo = scanner.scan(results.rootdir)
+            finally:
+                if engine is not None:
+                    engine.close()
+
+                print('*** Files parsed: %d, I/O wait: %s' % (scanner.nParsedFiles,
+                    self.__io_wait_str(scanner)), file=sys.stderr)
+
+                if scanner.nBytesRead:
+                    print('*** Bytes read: %d (%d per file)' % (scanner.nBytesRead,
+                        scanner.nBytesRead // max(1, scanner.nParsedFiles)), file=sys.stderr)
+
+                if scanner.nUnreadableDirs:
+                    print('*** Unreadable directories (skipped): %d' % scanner.nUnreadableDirs, file=sys.stderr)
+
+                if cache is not None:
+                    print('*** Metadata cache: %d hits, %d misses' % (cache.hits, cache.misses), file=sys.stderr)
+                    cache.close()
+        except Exception:
+            GLib.idle_add(self.handle_unhandled, *sys.exc_info())
+            return
+
+        GLib.idle_add(self.__scan_finished, scanId, None if dirinfo is None else results)
+
+    @staticmethod
+    def __io_wait_str(scanner):
+        """Время ожидания ввода-вывода при разборе файлов - в виде строки."""
+
+        n = scanner.nParsedFiles
+
+        return '%.1f s (%.1f ms/file)' % (scanner.ioWaitTime,
+            scanner.ioWaitTime * 1000 / n if n else 0.0)
+
+    def __scan_events(self, scanId, events):
+        """Обработка пачки событий от Scanner в потоке GUI
+        (только отображение прогресса - дерево статистики заполняется
+        по завершении обхода)."""
+
+        if scanId != self.scanId:
+            # события от прерванного обхода
+            return False
+
+        t0 = monotonic()
+
+        curdir = None
+
+        for event in events:
+            evtype = event[0]
+
+            if evtype == Scanner.EV_DIR_ENTER:
+                # у "виртуального" корня MultiScanner'а пути нет
+                if event[4]:
+                    curdir = event[4]
+
+            elif evtype == Scanner.EV_FILE:
+                _, _, fname, nfo = event
+
+                if nfo.error:
+                    print('error reading file "%s" - %s' % (fname, nfo.error), file=sys.stderr)
+
+        #
+        # метки обновляем один раз на пачку
+        #
+        if curdir is not None:
+            self.labProgressPath.set_text(curdir)
+
+        self.labProgressFiles.set_text(str(self.scanner.nFiles))
+        self.labProgressAudioFiles.set_text(str(self.scanner.nAudioFiles))
+        self.labProgressErrors.set_text(str(self.scanner.nErrors))
+
+        if self.cache is not None:
+            self.labProgressCacheHits.set_text(str(self.cache.hits))
+            self.labProgressCacheMisses.set_text(str(self.cache.misses))
+
+        self.labProgressIOWait.set_text(self.__io_wait_str(self.scanner))
+
+        self.progressBar.pulse()
+
+        self.guiProfile.add_since(PH_EVENTS, t0)
+
+        return False
+
+    def __stats_range_cell_data(self, col, crt, model, itr, data):
+        """Отображение диапазона значений параметра в дереве статистики.
+        data - кортеж из номера столбца StatsTreeModel с минимальным
+        значением (максимальное - в следующем столбце) и функции
+        преобразования диапазона в строку."""
+
+        colMin, tostr = data
+
+        flags = model.get_value(itr, StatsTreeModel.STC_FLAGS)
+
+        if flags & StatsTreeModel.SRF_ERRORS and not flags & StatsTreeModel.SRF_DIR:
+            # у файла с ошибкой параметров нет
+            crt.props.text = '?'
+        elif flags & StatsTreeModel.SRF_DUPLICATE:
+            crt.props.text = ''
+        else:
+            crt.props.text = tostr(model.get_value(itr, colMin), model.get_value(itr, colMin + 1))
+
+    def __stats_flag_cell_data(self, col, crt, model, itr, data):
+        """Отображение флага в дереве статистики.
+        data - кортеж из StatsTreeModel.SRF_* и Pixbuf."""
+
+        flag, icon = data
+
+        crt.props.pixbuf = disp_bool(model.get_value(itr, StatsTreeModel.STC_FLAGS) & flag, icon)
+
+    def __stats_resolution_cell_data(self, col, crt, model, itr, data):
+        res = StatsTreeModel.get_resolution(model.get_value(itr, StatsTreeModel.STC_FLAGS))
+
+        crt.props.pixbuf = None if res is None else self.resolutionIcons[res]
+
+    def tvStats_query_tooltip(self, tv, x, y, keyboard, tooltip):
+        """Всплывающая подсказка с параметрами файла или каталога;
+        текст подсказки формируется только при её отображении."""
+
+        ok, x, y, model, path, itr = tv.get_tooltip_context(x, y, keyboard)
+
+        if not ok:
+            return False
+
+        node = model.get_node(itr)
+
+        if model.tree.is_duplicate(node):
+            origPath = model.tree.get_duplicate_of(node)
+
+            if origPath is not None:
+                hint = 'Already scanned as "%s"' % origPath
+            else:
+                hint = 'Already scanned under another name (hard or symbolic link)'
+        else:
+            nfo = model.tree.get_info(node)
+
+            if not model.tree.is_dir(node) and nfo.error:
+                hint = 'Error: %s' % nfo.error
+            else:
+                hint = nfo.get_hint_str()
+
+        tooltip.set_text(hint)
+        tv.set_tooltip_row(tooltip, path)
+
+        return True
+
+    def __update_stats_sort_indicators(self):
+        for sortKey, col in self.statsSortColumns.items():
+            col.set_sort_indicator(sortKey == self.statsSortKey)
+
+            if sortKey == self.statsSortKey:
+                col.set_sort_order(Gtk.SortType.DESCENDING if self.statsSortDescending else Gtk.SortType.ASCENDING)
+
+    def colStats_clicked(self, col, sortKey):
+        """Смена порядка сортировки дерева статистики."""
+
+        if sortKey == self.statsSortKey:
+            self.statsSortDescending = not self.statsSortDescending
+        else:
+            self.statsSortKey = sortKey
+            self.statsSortDescending = False
+
+        self.__update_stats_sort_indicators()
+
+        store = self.tvStats.store
+        if store is None:
+            return
+
+        store.tree.set_sort(self.statsSortKey, self.statsSortDescending)
+
+        self.__set_stats_tree(store.tree, True)
+
+    def __set_stats_tree(self, tree, keepExpanded=False):
+        """Отображение экземпляра ResultsTree в дереве статистики.
+        Если keepExpanded == True, развёрнутые каталоги (если они
+        никуда не делись) остаются развёрнутыми."""
+
+        store = self.tvStats.store
+
+        # развёрнутые каталоги запоминаем как узлы ResultsTree -
+        # положения строк в новом дереве будут другими
+        expanded = []
+
+        if keepExpanded and store is not None:
+            self.tvStats.view.map_expanded_rows(lambda tv, path, _: expanded.append(store.get_node(store.get_iter(path))), None)
+
+        store = StatsTreeModel(tree)
+
+        self.tvStats.view.set_model(None)
+        self.tvStats.store = store
+        self.tvStats.view.set_model(store)
+
+        # map_expanded_rows() отдаёт родительские каталоги раньше дочерних
+        for node in expanded:
+            if tree.has_children(node):
+                self.tvStats.view.expand_row(store.get_node_path(node), False)
+
+    def __scan_finished(self, scanId, results):
+        """Завершение обхода каталога, вызывается в потоке GUI."""
+
+        if scanId != self.scanId:
+            return False
+
+        self.scanThread.join()
+        self.scanThread = None
+
+        if results is None:
+            # обход был прерван
+            self.__go_to_start_page()
+            return False
+
+        self.results = results
+
+        #
+        # вроде как всё нормально - показываем статистику
+        #
+        t0 = monotonic()
+
+        self.show_statistics()
+
+        self.guiProfile.add_since(PH_TREE, t0)
+
+        self.show_scan_profile()
+
+        # результаты обхода нескольких каталогов не отслеживаются
+        if self.cfg.watchChanges and results.rootdir:
+            self.start_watching()
+
+        return False
+
+    def show_scan_profile(self):
+        """Отображение (и вывод в stderr) отчёта о времени этапов
+        завершённого обхода."""
+
+        profile = ScanProfile()
+        profile.merge(self.scanner.profile)
+        profile.merge(self.guiProfile)
+
+        report = '\n'.join(profile.get_report())
+
+        print('*** Scan profile:\n%s' % report, file=sys.stderr)
+
+        self.labScanProfile.set_text(report)
+
+    def show_statistics(self, keepExpanded=False):
+        """Фильтрация результатов последнего обхода в памяти,
+        заполнение дерева статистики и суммарных таблиц.
+        keepExpanded - см. __set_stats_tree()."""
+
+        selected = self.results.select(self.cfg.filter.compile(self.cfg.headerOnlyProbe))
+
+        self.summary = self.results.get_summary(selected)
+
+        # дерево статистики строится лениво, по мере разворачивания
+        # каталогов (см. ResultsTree, StatsTreeModel)
+        tree = ResultsTree(self.results, selected)
+        tree.set_sort(self.statsSortKey, self.statsSortDescending)
+
+        self.__set_stats_tree(tree, keepExpanded)
+
+        def fill_summary_table(srcd, tv, tostr, _sort, icons=None):
+            """Заполнение Gtk.ListStore статистической таблицы.
+
+            srcd    - словарь (одно из полей AudioSummary);
+            tv      - экземпляр TreeViewShell;
+            tostr   - функция, преобразующая значение параметра в строку;
+            _sort   - булевское значение, True - сортировать таблицу по
+                      именам параметров;
+            icons   - None или словарь, где ключи - параметры,
+                      а значения - экземпляры Pixbuf."""
+
+            tv.refresh_begin()
+
+            for param, n, pcts in self.summary.get_table(srcd, _sort):
+                tv.store.append((tostr(param),
+                    '%d (%d%%)' % (n, pcts),
+                    pcts,
+                    None if icons is None else icons.get(param)))
+
+            tv.refresh_end()
+
+        # заполняем таблицу sampleRates
+        fill_summary_table(self.summary.sampleRates, self.tvSampleRates, disp_int_val_k, True)
+
+        # заполняем таблицу bitsPerSample
+        fill_summary_table(self.summary.bitsPerSample, self.tvBitsPerSample, disp_int_val, True)
+
+        # заполняем таблицу bitRates
+        fill_summary_table(self.summary.bitRates, self.tvBitRates, AudioSummary.bitrate_bucket_str, True)
+
+        # заполняем прочую статистику
+        fill_summary_table(self.summary.totals, self.tvSummary, str, False, self.summaryIcons)
+
+        #
+        self.__go_to_stats_page()
+
+    def selStats_changed(self, _):
+        self.btnCopyPath.set_sensitive(self.tvStats.get_selected_iter() is not None)
+
+    def copy_selected_path(self):
+        """Копирование полного пути выбранного файла или каталога
+        в буфер обмена."""
+
+        itr = self.tvStats.get_selected_iter()
+        if not itr:
+            return
+
+        store = self.tvStats.store
+
+        self.clipboard.set_text(store.tree.get_path(store.get_node(itr)), -1)
+
+    def tvStats_row_activated(self, tv, path, col):
+        self.copy_selected_path()
+
+    def btnCopyPath_clicked(self, btn):
+        self.copy_selected_path()
+
+    # кол-во событий в пачке при выгрузке результатов
+    __EXPORT_BATCH = 4096
+
+    def btnExport_clicked(self, btn):
+        """Выгрузка отфильтрованных результатов последнего обхода
+        в файл CSV, NDJSON или SQLite (формат - по расширению)."""
+
+        dlg = Gtk.FileChooserDialog(title='Export results', parent=self.window,
+            action=Gtk.FileChooserAction.SAVE)
+        dlg.add_buttons('_Cancel', Gtk.ResponseType.CANCEL,
+            '_Save', Gtk.ResponseType.OK)
+        dlg.set_do_overwrite_confirmation(True)
+
+        for fmt in EXPORT_FORMATS:
+            dlg.add_filter(create_file_filter('%s (%s)' % (fmt.upper(), ', '.join(EXPORT_EXTENSIONS[fmt])),
+                ['*' + ext for ext in EXPORT_EXTENSIONS[fmt]]))
+
+        dlg.set_current_name('audiostat.csv')
+
+        if self.cfg.lastDirectory:
+            dlg.set_current_folder(self.cfg.lastDirectory)
+
+        r = dlg.run()
+        fpath = dlg.get_filename()
+        dlg.destroy()
+
+        if r != Gtk.ResponseType.OK or not fpath:
+            return
+
+        if get_export_format(fpath) is None:
+            msg_dialog(self.window, 'Export results',
+                'Unknown file format. Use one of extensions:\n%s' % ', '.join(
+                    ext for exts in EXPORT_EXTENSIONS.values() for ext in exts))
+            return
+
+        selected = self.results.select(self.cfg.filter.compile(self.cfg.headerOnlyProbe))
+
+        try:
+            sink = ExportSink([new_exporter(fpath)])
+
+            try:
+                self.results.replay(selected, sink, self.__EXPORT_BATCH)
+            finally:
+                sink.close()
+        except (OSError, sqlite3.Error) as ex:
+            msg_dialog(self.window, 'Export results', 'Can not export results - %s' % ex)
+
+    def __go_to_stats_page(self):
+        self.btnRun.set_label('Scan other directory')
+        self.btnRefilter.set_visible(False)
+        self.pages.set_current_page(self.PAGE_STATS)
+        self.boxFileCtls.set_sensitive(True)
+        self.boxFileCtls.set_visible(True)
+
+    def __go_to_start_page(self):
+        self.fcStartDir.set_current_folder(self.cfg.lastDirectory)
+        self.pages.set_current_page(self.PAGE_START)
+        self.btnRun.set_label('Start')
+
+        self.boxFileCtls.set_visible(False)
+        self.boxFileCtls.set_sensitive(False)
+
+        self.btnRefilter.set_visible(True)
+        self.__update_refilter_sensitivity()
+
+    def __update_refilter_sensitivity(self):
+        """Кнопка "Apply filters" доступна, если есть результаты
+        обхода выбранного каталога или совместного обхода
+        каталогов из cfg.roots."""
+
+        self.btnRefilter.set_sensitive(self.results is not None
+            and self.results.rootdir in ('', os.path.abspath(self.cfg.lastDirectory)))
+
+    def fcStartDir_current_folder_changed(self, fc):
+        self.cfg.lastDirectory = self.fcStartDir.get_current_folder()
+        print('Search directory changed to "%s"' % self.cfg.lastDirectory)
+
+        self.__update_refilter_sensitivity()
+
+    def btnRefilter_clicked(self, btn):
+        if self.results.can_filter(self.cfg.filter, self.cfg.headerOnlyProbe):
+            self.show_statistics()
+        else:
+            # в результатах нет того, что нужно фильтру (напр. тэгов) -
+            # без повторного обхода не обойтись
+            print('*** Previous scan results lack data required by filter, rescanning', file=sys.stderr)
+            self.__start_scan(None if self.results.rootdir else self.cfg.roots)
+
+    def __start_scan(self, roots=None):
+        self.btnRun.set_label('Stop')
+        self.btnRefilter.set_visible(False)
+        self.pages.set_current_page(self.PAGE_PROGRESS)
+        self.scan_statistics(roots)
+
+    def btnRun_clicked(self, btn):
+        p = self.pages.get_current_page()
+
+        if p == self.PAGE_START:
+            self.__start_scan()
+        else:
+            # p == self.PAGE_STATS
+            if p == self.PAGE_PROGRESS:
+                self.stop_scanning()
+                # события от прерванного обхода, которые ещё
+                # не обработаны, будут проигнорированы
+                self.scanId += 1
+
+            self.__go_to_start_page()
+
+    def handle_unhandled(self, exc_type, exc_value, exc_traceback):
+        # дабы не зациклиться, если че рухнет в этом обработчике
+        sys.excepthook = sys.__excepthook__
+
+        msg = '%s: %s' % (exc_type.__name__, str(exc_value))
+
+        print('** %s' % msg, file=sys.stderr)
+        print_exception(exc_type, exc_value, exc_traceback)
+
+        msg_dialog(self.window, 'Unhandled exception', msg)
+
+        sys.exit(255)
+
+    def run(self):
+        sys.excepthook = self.handle_unhandled
+        Gtk.main()
+
+
+def main():
+    MainWnd().run()
+
+
+if __name__ == '__main__':
+    print('[debugging %s]' % __file__)
@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" asiosched.py
+
+    Copyright 2021 MC-6312
+
+    his file is part of AudioStat.
+
+    AudioStat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    AudioStat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with AudioStat.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+""" Упорядочивание разбираемых файлов по их расположению на диске.
+
+    Порядок, в котором os.scandir() отдаёт имена файлов, с расположением
+    файлов на диске никак не связан (у ext4 - порядок хэшей имён),
+    так что на жёстком диске разбор файлов в этом порядке - сплошные
+    перемещения головок. Если разбирать файлы пачками, упорядоченными
+    по номерам inode (на ext4 и подобных ФС inode выделяются примерно
+    в порядке расположения данных) или по физическому смещению первого
+    экстента файла (ioctl FS_IOC_FIEMAP, только Linux), головки
+    движутся в основном в одну сторону.
+
+    На SSD и в сети от этого ни пользы, ни особого вреда.
+
+    Кроме того, здесь же - упреждающее чтение (Prefetcher): пока
+    разбирается один файл, ОС уже читает начало и конец следующих
+    (posix_fadvise(POSIX_FADV_WILLNEED)), так что диск (или сеть)
+    и процессор работают одновременно.
+
+    И "вежливый" разбор (ReadTracker, set_idle_io_priority()): чтобы
+    обход огромной фонотеки не вытеснял из страничного кэша данные
+    других программ, файлы читаются без упреждающего чтения ОС,
+    прочитанные участки после разбора удаляются из кэша
+    (POSIX_FADV_DONTNEED), скорость чтения может ограничиваться,
+    а приоритет ввода-вывода - понижаться до "idle"."""
+
+
+import os
+import os.path
+import io
+import struct
+import sys
+import threading
+import ctypes
+import ctypes.util
+import platform
+from time import monotonic, sleep
+
+
+# порядок разбора файлов
+IO_ORDER_NONE, IO_ORDER_INODE, IO_ORDER_PHYSICAL = range(3)
+# названия IO_ORDER_* (для файла настроек и командной строки)
+IO_ORDERS = ('none', 'inode', 'physical')
+
+
+if sys.platform == 'linux':
+    import fcntl
+
+    # _IOWR('f', 11, struct fiemap)
+    __FS_IOC_FIEMAP = 0xC020660B
+
+    # struct fiemap: fm_start, fm_length, fm_flags, fm_mapped_extents,
+    # fm_extent_count, fm_reserved; за ней - массив struct fiemap_extent
+    __FIEMAP_HDR = struct.Struct('=QQIIII')
+    # struct fiemap_extent: fe_logical, fe_physical, fe_length,
+    # fe_reserved64[2], fe_flags, fe_reserved[3]
+    __FIEMAP_EXTENT = struct.Struct('=QQQQQIIII')
+
+    # запрос на один экстент с начала файла
+    __FIEMAP_REQUEST = __FIEMAP_HDR.pack(0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0) + bytes(__FIEMAP_EXTENT.size)
+
+    def get_physical_offset(fpath):
+        """Возвращает физическое смещение (в байтах) начала данных
+        файла fpath или None, если ФС его не сообщает (или у файла
+        вообще нет данных)."""
+
+        try:
+            fd = os.open(fpath, os.O_RDONLY)
+        except OSError:
+            return
+
+        try:
+            buf = bytearray(__FIEMAP_REQUEST)
+            fcntl.ioctl(fd, __FS_IOC_FIEMAP, buf)
+        except OSError:
+            # ФС не поддерживает FIEMAP
+            return
+        finally:
+            os.close(fd)
+
+        if __FIEMAP_HDR.unpack_from(buf)[3] == 0:
+            return
+
+        return __FIEMAP_EXTENT.unpack_from(buf, __FIEMAP_HDR.size)[1]
+else:
+    def get_physical_offset(fpath):
+        return
+
+
+def get_order_keys(order, items):
+    """Возвращает список ключей для упорядочивания файлов.
+
+    Параметры:
+        order   - IO_ORDER_INODE или IO_ORDER_PHYSICAL;
+        items   - последовательность кортежей вида (путь к файлу, номер inode).
+
+    Файлы, физическое смещение которых неизвестно, упорядочиваются
+    по inode после остальных."""
+
+    if order == IO_ORDER_INODE:
+        return [ino for _, ino in items]
+
+    # больше любого смещения
+    unknown = 1 << 64
+
+    keys = []
+
+    for fpath, ino in items:
+        offset = get_physical_offset(fpath)
+        keys.append((unknown if offset is None else offset, ino))
+
+    return keys
+
+
+# сколько байт с начала и с конца файла читать заранее: в начале
+# файла - заголовки и тэги (у FLAC, MP4, ID3v2 - вместе с картинками,
+# но картинки mutagen'у при разборе параметров потока не нужны),
+# в конце - ID3v1, APEv2 и т.п.
+PREFETCH_HEAD = 65536
+PREFETCH_TAIL = 16384
+
+
+def prefetch_file(fpath):
+    """Запрос на упреждающее чтение начала и конца файла fpath.
+    ОС выполняет чтение в фоне, функция его не ждёт."""
+
+    try:
+        fd = os.open(fpath, os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        size = os.fstat(fd).st_size
+
+        os.posix_fadvise(fd, 0, PREFETCH_HEAD, os.POSIX_FADV_WILLNEED)
+
+        if size > PREFETCH_HEAD:
+            tail = max(PREFETCH_HEAD, size - PREFETCH_TAIL)
+            os.posix_fadvise(fd, tail, size - tail, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class Prefetcher():
+    """Упреждающее чтение файлов в фоновом потоке.
+
+    Поток идёт по списку файлов впереди того, кто их разбирает,
+    но не дальше, чем на window файлов: после разбора каждого файла
+    следует вызывать done(). Сами данные в память процесса
+    не читаются - ОС кладёт их в страничный кэш, откуда их и возьмёт
+    разбирающий файлы процесс.
+
+    Если posix_fadvise() нет (не POSIX-система), ничего не делает."""
+
+    def __init__(self, fpaths, window):
+        """Параметры:
+            fpaths  - последовательность путей к файлам в порядке разбора;
+            window  - целое, на сколько файлов можно уходить вперёд (> 0)."""
+
+        self.__fpaths = fpaths
+        self.__slots = threading.Semaphore(window)
+        self.__stopEvent = threading.Event()
+
+        if hasattr(os, 'posix_fadvise'):
+            self.__thread = threading.Thread(target=self.__run, daemon=True)
+        else:
+            self.__thread = None
+
+    def __run(self):
+        for fpath in self.__fpaths:
+            self.__slots.acquire()
+
+            if self.__stopEvent.is_set():
+                break
+
+            prefetch_file(fpath)
+
+    def start(self):
+        if self.__thread is not None:
+            self.__thread.start()
+
+    def done(self, n=1):
+        """Вызывается после разбора n файлов."""
+
+        self.__slots.release(n)
+
+    def close(self):
+        if self.__thread is not None:
+            self.__stopEvent.set()
+            self.__slots.release()
+            self.__thread.join()
+            self.__thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+
+# номера системного вызова ioprio_set
+__NR_IOPRIO_SET = {'x86_64':251, 'i386':289, 'i686':289,
+    'aarch64':30, 'armv7l':314, 'armv6l':314,
+    'ppc64le':273, 's390x':282, 'riscv64':30}
+
+__IOPRIO_WHO_PROCESS = 1
+__IOPRIO_CLASS_IDLE = 3
+__IOPRIO_CLASS_SHIFT = 13
+
+
+def set_idle_io_priority():
+    """Понижение приоритета ввода-вывода текущего потока до класса
+    "idle" (диск достаётся ему, только когда он больше никому не нужен;
+    действует при планировщиках BFQ и CFQ).
+    Возвращает False, если не получилось (не Linux и т.п.)."""
+
+    if sys.platform != 'linux':
+        return False
+
+    nr = __NR_IOPRIO_SET.get(platform.machine())
+    if nr is None:
+        return False
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+        # who == 0 - текущий поток
+        return libc.syscall(nr, __IOPRIO_WHO_PROCESS, 0,
+            __IOPRIO_CLASS_IDLE << __IOPRIO_CLASS_SHIFT) == 0
+    except (OSError, AttributeError):
+        return False
+
+
+class RateLimiter():
+    """Ограничение скорости чтения: consume() приостанавливает
+    вызывающий поток так, чтобы средняя скорость не превышала
+    заданной.
+
+    Поля:
+        rate    - целое, байт в секунду (> 0)."""
+
+    # за сколько секунд допускается "неизрасходованный" запас
+    BURST = 0.25
+
+    def __init__(self, rate):
+        self.rate = rate
+
+        self.__lock = threading.Lock()
+        self.__t = monotonic()
+
+    def consume(self, nbytes):
+        with self.__lock:
+            now = monotonic()
+
+            # __t - момент, к которому "оплачено" всё прочитанное
+            self.__t = max(self.__t, now - self.BURST) + nbytes / self.rate
+            delay = self.__t - now
+
+        if delay > 0:
+            sleep(delay)
+
+
+class _TrackedFileIO(io.FileIO):
+    """Файл, чтение из которого учитывается экземпляром ReadTracker."""
+
+    def __init__(self, fpath, tracker):
+        super().__init__(fpath, 'rb')
+
+        self.__tracker = tracker
+
+        if tracker.dropCache:
+            try:
+                # читать только то, что просят
+                os.posix_fadvise(self.fileno(), 0, 0, os.POSIX_FADV_RANDOM)
+            except OSError:
+                pass
+
+    def readinto(self, b):
+        pos = self.tell()
+        n = super().readinto(b)
+
+        if n:
+            self.__tracker.add(pos, n)
+
+        return n
+
+    def readall(self):
+        pos = self.tell()
+        data = super().readall()
+
+        self.__tracker.add(pos, len(data))
+
+        return data
+
+    def close(self):
+        if not self.closed:
+            self.__tracker.release(self.fileno())
+
+        super().close()
+
+
+class ReadTracker():
+    """Учёт чтения из файла при его разборе.
+
+    Поля:
+        nBytes      - целое, кол-во прочитанных байт (с последнего
+                      вызова reset());
+        dropCache   - булевское, True - прочитанные участки файла
+                      удаляются из страничного кэша при закрытии
+                      файла (release()), а упреждающее чтение ОС
+                      для открытых open() файлов отключается;
+        limiter     - None или экземпляр RateLimiter."""
+
+    def __init__(self, dropCache=False, limiter=None):
+        self.dropCache = dropCache and hasattr(os, 'posix_fadvise')
+        self.limiter = limiter
+
+        self.nBytes = 0
+        # прочитанные участки - кортежи вида (смещение, кол-во байт)
+        self.__ranges = []
+
+    def reset(self):
+        self.nBytes = 0
+        self.__ranges.clear()
+
+    def add(self, offset, nbytes):
+        """Учёт чтения nbytes байт со смещения offset."""
+
+        self.nBytes += nbytes
+
+        if self.dropCache:
+            self.__ranges.append((offset, nbytes))
+
+        if self.limiter is not None:
+            self.limiter.consume(nbytes)
+
+    def release(self, fd):
+        """Вызывается перед закрытием файла fd: удаление прочитанных
+        участков из страничного кэша (если dropCache == True)."""
+
+        if not self.__ranges:
+            return
+
+        ranges = sorted(self.__ranges)
+        self.__ranges.clear()
+
+        # соседние и перекрывающиеся участки - одним вызовом
+        start, end = ranges[0][0], ranges[0][0] + ranges[0][1]
+
+        try:
+            for offset, nbytes in ranges[1:]:
+                if offset > end:
+                    os.posix_fadvise(fd, start, end - start, os.POSIX_FADV_DONTNEED)
+                    start = offset
+
+                end = max(end, offset + nbytes)
+
+            os.posix_fadvise(fd, start, end - start, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+
+    def open(self, fpath):
+        """Открытие файла fpath на чтение; возвращает буферизованный
+        файловый объект (для mutagen), чтение из которого учитывается."""
+
+        return io.BufferedReader(_TrackedFileIO(fpath, self))
+
+
+def is_rotational(path):
+    """Возвращает True, если path лежит на вращающемся диске,
+    False - если нет, None - если выяснить не удалось (не Linux,
+    сетевая ФС и т.п.)."""
+
+    try:
+        dev = os.stat(path).st_dev
+        sysdir = os.path.realpath('/sys/dev/block/%d:%d' % (os.major(dev), os.minor(dev)))
+
+        # у раздела очереди запросов нет - она у диска
+        for d in (sysdir, os.path.dirname(sysdir)):
+            fpath = os.path.join(d, 'queue', 'rotational')
+
+            if os.path.exists(fpath):
+                with open(fpath, 'r') as f:
+                    return f.read().strip() == '1'
+    except (OSError, ValueError, AttributeError):
+        pass
+
+
+def evict_file(fpath):
+    """Удаление содержимого файла fpath из страничного кэша
+    (если страницы не изменены, прав root для этого не нужно).
+    Возвращает False, если не получилось."""
+
+    if not hasattr(os, 'posix_fadvise'):
+        return False
+
+    try:
+        fd = os.open(fpath, os.O_RDONLY)
+    except OSError:
+        return False
+
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    except OSError:
+        return False
+    finally:
+        os.close(fd)
+
+    return True
+
+
+if __name__ == '__main__':
+    print('[debugging %s]' % __file__)
+
+    for fpath in sys.argv[1:]:
+        print(fpath, get_physical_offset(fpath), is_rotational(fpath))
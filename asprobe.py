@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" asprobe.py
+
+    Copyright 2021 MC-6312
+
+    his file is part of AudioStat.
+
+    AudioStat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    AudioStat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with AudioStat.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+""" Быстрое извлечение параметров аудиопотока из заголовков файлов
+    без разбора тэгов.
+
+    Для форматов без потерь и PCM параметры потока лежат в заголовке
+    по фиксированным (или почти фиксированным) смещениям, так что
+    достаточно одного чтения первых PROBE_SIZE байт файла; mutagen
+    же читает и разбирает все тэги, включая встроенные картинки
+    размером в мегабайты.
+
+    Значения вычисляются так же, как это делает mutagen, чтобы
+    результаты не зависели от способа извлечения.
+    Всё, что выглядит непривычно, отдаётся на откуп mutagen
+    (функции probe_* возвращают None)."""
+
+
+import os
+import os.path
+import struct
+
+
+# сколько байт читать из начала файла
+PROBE_SIZE = 4096
+
+# предельные правдоподобные параметры потока; заголовок с параметрами
+# больше этих - испорчен (или подделан), такой файл отдаётся mutagen
+MAX_SAMPLE_RATE = 1 << 26
+MAX_CHANNELS = 255
+MAX_BITS_PER_SAMPLE = 64
+
+
+def __probe_flac(fd, hdr, tracker):
+    """FLAC: блок STREAMINFO всегда идёт первым."""
+
+    if len(hdr) < 42 or not hdr.startswith(b'fLaC'):
+        return
+
+    # заголовок блока метаданных: 1 байт - флаг последнего блока и тип,
+    # 3 байта - размер
+    if hdr[4] & 0x7F != 0:
+        return
+
+    sample_first, sample_channels_bps, bps_total_hi, bps_total_lo = struct.unpack('>HBBI', hdr[18:26])
+
+    sampleRate = (sample_first << 4) + (sample_channels_bps >> 4)
+    if not sampleRate:
+        return
+
+    channels = ((sample_channels_bps >> 1) & 7) + 1
+    bitsPerSample = ((sample_channels_bps & 1) << 4) + (bps_total_hi >> 4) + 1
+    totalSamples = ((bps_total_hi & 0x0F) << 32) + bps_total_lo
+
+    # битрейт mutagen считает по размеру аудиоданных после блоков метаданных;
+    # самих блоков (картинок и т.п.) не читаем - только их заголовки
+    offset = 4
+
+    while True:
+        if offset + 4 <= len(hdr):
+            bhdr = hdr[offset:offset + 4]
+        else:
+            bhdr = os.pread(fd, 4, offset)
+            if len(bhdr) != 4:
+                return
+
+            if tracker is not None:
+                tracker.add(offset, 4)
+
+        offset += 4 + int.from_bytes(bhdr[1:4], 'big')
+
+        if bhdr[0] & 0x80:
+            break
+
+    if totalSamples:
+        bitRate = int(float(os.fstat(fd).st_size - offset) * 8 / (totalSamples / float(sampleRate)))
+    else:
+        bitRate = 0
+
+    return 'audio/flac', sampleRate, channels, bitsPerSample, bitRate
+
+
+def __iter_chunks(hdr, start, byteorder):
+    """Перебор чанков RIFF/IFF в пределах прочитанного заголовка.
+    Возвращает кортежи вида (id, данные чанка)."""
+
+    fmt = '<4sI' if byteorder == 'little' else '>4sI'
+
+    while start + 8 <= len(hdr):
+        cid, csize = struct.unpack(fmt, hdr[start:start + 8])
+        yield cid, hdr[start + 8:start + 8 + csize]
+
+        # чанки выравниваются на чётную границу
+        start += 8 + csize + (csize & 1)
+
+
+def __probe_wave(fd, hdr, tracker):
+    """Wave: параметры в чанке "fmt "."""
+
+    if len(hdr) < 12 or hdr[:4] != b'RIFF' or hdr[8:12] != b'WAVE':
+        return
+
+    for cid, data in __iter_chunks(hdr, 12, 'little'):
+        if cid == b'fmt ':
+            if len(data) < 16:
+                return
+
+            _, channels, sampleRate, _, _, bitsPerSample = struct.unpack('<HHLLHH', data[:16])
+
+            return 'audio/wav', sampleRate, channels, bitsPerSample,\
+                channels * bitsPerSample * sampleRate
+
+
+def __read_extended(b):
+    """Преобразование 80-битного числа с плавающей точкой
+    (IEEE 754 extended, big endian) в float."""
+
+    expon, himant, lomant = struct.unpack('>hLL', b)
+
+    sign = -1 if expon < 0 else 1
+    expon &= 0x7FFF
+
+    if expon == himant == lomant == 0:
+        return 0.0
+    elif expon == 0x7FFF:
+        raise OverflowError
+
+    expon -= 16383
+
+    return sign * (himant * (2.0 ** (expon - 31)) + lomant * (2.0 ** (expon - 63)))
+
+
+def __probe_aiff(fd, hdr, tracker):
+    """AIFF/AIFC: параметры в чанке "COMM"."""
+
+    if len(hdr) < 12 or hdr[:4] != b'FORM' or hdr[8:12] not in (b'AIFF', b'AIFC'):
+        return
+
+    for cid, data in __iter_chunks(hdr, 12, 'big'):
+        if cid == b'COMM':
+            if len(data) < 18:
+                return
+
+            channels, _, bitsPerSample, rawRate = struct.unpack('>hLh10s', data[:18])
+
+            try:
+                sampleRate = int(__read_extended(rawRate))
+            except OverflowError:
+                return
+
+            if sampleRate < 0:
+                return
+
+            return 'audio/aiff', sampleRate, channels, bitsPerSample,\
+                channels * bitsPerSample * sampleRate
+
+
+# частоты сэмплирования WavPack, индекс - биты 23-26 флагов
+__WAVPACK_RATES = (6000, 8000, 9600, 11025, 12000, 16000, 22050, 24000,
+    32000, 44100, 48000, 64000, 88200, 96000, 192000)
+
+
+def __probe_wavpack(fd, hdr, tracker):
+    """WavPack: заголовок первого блока."""
+
+    if len(hdr) < 32 or not hdr.startswith(b'wvpk'):
+        return
+
+    flags = struct.unpack('<I', hdr[24:28])[0]
+
+    ixrate = (flags >> 23) & 0xF
+    if ixrate >= len(__WAVPACK_RATES):
+        return
+
+    channels = 1 if flags & 4 else 2
+    sampleRate = __WAVPACK_RATES[ixrate]
+    bitsPerSample = ((flags & 3) + 1) * 8
+
+    # DSD64
+    if (flags >> 31) & 1:
+        sampleRate *= 4
+        bitsPerSample = 1
+
+    # битрейта mutagen для WavPack не сообщает
+    return 'audio/x-wavpack', sampleRate, channels, bitsPerSample, 0
+
+
+def __probe_ape(fd, hdr, tracker):
+    """Monkey's Audio: дескриптор/заголовок в начале файла."""
+
+    if len(hdr) < 76 or not hdr.startswith(b'MAC '):
+        return
+
+    version = struct.unpack('<H', hdr[4:6])[0]
+
+    if version >= 3980:
+        bitsPerSample, channels, sampleRate = struct.unpack('<HHI', hdr[68:76])
+    else:
+        channels, sampleRate = struct.unpack('<HI', hdr[10:16])
+
+        bitsPerSample = 0
+        if hdr[48:].startswith(b'WAVEfmt'):
+            bitsPerSample = struct.unpack('<H', hdr[74:76])[0]
+
+    # битрейта mutagen для Monkey's Audio тоже не сообщает
+    return 'audio/ape', sampleRate, channels, bitsPerSample, 0
+
+
+# ключи - расширения файлов, значения - функции разбора заголовков;
+# параметры функций - дескриптор файла, первые PROBE_SIZE байт файла
+# и None или экземпляр asiosched.ReadTracker, которому следует сообщать
+# о дополнительных чтениях
+__PROBES = {'.flac': __probe_flac,
+    '.wav': __probe_wave,
+    '.aif': __probe_aiff, '.aiff': __probe_aiff, '.aifc': __probe_aiff,
+    '.wv': __probe_wavpack,
+    '.ape': __probe_ape,
+    }
+
+PROBED_FILE_EXTS = frozenset(__PROBES)
+
+
+def probe_stream_info(fpath, tracker=None):
+    """Извлечение параметров аудиопотока из заголовка файла.
+
+    Параметры:
+        fpath   - строка, полный путь к файлу;
+        tracker - None или экземпляр asiosched.ReadTracker.
+
+    Возвращает кортеж вида (mime, sampleRate, channels, bitsPerSample,
+    bitRate) или None, если формат файла не поддерживается,
+    заголовок выглядит подозрительно или файл не читается - в этих
+    случаях файл следует разбирать "по-взрослому" (mutagen'ом)."""
+
+    probe = __PROBES.get(os.path.splitext(fpath)[-1].lower())
+    if probe is None:
+        return
+
+    try:
+        fd = os.open(fpath, os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        hdr = os.pread(fd, PROBE_SIZE, 0)
+
+        if tracker is not None:
+            tracker.add(0, len(hdr))
+
+        sinfo = probe(fd, hdr, tracker)
+    except (OSError, struct.error):
+        return
+    finally:
+        if tracker is not None:
+            tracker.release(fd)
+
+        os.close(fd)
+
+    if sinfo is not None:
+        _, sampleRate, channels, bitsPerSample, _ = sinfo
+
+        if sampleRate > MAX_SAMPLE_RATE or channels > MAX_CHANNELS or bitsPerSample > MAX_BITS_PER_SAMPLE:
+            return
+
+    return sinfo
+
+
+if __name__ == '__main__':
+    print('[debugging %s]' % __file__)
+
+    import sys
+
+    for fpath in sys.argv[1:]:
+        print(fpath, probe_stream_info(fpath))
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" asprofile.py
+
+    Copyright 2021 MC-6312
+
+    his file is part of AudioStat.
+
+    AudioStat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    AudioStat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with AudioStat.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+import os.path
+from heapq import heappush, heappushpop, nlargest
+from time import monotonic
+
+
+# этапы обхода
+PH_LISTDIR, PH_STAT, PH_CACHE, PH_PROBE, PH_PARSE, PH_FILTER, \
+PH_SINK, PH_EVENTS, PH_TREE = range(9)
+
+# имена этапов - для отчёта и для ScanProfile.to_dict()
+PHASE_NAMES = ('listdir', 'stat', 'cache', 'header', 'mutagen', 'filter',
+    'sink', 'events', 'tree')
+
+# пояснения к именам этапов в отчёте
+PHASE_HINTS = ('reading directories (per entry)',
+    'stat() of directories',
+    'metadata cache lookups and stores',
+    'stream parameters from file headers',
+    'full parse (mutagen.File)',
+    'filtering',
+    'passing results to receiver',
+    'progress display (GUI)',
+    'statistics tree and summary tables (GUI)')
+
+
+class ScanProfile():
+    """Счётчики времени и прочего для отчёта о ходе обхода каталога.
+
+    Время каждого этапа (PH_*) накапливается вместе с кол-вом
+    "единиц работы" (файлов, элементов каталогов, пачек событий),
+    так что в отчёте есть и суммарное время, и время на единицу.
+    Время разбора файлов меряется там, где они разбираются
+    (в т.ч. в дочерних процессах, см. asengine.ExtractionEngine),
+    и для нескольких процессов суммируется - может быть больше
+    общего времени обхода.
+
+    Замеры - два вызова time.monotonic() на единицу работы,
+    так что счётчики можно не отключать.
+
+    Поля:
+        phaseTimes  - список вещественных, суммарное время этапов
+                      (в секундах), индексы - PH_*;
+        phaseCounts - список целых, кол-во единиц работы этапов;
+        formats     - словарь, где ключи - расширения файлов
+                      (в нижнем регистре, с точкой), а значения -
+                      списки вида [кол-во файлов, кол-во ошибок,
+                      время разбора, кол-во прочитанных байт]
+                      (только для разобранных файлов);
+        slowest     - куча кортежей вида (время разбора, путь к файлу)
+                      не более чем из nSlowest самых медленных
+                      при разборе файлов;
+        nSlowest    - целое, см. slowest;
+        wallTime    - вещественное, общее время обхода (в секундах)."""
+
+    # размер списка самых медленных файлов по умолчанию
+    SLOWEST = 10
+
+    # индексы элементов значений словаря formats
+    FMT_FILES, FMT_ERRORS, FMT_TIME, FMT_BYTES = range(4)
+
+    def __init__(self, nSlowest=SLOWEST):
+        self.phaseTimes = [0.0] * len(PHASE_NAMES)
+        self.phaseCounts = [0] * len(PHASE_NAMES)
+        self.formats = dict()
+        self.slowest = []
+        self.nSlowest = nSlowest
+        self.wallTime = 0.0
+
+    def add_time(self, phase, seconds, n=1):
+        """Учёт n единиц работы этапа phase (PH_*), занявших seconds секунд."""
+
+        self.phaseTimes[phase] += seconds
+        self.phaseCounts[phase] += n
+
+    def add_since(self, phase, t0, n=1):
+        """То же, что add_time(), время - с момента t0 (значения
+        time.monotonic()). Возвращает текущее значение monotonic()."""
+
+        t = monotonic()
+
+        self.phaseTimes[phase] += t - t0
+        self.phaseCounts[phase] += n
+
+        return t
+
+    def add_file(self, fpath, phase, seconds, nbytes, error):
+        """Учёт разбора файла.
+
+        Параметры:
+            fpath   - строка, путь к файлу;
+            phase   - PH_PROBE или PH_PARSE;
+            seconds - вещественное, время разбора;
+            nbytes  - целое, кол-во прочитанных при разборе байт;
+            error   - булевское, True, если файл разобрать не удалось."""
+
+        self.phaseTimes[phase] += seconds
+        self.phaseCounts[phase] += 1
+
+        ext = os.path.splitext(fpath)[1].lower()
+
+        fmt = self.formats.get(ext)
+        if fmt is None:
+            fmt = self.formats[ext] = [0, 0, 0.0, 0]
+
+        fmt[0] += 1
+        fmt[1] += error
+        fmt[2] += seconds
+        fmt[3] += nbytes
+
+        self.__add_slow(seconds, fpath)
+
+    def __add_slow(self, seconds, fpath):
+        if len(self.slowest) < self.nSlowest:
+            heappush(self.slowest, (seconds, fpath))
+        elif seconds > self.slowest[0][0]:
+            heappushpop(self.slowest, (seconds, fpath))
+
+    def timed(self, iterable, phase):
+        """Генератор, выдающий элементы iterable; время получения
+        каждого элемента учитывается как единица работы этапа phase.
+        iterable не закрывается - это забота вызывающего."""
+
+        it = iter(iterable)
+        times = self.phaseTimes
+        counts = self.phaseCounts
+
+        while True:
+            t0 = monotonic()
+
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+
+            times[phase] += monotonic() - t0
+            counts[phase] += 1
+
+            yield item
+
+    def merge(self, other):
+        """Добавление счётчиков другого экземпляра ScanProfile
+        (напр. от параллельно работавшего Scanner'а).
+        wallTime - наибольшее из значений."""
+
+        for phase in range(len(PHASE_NAMES)):
+            self.phaseTimes[phase] += other.phaseTimes[phase]
+            self.phaseCounts[phase] += other.phaseCounts[phase]
+
+        for ext, ofmt in other.formats.items():
+            fmt = self.formats.get(ext)
+
+            if fmt is None:
+                self.formats[ext] = list(ofmt)
+            else:
+                for ix, v in enumerate(ofmt):
+                    fmt[ix] += v
+
+        for seconds, fpath in other.slowest:
+            self.__add_slow(seconds, fpath)
+
+        self.wallTime = max(self.wallTime, other.wallTime)
+
+    @property
+    def nFiles(self):
+        """Кол-во разобранных файлов."""
+
+        return sum(fmt[self.FMT_FILES] for fmt in self.formats.values())
+
+    @property
+    def bytesRead(self):
+        """Кол-во байт, прочитанных при разборе файлов."""
+
+        return sum(fmt[self.FMT_BYTES] for fmt in self.formats.values())
+
+    def get_slowest(self):
+        """Возвращает список кортежей вида (время разбора, путь к файлу),
+        начиная с самого медленного."""
+
+        return nlargest(len(self.slowest), self.slowest)
+
+    def get_report(self):
+        """Возвращает отчёт в виде списка строк (без символов
+        перевода строки)."""
+
+        r = ['Wall time: %.2f s' % self.wallTime,
+            '',
+            '%-8s %10s %10s %11s' % ('Phase', 'Time, s', 'Count', 'ms/item'),
+            ]
+
+        for phase, pname in enumerate(PHASE_NAMES):
+            n = self.phaseCounts[phase]
+
+            if not n and not self.phaseTimes[phase]:
+                continue
+
+            r.append('%-8s %10.3f %10d %11.3f  %s' % (pname,
+                self.phaseTimes[phase], n,
+                self.phaseTimes[phase] * 1000 / n if n else 0.0,
+                PHASE_HINTS[phase]))
+
+        nfiles = self.nFiles
+        nbytes = self.bytesRead
+
+        r.append('')
+        r.append('Bytes read: %d (%d per file)' % (nbytes, nbytes // nfiles if nfiles else 0))
+
+        if self.formats:
+            r.append('')
+            r.append('%-8s %10s %10s %10s %11s %14s' % ('Format', 'Files', 'Errors', 'Time, s', 'ms/file', 'Bytes'))
+
+            for ext, (n, nerrors, seconds, nbytes) in sorted(self.formats.items(), key=lambda i: -i[1][self.FMT_TIME]):
+                r.append('%-8s %10d %10d %10.3f %11.3f %14d' % (ext or '-',
+                    n, nerrors, seconds, seconds * 1000 / n, nbytes))
+
+        if self.slowest:
+            r.append('')
+            r.append('Slowest files:')
+
+            for seconds, fpath in self.get_slowest():
+                r.append('  %9.1f ms  %s' % (seconds * 1000, fpath))
+
+        return r
+
+    def to_dict(self):
+        """Возвращает счётчики в виде словаря (напр. для вывода в JSON)."""
+
+        return {'wallTime':round(self.wallTime, 6),
+            'phases':{pname:{'time':round(self.phaseTimes[phase], 6), 'count':self.phaseCounts[phase]}
+                for phase, pname in enumerate(PHASE_NAMES)},
+            'bytesRead':self.bytesRead,
+            'formats':{ext:{'files':n, 'errors':nerrors, 'time':round(seconds, 6), 'bytes':nbytes}
+                for ext, (n, nerrors, seconds, nbytes) in self.formats.items()},
+            'slowest':[{'path':fpath, 'time':round(seconds, 6)}
+                for seconds, fpath in self.get_slowest()]}
+
+
+if __name__ == '__main__':
+    print('[debugging %s]' % __file__)
+
+    profile = ScanProfile()
+
+    for name in profile.timed(os.listdir('.'), PH_LISTDIR):
+        profile.add_file(name, PH_PARSE, 0.001 * len(name), len(name), name.startswith('a'))
+
+    profile.wallTime = 1.0
+
+    print('\n'.join(profile.get_report()))
@@ -0,0 +1,1048 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" asresults.py
+
+    Copyright 2021 MC-6312
+
+    his file is part of AudioStat.
+
+    AudioStat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    AudioStat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with AudioStat.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+import os
+import os.path
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    # без NumPy всё то же самое считается в цикле по файлам
+    numpy = None
+
+from audiostat import *
+from asscanner import *
+
+
+def _clamp_unsigned(value, column):
+    """Приведение целого value к диапазону значений массива column
+    (array.array с беззнаковым типом элементов)."""
+
+    return min(max(value, 0), (1 << (8 * column.itemsize)) - 1)
+
+
+class ScanResults():
+    """Нефильтрованные результаты обхода каталога.
+
+    Экземпляр используется как sink для Scanner, работающего
+    с нефильтрующим ExtractionEngine (ffilter=None), и запоминает
+    параметры всех найденных аудиофайлов; после этого результаты
+    можно сколько угодно раз фильтровать в памяти (методы select(),
+    get_summary(), get_dir_rollups(), replay()),
+    не обращаясь к диску.
+
+    Параметры файлов хранятся не экземплярами AudioFileInfo,
+    а "по столбцам" - в массивах array.array, по элементу на файл;
+    lossy, resolution, tagsRead и наличие ошибки упакованы в байт флагов,
+    mimetype и расширение файла - номера в таблицах, имена файлов (в кодировке ФС)
+    сложены в один bytearray, а сообщения об ошибках (которых обычно
+    немного) - в отдельный словарь. На файл уходит несколько десятков
+    байт (в основном - на имя).
+
+    Если установлен NumPy, фильтрация и подсчёт статистики выполняются
+    над столбцами целиком, без цикла по файлам.
+
+    Файлы и каталоги идентифицируются номерами (индексами в массивах)
+    в порядке поступления; номер начального каталога - 0.
+
+    Повторно встреченные при обходе файлы и каталоги (см. Scanner.EV_DUPLICATE)
+    хранятся как файлы-ссылки с флагом FL_DUPLICATE и нулевыми параметрами;
+    select() их не выбирает, так что в статистике они не учитываются.
+
+    Результаты можно обновлять (см. aswatch): удалённые файлы и каталоги
+    только помечаются как удалённые (номера остальных не меняются),
+    изменённые файлы помечаются как удалённые и добавляются заново.
+
+    Поля:
+        rootdir     - строка, полный путь к начальному каталогу;
+                      пустая строка - результаты обхода нескольких
+                      каталогов (см. asscanner.MultiScanner), начальный
+                      каталог - "виртуальный", а его подкаталоги
+                      называются полными путями;
+        fileExts    - множество строк, расширения файлов, попавших
+                      в результаты;
+        fullParse   - булевское, True - файлы разбирались полностью
+                      (с тэгами и проверкой ошибок в метаданных),
+                      см. AudioFilterPlan;
+        nFiles      - целое, кол-во аудиофайлов в результатах
+                      (в т.ч. удалённых и ссылок на повторы);
+        nDirs       - целое, кол-во каталогов (в т.ч. пустых
+                      и удалённых)."""
+
+    # биты байта флагов
+    FL_LOSSY = 0x01
+    FL_ERROR = 0x02
+    FL_TAGSREAD = 0x04
+    # файл удалён (или заменён более новой записью)
+    FL_REMOVED = 0x08
+    # resolution + 1 (0 - None) в битах 4-5
+    FL_RES_SHIFT = 4
+    FL_RES_MASK = 0x30
+    # ссылка на уже пройденный файл или каталог (FL_DUPDIR)
+    FL_DUPLICATE = 0x40
+    FL_DUPDIR = 0x80
+
+    def __init__(self, rootdir, plan):
+        """Параметры:
+            rootdir - строка, путь к начальному каталогу
+                      или пустая строка (см. поле rootdir);
+            plan    - экземпляр AudioFilterPlan, которым пользуется
+                      ExtractionEngine при обходе."""
+
+        self.rootdir = os.path.abspath(rootdir) if rootdir else ''
+        self.fileExts = plan.fileExts
+        self.fullParse = plan.fullParse
+
+        #
+        # каталоги
+        #
+        # ключи - Scanner.dirId, значения - номера каталогов
+        self.__dirIxs = dict()
+        self.__dirNames = []
+        # номера родительских каталогов (-1 для начального)
+        self.dirParent = array('i')
+        # номера удалённых каталогов
+        self.removedDirs = set()
+        # ключи - полные пути, значения - номера каталогов;
+        # составляется при первом обращении (см. find_dir())
+        self.__dirsByPath = None
+
+        #
+        # файлы - по столбцам
+        #
+        self.fileDir = array('I')
+        # смещения имён файлов в __names (nFiles + 1 элементов)
+        self.__nameOffsets = array('Q', [0])
+        self.__names = bytearray()
+
+        self.sampleRate = array('I')
+        self.channels = array('H')
+        self.bitsPerSample = array('H')
+        self.bitRate = array('I')
+        self.missingTags = array('H')
+        self.flags = array('B')
+
+        self.mimeIx = array('B')
+        self.__mimes = []
+        self.__mimeIxs = dict()
+
+        # номер расширения файла в таблице __exts
+        self.extIx = array('B')
+        self.__exts = []
+        self.__extIxs = dict()
+
+        # ключи - номера файлов, значения - сообщения об ошибках
+        self.errors = dict()
+
+        # ключи - номера ссылок на каталоги (FL_DUPDIR), значения - полные
+        # пути, по которым каталоги были пройдены
+        self.duplicateOf = dict()
+
+        # списки номеров файлов по каталогам (см. __get_files_by_dir());
+        # сбрасывается при добавлении файлов
+        self.__filesByDir = None
+
+    @property
+    def nFiles(self):
+        return len(self.fileDir)
+
+    @property
+    def nDirs(self):
+        return len(self.dirParent)
+
+    def __call__(self, events):
+        self.add_events(events, self.__dirIxs)
+
+    def add_events(self, events, dirIxs, parentIx=-1):
+        """Добавление результатов обхода.
+
+        Параметры:
+            events      - список событий от Scanner;
+            dirIxs      - словарь, где ключи - Scanner.dirId,
+                          а значения - номера каталогов; пополняется
+                          по мере поступления событий EV_DIR_ENTER;
+            parentIx    - целое, номер каталога, в который следует
+                          поместить начальный каталог обхода
+                          (-1 - начальный каталог обхода является
+                          начальным каталогом результатов)."""
+
+        for event in events:
+            evtype = event[0]
+
+            if evtype == Scanner.EV_DIR_ENTER:
+                _, dirId, parentId, name, _ = event
+
+                dirIxs[dirId] = self.add_dir(parentIx if parentId is None else dirIxs[parentId], name)
+
+            elif evtype == Scanner.EV_FILE:
+                _, dirId, fname, nfo = event
+
+                self.add_file(dirIxs[dirId], fname, nfo)
+
+            elif evtype == Scanner.EV_DUPLICATE:
+                _, dirId, name, isDir, origPath = event
+
+                self.add_duplicate(dirIxs[dirId], name, isDir, origPath)
+
+    def add_dir(self, parentIx, name):
+        """Добавление каталога.
+
+        Параметры:
+            parentIx    - целое, номер родительского каталога
+                          (-1 для начального каталога);
+            name        - строка, имя каталога.
+
+        Возвращает номер каталога."""
+
+        dirIx = len(self.dirParent)
+
+        self.__dirNames.append(name)
+        self.dirParent.append(parentIx)
+
+        if self.__dirsByPath is not None:
+            self.__dirsByPath[self.get_dir_path(dirIx)] = dirIx
+
+        self.__filesByDir = None
+
+        return dirIx
+
+    def add_file(self, dirIx, fname, nfo):
+        """Добавление файла.
+
+        Параметры:
+            dirIx   - целое, номер каталога;
+            fname   - строка, имя файла;
+            nfo     - экземпляр AudioFileInfo."""
+
+        ix = len(self.fileDir)
+
+        # значения берутся из заголовков файлов как есть, так что
+        # испорченный заголовок может дать число, не влезающее в столбец;
+        # всё проверяем до того, как что-то добавлять, чтобы столбцы
+        # не разошлись по длине
+        params = [(column, _clamp_unsigned(value, column)) for column, value in
+            ((self.sampleRate, nfo.sampleRate),
+            (self.channels, nfo.channels),
+            (self.bitsPerSample, nfo.bitsPerSample),
+            (self.bitRate, nfo.bitRate),
+            (self.missingTags, nfo.missingTags))]
+
+        flags = 0
+        if nfo.lossy:
+            flags |= self.FL_LOSSY
+        if nfo.error:
+            flags |= self.FL_ERROR
+        if nfo.tagsRead:
+            flags |= self.FL_TAGSREAD
+        if nfo.resolution is not None:
+            flags |= (nfo.resolution + 1) << self.FL_RES_SHIFT
+
+        mix = self.__mimeIxs.get(nfo.mime)
+        if mix is None:
+            mix = len(self.__mimes)
+            self.__mimes.append(nfo.mime)
+            self.__mimeIxs[nfo.mime] = mix
+
+        ext = os.path.splitext(fname)[-1].lower()
+
+        eix = self.__extIxs.get(ext)
+        if eix is None:
+            eix = len(self.__exts)
+            self.__exts.append(ext)
+            self.__extIxs[ext] = eix
+
+        self.fileDir.append(dirIx)
+
+        self.__names += os.fsencode(fname)
+        self.__nameOffsets.append(len(self.__names))
+
+        for column, value in params:
+            column.append(value)
+
+        if nfo.error:
+            self.errors[ix] = nfo.error
+
+        self.flags.append(flags)
+        self.mimeIx.append(mix)
+        self.extIx.append(eix)
+
+        self.__filesByDir = None
+
+    def add_duplicate(self, dirIx, name, isDir, origPath):
+        """Добавление ссылки на повторно встреченный файл или каталог.
+
+        Параметры:
+            dirIx       - целое, номер каталога;
+            name        - строка, имя файла или каталога;
+            isDir       - булевское, True - каталог;
+            origPath    - None или строка, полный путь, по которому
+                          файл или каталог был пройден ранее."""
+
+        ix = self.nFiles
+
+        self.add_file(dirIx, name, AudioFileInfo())
+
+        self.flags[ix] = self.FL_DUPLICATE | (self.FL_DUPDIR if isDir else 0)
+
+        if origPath is not None:
+            self.duplicateOf[ix] = origPath
+
+    def is_duplicate(self, ix):
+        return bool(self.flags[ix] & self.FL_DUPLICATE)
+
+    def get_file_name(self, ix):
+        """Возвращает имя файла номер ix."""
+
+        return os.fsdecode(bytes(self.__names[self.__nameOffsets[ix]:self.__nameOffsets[ix + 1]]))
+
+    def get_dir_name(self, dirIx):
+        """Возвращает имя каталога номер dirIx."""
+
+        return self.__dirNames[dirIx]
+
+    def get_dir_path(self, dirIx):
+        """Возвращает полный путь к каталогу номер dirIx."""
+
+        names = []
+
+        while dirIx > 0:
+            names.append(self.__dirNames[dirIx])
+            dirIx = self.dirParent[dirIx]
+
+        return os.path.join(self.rootdir, *reversed(names))
+
+    def get_file_path(self, ix):
+        """Возвращает полный путь к файлу номер ix."""
+
+        return os.path.join(self.get_dir_path(self.fileDir[ix]), self.get_file_name(ix))
+
+    def get_file_info(self, ix, nfo=None):
+        """Возвращает экземпляр AudioFileInfo с параметрами файла номер ix.
+
+        Параметры:
+            ix  - целое, номер файла;
+            nfo - None или экземпляр AudioFileInfo, который следует
+                  заполнить вместо создания нового (напр. для
+                  фильтрации множества файлов)."""
+
+        if nfo is None:
+            nfo = AudioFileInfo()
+
+        flags = self.flags[ix]
+
+        nfo.mime = self.__mimes[self.mimeIx[ix]]
+        nfo.sampleRate = self.sampleRate[ix]
+        nfo.channels = self.channels[ix]
+        nfo.bitsPerSample = self.bitsPerSample[ix]
+        nfo.bitRate = self.bitRate[ix]
+        nfo.missingTags = self.missingTags[ix]
+        nfo.error = self.errors.get(ix) if flags & self.FL_ERROR else None
+        nfo.tagsRead = bool(flags & self.FL_TAGSREAD)
+
+        nfo.lossy = bool(flags & self.FL_LOSSY)
+
+        res = (flags & self.FL_RES_MASK) >> self.FL_RES_SHIFT
+        nfo.resolution = None if res == 0 else res - 1
+
+        return nfo
+
+    def __get_files_by_dir(self):
+        """Возвращает кортеж из двух массивов: номера файлов,
+        упорядоченные по каталогам, и смещения начала списка файлов
+        каждого каталога в первом массиве (nDirs + 1 элементов).
+        Раскладка считается один раз (сортировкой подсчётом)."""
+
+        if self.__filesByDir is None:
+            starts = array('Q', [0]) * (self.nDirs + 1)
+
+            for dirIx in self.fileDir:
+                starts[dirIx + 1] += 1
+
+            for i in range(self.nDirs):
+                starts[i + 1] += starts[i]
+
+            pos = array('Q', starts)
+            order = array('I', [0]) * self.nFiles
+
+            for ix, dirIx in enumerate(self.fileDir):
+                order[pos[dirIx]] = ix
+                pos[dirIx] += 1
+
+            self.__filesByDir = (order, starts)
+
+        return self.__filesByDir
+
+    def get_dir_files(self, dirIx):
+        """Возвращает последовательность номеров файлов каталога dirIx."""
+
+        order, starts = self.__get_files_by_dir()
+
+        return order[starts[dirIx]:starts[dirIx + 1]]
+
+    def get_subdirs(self):
+        """Возвращает список списков номеров подкаталогов
+        (индекс во внешнем списке - номер каталога).
+        Удалённые каталоги в списки не попадают."""
+
+        subdirs = [[] for _ in range(self.nDirs)]
+
+        for dirIx in range(1, self.nDirs):
+            if dirIx not in self.removedDirs:
+                subdirs[self.dirParent[dirIx]].append(dirIx)
+
+        return subdirs
+
+    def find_dir(self, path):
+        """Возвращает номер (не удалённого) каталога с полным путём path
+        или None."""
+
+        if self.__dirsByPath is None:
+            self.__dirsByPath = {self.get_dir_path(dirIx):dirIx
+                for dirIx in range(self.nDirs) if dirIx not in self.removedDirs}
+
+        return self.__dirsByPath.get(path)
+
+    def find_file(self, path):
+        """Возвращает номер (не удалённого) файла с полным путём path
+        или None."""
+
+        fdir, fname = os.path.split(path)
+
+        dirIx = self.find_dir(fdir)
+
+        if dirIx is not None:
+            for ix in self.get_dir_files(dirIx):
+                if not self.flags[ix] & self.FL_REMOVED and self.get_file_name(ix) == fname:
+                    return ix
+
+    def remove_file(self, ix):
+        """Пометка файла номер ix как удалённого."""
+
+        self.flags[ix] |= self.FL_REMOVED
+
+    def remove_dir(self, dirIx):
+        """Пометка каталога номер dirIx (вместе со всем содержимым)
+        как удалённого. Начальный каталог удалить нельзя - удаляется
+        только его содержимое."""
+
+        subdirs = self.get_subdirs()
+
+        stack = [dirIx]
+
+        while stack:
+            ix = stack.pop()
+
+            for fix in self.get_dir_files(ix):
+                self.flags[fix] |= self.FL_REMOVED
+
+            stack += subdirs[ix]
+
+            if ix > 0:
+                self.removedDirs.add(ix)
+
+                if self.__dirsByPath is not None:
+                    self.__dirsByPath.pop(self.get_dir_path(ix), None)
+
+    def remove_path(self, path):
+        """Пометка файла или каталога с полным путём path как удалённого.
+        Возвращает True, если что-то было удалено."""
+
+        dirIx = self.find_dir(path)
+
+        if dirIx is not None:
+            self.remove_dir(dirIx)
+            return True
+
+        ix = self.find_file(path)
+
+        if ix is not None:
+            self.remove_file(ix)
+            return True
+
+        return False
+
+    def update_file(self, path, nfo):
+        """Замена параметров файла с полным путём path.
+
+        Параметры:
+            path    - строка, полный путь к файлу; каталог должен
+                      быть в результатах;
+            nfo     - экземпляр AudioFileInfo или None, если файл
+                      больше не является аудиофайлом (или исчез).
+
+        Возвращает номер новой записи о файле или None."""
+
+        self.remove_path(path)
+
+        if nfo is not None:
+            fdir, fname = os.path.split(path)
+
+            dirIx = self.find_dir(fdir)
+
+            if dirIx is not None:
+                self.add_file(dirIx, fname, nfo)
+
+                return self.nFiles - 1
+
+    def __np_column(self, col):
+        """Возвращает numpy.ndarray - представление столбца col
+        (экземпляра array.array) без копирования данных."""
+
+        return numpy.frombuffer(col, dtype=col.typecode) if len(col) else numpy.zeros(0, dtype=col.typecode)
+
+    def __ext_allowed(self, plan):
+        """Возвращает None, если plan не отбрасывает файлов по типам,
+        иначе - bytearray, где для каждого номера расширения
+        (см. extIx) 1 - расширение допустимо."""
+
+        if plan.fileExts >= self.fileExts:
+            return
+
+        return bytearray(ext in plan.fileExts for ext in self.__exts)
+
+    def select(self, plan):
+        """Фильтрация результатов в памяти.
+
+        Параметры:
+            plan    - экземпляр AudioFilterPlan.
+
+        Возвращает последовательность (numpy.ndarray, если есть NumPy,
+        иначе array.array) номеров файлов, прошедших фильтрацию,
+        в порядке возрастания."""
+
+        extAllowed = self.__ext_allowed(plan)
+
+        if numpy is None:
+            selected = array('I')
+
+            nfo = AudioFileInfo()
+
+            for ix in range(self.nFiles):
+                if self.flags[ix] & (self.FL_REMOVED | self.FL_DUPLICATE):
+                    continue
+
+                if extAllowed is not None and not extAllowed[self.extIx[ix]]:
+                    continue
+
+                if plan.filter_file_info(self.get_file_info(ix, nfo)):
+                    selected.append(ix)
+
+            return selected
+
+        #
+        # то же самое, но над столбцами целиком
+        #
+        flags = self.__np_column(self.flags)
+        sampleRate = self.__np_column(self.sampleRate)
+        channels = self.__np_column(self.channels)
+        bitsPerSample = self.__np_column(self.bitsPerSample)
+        bitRate = self.__np_column(self.bitRate)
+
+        errors = (flags & self.FL_ERROR) != 0
+
+        mask = ~errors
+
+        for cr, v in plan.criteria:
+            if cr == AudioFilterPlan.CR_ONLY_ERRORS:
+                mask[:] = False
+            elif cr == AudioFilterPlan.CR_STREAM_PARAMETERS:
+                mask &= ((sampleRate > 0) | (channels > 0) | (bitsPerSample > 0) | (bitRate > 0)) == v
+            elif cr == AudioFilterPlan.CR_LOSSLESS:
+                mask &= (flags & self.FL_LOSSY) == 0
+            elif cr == AudioFilterPlan.CR_RESOLUTION:
+                mask &= (flags & self.FL_RES_MASK) == ((v + 1) << self.FL_RES_SHIFT)
+            elif cr == AudioFilterPlan.CR_MAX_BITRATE:
+                mask &= bitRate <= v
+            elif cr == AudioFilterPlan.CR_MIN_BITRATE:
+                mask &= bitRate >= v
+            elif cr == AudioFilterPlan.CR_MISSING_TAGS:
+                mask &= (self.__np_column(self.missingTags) != 0) == v
+
+        if plan.passErrors:
+            mask |= errors
+
+        mask &= (flags & (self.FL_REMOVED | self.FL_DUPLICATE)) == 0
+
+        if extAllowed is not None:
+            mask &= numpy.frombuffer(bytes(extAllowed), dtype=numpy.uint8)[self.__np_column(self.extIx)] != 0
+
+        return numpy.flatnonzero(mask).astype(numpy.uint32)
+
+    def get_selection_mask(self, selected):
+        """Возвращает bytearray длиной nFiles, где 1 - файл есть
+        в последовательности selected (см. select())."""
+
+        if numpy is None:
+            mask = bytearray(self.nFiles)
+
+            for ix in selected:
+                mask[ix] = 1
+
+            return mask
+
+        mask = numpy.zeros(self.nFiles, dtype=numpy.uint8)
+        mask[numpy.asarray(selected, dtype=numpy.intp)] = 1
+
+        return bytearray(mask)
+
+    def can_filter(self, ffilter, headerOnly=False):
+        """Возвращает True, если результаты можно отфильтровать
+        с параметрами ffilter (экземпляр AudioFileFilter), т.е.
+        в них есть всё нужное фильтру.
+
+        Параметры:
+            ffilter     - экземпляр AudioFileFilter;
+            headerOnly  - булевское, см. AudioFilterPlan."""
+
+        if not self.nDirs:
+            return False
+
+        plan = ffilter.compile(headerOnly)
+
+        return plan.fileExts <= self.fileExts and (self.fullParse or not plan.fullParse)
+
+    def get_summary(self, selected):
+        """Подсчёт суммарной статистики.
+
+        Параметры:
+            selected    - последовательность номеров файлов
+                          (напр. полученная от select()).
+
+        Возвращает экземпляр AudioSummary."""
+
+        summary = AudioSummary()
+
+        if numpy is None:
+            nfo = AudioFileInfo()
+
+            for ix in selected:
+                summary.update_from_file(self.get_file_info(ix, nfo))
+
+            return summary
+
+        sel = numpy.asarray(selected, dtype=numpy.intp)
+
+        flags = self.__np_column(self.flags)[sel]
+        errors = (flags & self.FL_ERROR) != 0
+
+        ok = sel[~errors]
+        flags = flags[~errors]
+
+        summary.nAudioFiles = len(ok)
+        summary.totals[summary.TS_WITH_ERRORS] = int(numpy.count_nonzero(errors))
+
+        def __counts(values):
+            keys, counts = numpy.unique(values, return_counts=True)
+            return dict(zip(keys.tolist(), counts.tolist()))
+
+        summary.sampleRates = __counts(self.__np_column(self.sampleRate)[ok])
+        summary.bitsPerSample = __counts(self.__np_column(self.bitsPerSample)[ok])
+
+        # диапазоны битрейта; 0 (неизвестный битрейт) так и остаётся нулём
+        bitRate = self.__np_column(self.bitRate)[ok]
+        buckets = numpy.array(summary.BITRATE_BUCKETS, dtype=numpy.uint32)
+        bucketed = buckets[numpy.maximum(numpy.searchsorted(buckets, bitRate, side='right') - 1, 0)]
+        bucketed[bitRate == 0] = 0
+        summary.bitRates = __counts(bucketed)
+
+        resCounts = numpy.bincount((flags & self.FL_RES_MASK) >> self.FL_RES_SHIFT,
+            minlength=len(summary.TS_BY_RES) + 1)
+
+        for res, name in enumerate(summary.TS_BY_RES, 1):
+            summary.totals[name] = int(resCounts[res])
+
+        summary.totals[summary.TS_LOSSY] = int(numpy.count_nonzero(flags & self.FL_LOSSY))
+        summary.totals[summary.TS_MISTAGS] = int(numpy.count_nonzero(self.__np_column(self.missingTags)[ok]))
+
+        return summary
+
+    def get_dir_rollups(self, selected):
+        """Подсчёт статистики по каталогам.
+
+        Параметры:
+            selected    - последовательность номеров файлов
+                          (напр. полученная от select()).
+
+        Возвращает список экземпляров AudioDirectoryInfo (индекс в списке -
+        номер каталога), с учётом подкаталогов, после flush() -
+        т.е. то же, что получается у Scanner при обходе."""
+
+        dirinfos = [AudioDirectoryInfo() for _ in range(self.nDirs)]
+
+        if numpy is None:
+            nfo = AudioFileInfo()
+
+            for ix in selected:
+                dirinfos[self.fileDir[ix]].update_from_file(self.get_file_info(ix, nfo))
+        else:
+            sel = numpy.asarray(selected, dtype=numpy.intp)
+
+            fileDir = self.__np_column(self.fileDir)[sel]
+            errors = (self.__np_column(self.flags)[sel] & self.FL_ERROR) != 0
+
+            nFiles = numpy.bincount(fileDir, minlength=self.nDirs).tolist()
+            nErrors = numpy.bincount(fileDir[errors], minlength=self.nDirs).tolist()
+
+            # файлы без ошибок, сгруппированные по каталогам
+            ok = sel[~errors]
+            okDir = fileDir[~errors]
+
+            order = numpy.argsort(okDir, kind='stable')
+            ok = ok[order]
+
+            dirs, starts = numpy.unique(okDir[order], return_index=True)
+
+            if len(dirs):
+                def __minmax(col):
+                    values = self.__np_column(col)[ok]
+                    return (numpy.minimum.reduceat(values, starts).tolist(),
+                            numpy.maximum.reduceat(values, starts).tolist())
+
+                sampleRates = __minmax(self.sampleRate)
+                channels = __minmax(self.channels)
+                bitsPerSample = __minmax(self.bitsPerSample)
+                bitRates = __minmax(self.bitRate)
+
+                lossy = numpy.bitwise_or.reduceat(self.__np_column(self.flags)[ok] & self.FL_LOSSY, starts).tolist()
+                missingTags = numpy.bitwise_or.reduceat(self.__np_column(self.missingTags)[ok], starts).tolist()
+
+                for i, dirIx in enumerate(dirs.tolist()):
+                    dirinfo = dirinfos[dirIx]
+
+                    dirinfo.minInfo.sampleRate, dirinfo.maxInfo.sampleRate = sampleRates[0][i], sampleRates[1][i]
+                    dirinfo.minInfo.channels, dirinfo.maxInfo.channels = channels[0][i], channels[1][i]
+                    dirinfo.minInfo.bitsPerSample, dirinfo.maxInfo.bitsPerSample = bitsPerSample[0][i], bitsPerSample[1][i]
+                    dirinfo.minInfo.bitRate, dirinfo.maxInfo.bitRate = bitRates[0][i], bitRates[1][i]
+
+                    dirinfo.minInfo.lossy = bool(lossy[i])
+                    dirinfo.minInfo.missingTags = missingTags[i]
+
+            for dirIx, dirinfo in enumerate(dirinfos):
+                dirinfo.nFiles = nFiles[dirIx]
+                dirinfo.nErrors = nErrors[dirIx]
+
+        # подкаталоги всегда имеют номера больше родительских,
+        # так что при обходе с конца они учитываются раньше
+        for dirIx in range(self.nDirs - 1, -1, -1):
+            dirinfo = dirinfos[dirIx]
+            dirinfo.flush()
+
+            if dirIx > 0 and dirinfo.nFiles:
+                dirinfos[self.dirParent[dirIx]].update_from_dir(dirinfo)
+
+        return dirinfos
+
+    def replay(self, selected, sink, batchSize=0):
+        """Выдача отфильтрованных результатов в виде событий.
+
+        Параметры:
+            selected    - последовательность номеров файлов
+                          (напр. полученная от select());
+            sink        - функция с одним параметром - списком событий
+                          (таких же, как у Scanner, но вместо Scanner.dirId -
+                          номера каталогов);
+            batchSize   - целое, наибольшее кол-во событий в пачке;
+                          0 - все события отдаются одной пачкой.
+
+        Возвращает экземпляр AudioDirectoryInfo для начального каталога."""
+
+        dirinfos = self.get_dir_rollups(selected)
+
+        isSelected = self.get_selection_mask(selected)
+
+        subdirs = self.get_subdirs()
+
+        events = []
+
+        def __flush():
+            if batchSize and len(events) >= batchSize:
+                sink(events[:])
+                events.clear()
+
+        def __enter_dir(dirIx, parentIx):
+            events.append((Scanner.EV_DIR_ENTER, dirIx,
+                None if parentIx < 0 else parentIx,
+                self.__dirNames[dirIx], self.get_dir_path(dirIx)))
+
+            for ix in self.get_dir_files(dirIx):
+                if isSelected[ix]:
+                    events.append((Scanner.EV_FILE, dirIx, self.get_file_name(ix), self.get_file_info(ix)))
+                elif self.flags[ix] & self.FL_DUPLICATE and not self.flags[ix] & self.FL_REMOVED:
+                    events.append((Scanner.EV_DUPLICATE, dirIx, self.get_file_name(ix),
+                        bool(self.flags[ix] & self.FL_DUPDIR), self.duplicateOf.get(ix)))
+
+                __flush()
+
+        # стек кортежей вида (номер каталога, итератор по подкаталогам)
+        __enter_dir(0, -1)
+        stack = [(0, iter(subdirs[0]))]
+
+        while stack:
+            dirIx, itr = stack[-1]
+
+            subIx = next(itr, None)
+
+            if subIx is None:
+                stack.pop()
+
+                events.append((Scanner.EV_DIR_DONE, dirIx, dirinfos[dirIx]))
+                __flush()
+            else:
+                __enter_dir(subIx, dirIx)
+                stack.append((subIx, iter(subdirs[subIx])))
+
+        if events:
+            sink(events)
+
+        return dirinfos[0]
+
+
+class ResultsTree():
+    """Отфильтрованные результаты обхода в виде дерева,
+    узлы которого строятся по мере надобности.
+
+    Узлы дерева - целые числа: (номер каталога << 1) для каталогов,
+    (номер файла << 1) | 1 для файлов; корень дерева (ROOT) -
+    начальный каталог. Дочерние узлы каталога - непустые (после
+    фильтрации) подкаталоги, прошедшие фильтрацию файлы и ссылки
+    на повторно встреченные файлы и каталоги (ScanResults.FL_DUPLICATE;
+    узлы-файлы), упорядоченные по именам; список дочерних узлов составляется
+    при первом обращении к нему, так что стоимость отображения
+    дерева зависит от кол-ва развёрнутых каталогов, а не от
+    общего кол-ва файлов.
+
+    Поля:
+        results         - экземпляр ScanResults;
+        dirinfos        - список экземпляров AudioDirectoryInfo
+                          (см. ScanResults.get_dir_rollups());
+        sortKey         - целое, SORT_*, порядок дочерних узлов;
+        sortDescending  - булевское, True - сортировка по убыванию."""
+
+    ROOT = 0
+
+    SORT_NAME, SORT_SAMPLERATE, SORT_CHANNELS, SORT_BITSPERSAMPLE,\
+    SORT_BITRATE = range(5)
+
+    # индекс - SORT_*, значения - имена полей AudioStreamInfo
+    # и соотв. столбцов ScanResults
+    __SORT_FIELDS = (None, 'sampleRate', 'channels', 'bitsPerSample', 'bitRate')
+
+    def __init__(self, results, selected):
+        """Параметры:
+            results     - экземпляр ScanResults;
+            selected    - последовательность номеров файлов
+                          (напр. полученная от ScanResults.select())."""
+
+        self.results = results
+        self.dirinfos = results.get_dir_rollups(selected)
+
+        self.__isSelected = results.get_selection_mask(selected)
+        self.__subdirs = results.get_subdirs()
+
+        self.sortKey = self.SORT_NAME
+        self.sortDescending = False
+
+        self.__reset_children()
+
+    def __reset_children(self):
+        # ключи - узлы-каталоги, значения - массивы дочерних узлов
+        self.__children = dict()
+        # положение каталога в списке дочерних узлов родительского каталога
+        self.__dirPositions = array('i', [-1]) * self.results.nDirs
+
+    def set_sort(self, sortKey, descending=False):
+        """Смена порядка дочерних узлов.
+        Составленные ранее списки дочерних узлов при этом сбрасываются.
+
+        Параметры:
+            sortKey     - целое, SORT_*;
+            descending  - булевское, True - сортировка по убыванию.
+
+        Каталоги сортируются по минимальным, затем - по максимальным
+        значениям параметров, при равенстве параметров - по именам."""
+
+        self.sortKey = sortKey
+        self.sortDescending = descending
+
+        self.__reset_children()
+
+    @staticmethod
+    def is_dir(node):
+        return not node & 1
+
+    def __is_visible(self, ix):
+        """Возвращает True, если файл номер ix следует показывать."""
+
+        return self.__isSelected[ix]\
+            or self.results.flags[ix] & (ScanResults.FL_DUPLICATE | ScanResults.FL_REMOVED) == ScanResults.FL_DUPLICATE
+
+    def is_duplicate(self, node):
+        """Возвращает True, если узел node - ссылка на повторно
+        встреченный файл или каталог."""
+
+        return bool(node & 1) and self.results.is_duplicate(node >> 1)
+
+    def get_duplicate_of(self, node):
+        """Возвращает полный путь, по которому был пройден каталог,
+        на который ссылается узел node, или None, если он неизвестен."""
+
+        return self.results.duplicateOf.get(node >> 1)
+
+    def get_children(self, node):
+        """Возвращает последовательность дочерних узлов узла node."""
+
+        if node & 1:
+            return ()
+
+        children = self.__children.get(node)
+
+        if children is None:
+            dirIx = node >> 1
+
+            field = self.__SORT_FIELDS[self.sortKey]
+
+            if field is None:
+                keys = [(self.results.get_dir_name(subIx).casefold(), subIx << 1)
+                    for subIx in self.__subdirs[dirIx] if self.dirinfos[subIx].nFiles]
+
+                keys += [(self.results.get_file_name(ix).casefold(), (ix << 1) | 1)
+                    for ix in self.results.get_dir_files(dirIx) if self.__is_visible(ix)]
+            else:
+                keys = []
+
+                for subIx in self.__subdirs[dirIx]:
+                    dirinfo = self.dirinfos[subIx]
+
+                    if dirinfo.nFiles:
+                        keys.append((getattr(dirinfo.minInfo, field),
+                            getattr(dirinfo.maxInfo, field),
+                            self.results.get_dir_name(subIx).casefold(), subIx << 1))
+
+                column = getattr(self.results, field)
+
+                for ix in self.results.get_dir_files(dirIx):
+                    if self.__is_visible(ix):
+                        v = column[ix]
+                        keys.append((v, v, self.results.get_file_name(ix).casefold(), (ix << 1) | 1))
+
+            keys.sort(reverse=self.sortDescending)
+
+            children = array('Q', (key[-1] for key in keys))
+
+            for pos, child in enumerate(children):
+                if not child & 1:
+                    self.__dirPositions[child >> 1] = pos
+
+            self.__children[node] = children
+
+        return children
+
+    def has_children(self, node):
+        """Возвращает True, если у узла node есть дочерние узлы
+        (список дочерних узлов при этом не составляется)."""
+
+        return not node & 1 and self.dirinfos[node >> 1].nFiles > 0
+
+    def get_parent(self, node):
+        """Возвращает родительский узел узла node
+        (для ROOT - None)."""
+
+        if node & 1:
+            return self.results.fileDir[node >> 1] << 1
+
+        if node == self.ROOT:
+            return
+
+        return self.results.dirParent[node >> 1] << 1
+
+    def get_dir_position(self, node):
+        """Возвращает положение узла-каталога node в списке дочерних
+        узлов родительского каталога (список к этому времени
+        уже должен быть составлен)."""
+
+        return self.__dirPositions[node >> 1]
+
+    def get_dir_indices(self, node):
+        """Возвращает список положений узла-каталога node и его
+        родительских каталогов (кроме ROOT) в списках дочерних узлов,
+        начиная с верхнего уровня (т.е. то, из чего состоит
+        Gtk.TreePath). Недостающие списки дочерних узлов
+        при этом составляются."""
+
+        indices = []
+
+        while node != self.ROOT:
+            parent = self.get_parent(node)
+            self.get_children(parent)
+
+            indices.append(self.__dirPositions[node >> 1])
+            node = parent
+
+        indices.reverse()
+
+        return indices
+
+    def get_name(self, node):
+        if node & 1:
+            return self.results.get_file_name(node >> 1)
+
+        return self.results.get_dir_name(node >> 1)
+
+    def get_path(self, node):
+        """Возвращает полный путь к файлу или каталогу."""
+
+        if node & 1:
+            return self.results.get_file_path(node >> 1)
+
+        return self.results.get_dir_path(node >> 1)
+
+    def get_info(self, node, nfo=None):
+        """Возвращает экземпляр AudioFileInfo для узла-файла
+        (см. ScanResults.get_file_info()) или экземпляр
+        AudioDirectoryInfo для узла-каталога."""
+
+        if node & 1:
+            return self.results.get_file_info(node >> 1, nfo)
+
+        return self.dirinfos[node >> 1]
+
+if __name__ == '__main__':
+    print('[debugging %s]' % __file__)
+
+    import sys
+    from asengine import *
+
+    with ExtractionEngine(None, 0) as engine:
+        results = ScanResults(sys.argv[1] if len(sys.argv) > 1 else '.', engine.plan)
+        Scanner(engine, results).scan(results.rootdir)
+
+    size = sum(len(a) * a.itemsize for a in (results.fileDir,
+        results.sampleRate, results.channels, results.bitsPerSample,
+        results.bitRate, results.missingTags, results.flags, results.mimeIx,
+        results.extIx))
+    # имена файлов со смещениями
+    size += len(results._ScanResults__names) + len(results._ScanResults__nameOffsets) * 8
+
+    print('%d files, %d directories, ~%d bytes/file' % (results.nFiles, results.nDirs,
+        size // max(1, results.nFiles)))
@@ -0,0 +1,855 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" asscanner.py
+
+    Copyright 2021 MC-6312
+
+    his file is part of AudioStat.
+
+    AudioStat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    AudioStat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with AudioStat.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+import os.path
+import threading
+from itertools import count
+from time import monotonic
+
+from audiostat import *
+from aswalker import *
+from asiosched import *
+from asprofile import *
+
+
+class Scanner():
+    """Обход каталога со сбором метаданных аудиофайлов.
+
+    Ничего не знает о GUI и предназначен для работы в фоновом потоке:
+    результаты отдаются получателю (sink) пачками событий не чаще,
+    чем раз в BATCH_INTERVAL секунд.
+
+    События - кортежи, первый элемент которых - EV_*:
+        (EV_DIR_ENTER, dirId, parentId, name, path)
+            начат обход каталога; dirId - целое, уникальный номер
+            каталога, parentId - номер родительского каталога
+            (None для начального каталога), name - имя каталога,
+            path - полный путь;
+        (EV_FILE, dirId, fname, nfo)
+            файл fname в каталоге dirId прошёл фильтрацию;
+            nfo - экземпляр AudioFileInfo;
+        (EV_DIR_DONE, dirId, dirinfo)
+            обход каталога завершён; dirinfo - экземпляр AudioDirectoryInfo;
+            если dirinfo.nFiles == 0 - каталог можно не отображать;
+        (EV_DUPLICATE, dirId, name, isDir, origPath)
+            элемент name каталога dirId - уже пройденный (под другим
+            именем) каталог (isDir == True; origPath - полный путь,
+            по которому он был пройден) или аудиофайл (isDir == False;
+            origPath == None - исходный путь файла не запоминается);
+            повторно такие элементы не обходятся и не разбираются.
+
+    Повторы отслеживаются по парам (st_dev, st_ino) (см. aswalker.InodeSet),
+    так что зацикленные символьные ссылки, жёсткие ссылки и каталоги,
+    смонтированные в дерево повторно, учитываются по одному разу.
+    Переход по символьным ссылкам определяется параметром symlinks
+    (см. aswalker.walk_directory()).
+
+    Несколько экземпляров Scanner, работающих одновременно (см. MultiScanner),
+    могут пользоваться общими счётчиком номеров каталогов (dirIds)
+    и множеством пройденных каталогов и файлов (visited).
+
+    Если у engine задан порядок разбора файлов (engine.ioOrder)
+    и engine.ioWindow > 0, файлы не отдаются engine по каталогам:
+    пройденные каталоги накапливаются, пока в них не наберётся
+    engine.ioWindow файлов, после чего файлы всех накопленных каталогов
+    разбираются вместе (в порядке расположения на диске), а события
+    EV_DIR_DONE для этих каталогов отправляются после их разбора
+    (по-прежнему раньше, чем для родительских каталогов).
+
+    Если skipUnchanged == True и у engine есть кэш метаданных,
+    содержимое прочитанных каталогов запоминается в кэше; при следующем
+    обходе каталог, время изменения которого с тех пор не менялось,
+    не читается - список файлов и подкаталогов и параметры файлов
+    берутся из кэша, так что для неизменившегося дерева обращения
+    к ФС сводятся к os.stat() каталогов и аудиофайлов (файлы,
+    изменившиеся "на месте" без изменения времени изменения
+    каталога, при этом замечаются и разбираются заново).
+    Сводка AudioDirectoryInfo при этом всё равно собирается заново
+    из параметров файлов - фильтр от обхода к обходу может меняться,
+    да и события EV_FILE нужны получателю в любом случае.
+
+    Поля:
+        engine          - экземпляр asengine.ExtractionEngine;
+        sink            - функция с одним параметром - списком событий;
+        skipUnchanged   - булевское, см. выше;
+        symlinks        - aswalker.SYMLINKS_*;
+        nFiles          - целое, кол-во найденных файлов (всех);
+        nAudioFiles     - целое, кол-во аудиофайлов, прошедших фильтрацию;
+        nErrors         - целое, кол-во файлов с ошибками метаданных;
+        nSkippedDirs    - целое, кол-во каталогов, содержимое которых
+                          взято из кэша;
+        nUnreadableDirs - целое, кол-во каталогов, которые не удалось
+                          прочитать (см. aswalker.WALK_DIR_ERROR);
+        nDuplicates     - целое, кол-во повторно встреченных аудиофайлов
+                          и каталогов;
+        nParsedFiles    - целое, кол-во разобранных файлов (без взятых
+                          из кэша), только для чтения;
+        ioWaitTime      - вещественное, суммарное время ожидания
+                          ввода-вывода при разборе файлов (в секундах),
+                          только для чтения (см. asengine.ExtractionEngine);
+        nBytesRead      - целое, кол-во байт, прочитанных при разборе
+                          файлов, только для чтения
+                          (см. asengine.ExtractionEngine.bytesRead);
+        profile         - экземпляр asprofile.ScanProfile, только
+                          для чтения: engine.profile, куда Scanner
+                          добавляет время чтения каталогов, stat()
+                          каталогов, работы с кэшем содержимого
+                          каталогов, передачи событий получателю
+                          и общее время обхода (wallTime, суммируется
+                          по вызовам scan())."""
+
+    EV_DIR_ENTER, EV_FILE, EV_DIR_DONE, EV_DUPLICATE = range(4)
+
+    # интервал (в секундах) между отправками пачек событий получателю
+    BATCH_INTERVAL = 0.05
+
+    # максимальное кол-во файлов, отдаваемых ExtractionEngine за раз
+    FILES_CHUNK = 1024
+
+    def __init__(self, engine, sink, skipUnchanged=False, symlinks=SYMLINKS_FOLLOW,
+            dirIds=None, visited=None):
+        """Параметры:
+            engine, sink,
+            skipUnchanged,
+            symlinks        - см. соответствующие поля;
+            dirIds          - None или итератор, выдающий номера каталогов
+                              (напр. itertools.count());
+            visited         - None или экземпляр aswalker.InodeSet,
+                              общий для всех вызовов scan();
+                              None - для каждого обхода создаётся новый."""
+
+        self.engine = engine
+        self.sink = sink
+        self.skipUnchanged = skipUnchanged
+        self.symlinks = symlinks
+
+        self.nFiles = 0
+        self.nAudioFiles = 0
+        self.nErrors = 0
+        self.nSkippedDirs = 0
+        self.nUnreadableDirs = 0
+        self.nDuplicates = 0
+
+        self.__stopEvent = threading.Event()
+
+        self.__batch = []
+        self.__lastFlush = 0.0
+        self.__dirIds = count() if dirIds is None else dirIds
+
+        # стек экземпляров _ScanDirectory - каталогов, обход которых не завершён
+        self.__stack = []
+        # пройденные, но ещё не разобранные каталоги (см. engine.ioWindow) -
+        # кортежи вида (экземпляр _ScanDirectory, путь, экземпляр
+        # _ScanDirectory родительского каталога или None)
+        self.__leftDirs = []
+        self.__nLeftFiles = 0
+        # уже пройденные каталоги и файлы
+        self.__sharedVisited = visited
+        self.__visited = None
+        self.__rootdir = None
+
+    nParsedFiles = property(lambda self: self.engine.nParsed)
+    ioWaitTime = property(lambda self: self.engine.waitTime)
+    nBytesRead = property(lambda self: self.engine.bytesRead)
+    profile = property(lambda self: self.engine.profile)
+
+    def stop(self):
+        """Прерывание обхода. Может вызываться из любого потока."""
+
+        self.__stopEvent.set()
+
+    def is_stopped(self):
+        return self.__stopEvent.is_set()
+
+    def __post(self, event):
+        self.__batch.append(event)
+
+        if monotonic() - self.__lastFlush >= self.BATCH_INTERVAL:
+            self.__flush()
+
+    def __flush(self):
+        self.__lastFlush = monotonic()
+
+        if self.__batch:
+            batch = self.__batch
+            self.__batch = []
+            self.sink(batch)
+
+            self.engine.profile.add_since(PH_SINK, self.__lastFlush)
+
+    def __add_file(self, sdir, fname, nfo):
+        if nfo.error:
+            self.nErrors += 1
+        else:
+            self.nAudioFiles += 1
+
+        self.__post((self.EV_FILE, sdir.dirId, fname, nfo))
+
+        sdir.dirinfo.update_from_file(nfo)
+
+    def __add_duplicate(self, sdir, name, isDir, origPath):
+        self.nDuplicates += 1
+
+        self.__post((self.EV_DUPLICATE, sdir.dirId, name, isDir, origPath))
+
+    def __get_known_files(self, path, files, links):
+        """Получение из кэша параметров файлов неизменившегося
+        каталога path.
+
+        Параметры:
+            path    - строка, полный путь к каталогу;
+            files   - список имён всех файлов каталога;
+            links   - множество имён символьных ссылок.
+
+        Возвращает кортеж из двух элементов - кол-ва файлов
+        (без пропущенных символьных ссылок) и списка кортежей вида
+        (имя файла, st_dev, st_ino, AudioFileInfo или os.stat_result)
+        для аудиофайлов (os.stat_result - для файлов, которых в кэше
+        нет или которые изменились), или None, если параметров в кэше
+        недостаточно или файл недоступен - тогда каталог придётся
+        прочитать."""
+
+        plan = self.engine.plan
+        cached = self.engine.cache.lookup_dir_files(path)
+
+        r = []
+        nfiles = 0
+
+        for fname in files:
+            if fname in links and not symlink_allowed(os.path.join(path, fname), self.__rootdir, self.symlinks):
+                continue
+
+            nfiles += 1
+
+            if not plan.check_file(fname):
+                continue
+
+            # время изменения каталога не меняется при перезаписи файла
+            # "на месте" (напр. при правке тэгов), так что без stat()
+            # файла записи в кэше верить нельзя
+            try:
+                st = os.stat(os.path.join(path, fname))
+            except OSError:
+                return
+
+            row = cached.get(fname)
+
+            if row is None or row[1] != self.engine.cache.stat_key(st):
+                # файла в кэше нет (обычно это повторы - они не разбирались
+                # и в кэш не попали) или он изменился - его разберёт
+                # ExtractionEngine
+                row = (st.st_dev, st.st_ino, st)
+
+            elif not plan.is_complete(row[2]):
+                return
+
+            else:
+                row = (row[0], st.st_ino, row[2])
+
+            r.append((fname,) + row)
+
+        return nfiles, r
+
+    def __enter_dir(self, sdir, path):
+        """Проверка, изменился ли каталог с прошлого обхода.
+        Для неизменившегося каталога отправляет события EV_FILE
+        с параметрами файлов из кэша."""
+
+        cache = self.engine.cache
+
+        t0 = monotonic()
+
+        listing = cache.lookup_dir(path, sdir.st)
+
+        known = None if listing is None else self.__get_known_files(path, listing[0], set(listing[2]))
+
+        self.engine.profile.add_since(PH_CACHE, t0)
+
+        if known is None:
+            # каталог придётся прочитать - заодно запомним его содержимое
+            sdir.files = []
+            sdir.subdirs = []
+            sdir.links = []
+            return
+
+        nfiles, known = known
+
+        sdir.knownSubdirs = listing[1]
+        self.nSkippedDirs += 1
+        self.nFiles += nfiles
+        plan = self.engine.plan
+
+        for fname, dev, ino, nfo in known:
+            if isinstance(nfo, os.stat_result):
+                # был ли такой файл, станет ясно после обхода подкаталогов -
+                # как и при чтении каталога, где файлы и подкаталоги идут
+                # вперемешку
+                sdir.deferred.append((fname, dev, ino, nfo))
+                continue
+
+            cache.count_lookup(True)
+
+            if not self.__visited.add_file(dev, ino):
+                self.__add_duplicate(sdir, fname, False, None)
+            elif plan.filter_file_info(nfo):
+                self.__add_file(sdir, fname, nfo)
+
+    def __add_deferred_files(self, sdir, path):
+        """Обработка отложенных __enter_dir() файлов каталога sdir:
+        повторы отмечаются, остальные отдаются ExtractionEngine."""
+
+        for fname, dev, ino, st in sdir.deferred:
+            if self.__visited.add_file(dev, ino):
+                sdir.entries.append(_FileEntry(os.path.join(path, fname), st))
+            else:
+                self.__add_duplicate(sdir, fname, False, None)
+
+        sdir.deferred = None
+
+    def __is_new_file(self, sdir, entry):
+        """Проверка, не встречался ли уже файл entry (экземпляр
+        os.DirEntry в каталоге sdir)."""
+
+        try:
+            if entry.is_symlink():
+                st = entry.stat()
+                dev, ino = st.st_dev, st.st_ino
+            elif sdir.st is not None:
+                # для обычного файла st_ino есть в DirEntry, а st_dev -
+                # тот же, что у каталога, так что обходимся без stat()
+                dev, ino = sdir.st.st_dev, entry.inode()
+            else:
+                return True
+        except OSError:
+            # битая ссылка - пусть разбирается ExtractionEngine
+            return True
+
+        return self.__visited.add_file(dev, ino)
+
+    def __add_listing_name(self, sdir, name, isDir, entry):
+        """Пополнение запоминаемого в кэше списка содержимого каталога sdir."""
+
+        if sdir.files is None:
+            return
+
+        (sdir.subdirs if isDir else sdir.files).append(name)
+
+        if entry is not None and entry.is_symlink():
+            sdir.links.append(name)
+
+    def __get_known_subdirs(self, path):
+        """Функция для aswalker.walk_directory()."""
+
+        return self.__stack[-1].knownSubdirs
+
+    def __process_files(self, sdir):
+        """Извлечение метаданных из накопленных в sdir.entries файлов.
+        Возвращает False, если обход был прерван."""
+
+        if not sdir.entries:
+            return True
+
+        entries = sdir.entries
+        sdir.entries = []
+
+        results = self.engine.get_audio_files_info(entries)
+
+        try:
+            for fpath, nfo in results:
+                if self.is_stopped():
+                    return False
+
+                if nfo:
+                    self.__add_file(sdir, os.path.split(fpath)[1], nfo)
+        finally:
+            results.close()
+
+        return True
+
+    def __process_left_dirs(self):
+        """Извлечение метаданных из файлов всех накопленных в __leftDirs
+        каталогов за один вызов engine.get_audio_files_info()
+        и завершение обхода этих каталогов.
+        Возвращает False, если обход был прерван."""
+
+        leftDirs = self.__leftDirs
+        self.__leftDirs = []
+        self.__nLeftFiles = 0
+
+        sdirs = dict()
+        entries = []
+
+        for sdir, path, _ in leftDirs:
+            # путь к начальному каталогу может заканчиваться на '/'
+            sdirs[os.path.split(os.path.join(path, ''))[0]] = sdir
+            entries += sdir.entries
+            sdir.entries = []
+
+        if entries:
+            results = self.engine.get_audio_files_info(entries)
+
+            try:
+                for fpath, nfo in results:
+                    if self.is_stopped():
+                        return False
+
+                    if nfo:
+                        fdir, fname = os.path.split(fpath)
+                        self.__add_file(sdirs[fdir], fname, nfo)
+            finally:
+                results.close()
+
+        for sdir, path, parent in leftDirs:
+            self.__finish_dir(sdir, path, parent)
+
+        return True
+
+    def __finish_dir(self, sdir, path, parent):
+        """Завершение обхода каталога sdir (файлы которого уже разобраны).
+        parent - экземпляр _ScanDirectory родительского каталога или None."""
+
+        sdir.dirinfo.flush()
+
+        if sdir.files is not None:
+            t0 = monotonic()
+            self.engine.cache.store_dir(path, sdir.st, sdir.files, sdir.subdirs, sdir.links)
+            self.engine.profile.add_since(PH_CACHE, t0)
+
+        self.__post((self.EV_DIR_DONE, sdir.dirId, sdir.dirinfo))
+
+        if parent is not None and sdir.dirinfo.nFiles:
+            parent.dirinfo.update_from_dir(sdir.dirinfo)
+
+    def scan(self, rootdir, parentId=None):
+        """Обход каталога rootdir.
+
+        parentId - None или номер каталога (полученный не от этого
+        экземпляра Scanner), в который следует поместить rootdir;
+        в этом случае имя rootdir в событии EV_DIR_ENTER - полный путь.
+
+        Возвращает экземпляр AudioDirectoryInfo или None,
+        если обход был прерван (в т.ч. вызовом stop() до начала обхода)."""
+
+        self.__lastFlush = tstart = monotonic()
+
+        stack = self.__stack
+        stack.clear()
+
+        self.__leftDirs.clear()
+        self.__nLeftFiles = 0
+
+        ioWindow = self.engine.ioWindow if self.engine.ioOrder != IO_ORDER_NONE else 0
+
+        self.__visited = InodeSet() if self.__sharedVisited is None else self.__sharedVisited
+        self.__rootdir = os.path.abspath(rootdir)
+
+        useListings = self.skipUnchanged and self.engine.cache is not None
+
+        walker = walk_directory(rootdir, self.__get_known_subdirs if useListings else None,
+            self.symlinks, self.__visited)
+
+        plan = self.engine.plan
+        profile = self.engine.profile
+
+        try:
+            # время чтения каталогов - это время получения событий от walker
+            for evtype, path, entry in profile.timed(walker, PH_LISTDIR):
+                if self.is_stopped():
+                    return
+
+                if evtype == WALK_FILE:
+                    self.nFiles += 1
+
+                    sdir = stack[-1]
+
+                    self.__add_listing_name(sdir, entry.name, False, entry)
+
+                    if plan.check_file(path) and not self.__is_new_file(sdir, entry):
+                        self.__add_duplicate(sdir, entry.name, False, None)
+                        continue
+
+                    sdir.entries.append(entry)
+
+                    # из огромных каталогов файлы отдаём ExtractionEngine
+                    # пачками, не дожидаясь окончания чтения каталога
+                    if len(sdir.entries) >= self.FILES_CHUNK:
+                        if not self.__process_files(sdir):
+                            return
+
+                elif evtype == WALK_DIR_ENTER:
+                    sdir = _ScanDirectory(next(self.__dirIds))
+
+                    if stack:
+                        name = entry.name
+                        dirParentId = stack[-1].dirId
+                    else:
+                        name = os.path.split(path)[1] if parentId is None else path
+                        dirParentId = parentId
+
+                    self.__post((self.EV_DIR_ENTER, sdir.dirId, dirParentId, name, path))
+
+                    if stack:
+                        self.__add_listing_name(stack[-1], name, True, entry)
+
+                    stack.append(sdir)
+
+                    t0 = monotonic()
+
+                    try:
+                        # получаем ДО чтения каталога - изменения во время
+                        # чтения заметит следующий обход
+                        sdir.st = os.stat(path) if entry is None else entry.stat()
+                    except OSError:
+                        pass
+                    else:
+                        profile.add_since(PH_STAT, t0)
+
+                        if useListings:
+                            self.__enter_dir(sdir, path)
+
+                elif evtype == WALK_DUPLICATE:
+                    sdir = stack[-1]
+
+                    self.__add_listing_name(sdir, entry.name, True, entry)
+
+                    st = entry.stat()
+                    self.__add_duplicate(sdir, entry.name, True,
+                        self.__visited.dirs.get((st.st_dev, st.st_ino)))
+
+                elif evtype == WALK_SKIPPED:
+                    self.__add_listing_name(stack[-1], entry.name, entry.is_dir(), entry)
+
+                elif evtype == WALK_DIR_ERROR:
+                    # каталог прочитать не удалось - его содержимое
+                    # в кэше не запоминаем
+                    self.nUnreadableDirs += 1
+                    stack[-1].files = None
+
+                else:
+                    # WALK_DIR_LEAVE
+                    sdir = stack.pop()
+
+                    if sdir.deferred:
+                        self.__add_deferred_files(sdir, path)
+
+                    parent = stack[-1] if stack else None
+
+                    if ioWindow > 0:
+                        self.__leftDirs.append((sdir, path, parent))
+                        self.__nLeftFiles += len(sdir.entries)
+
+                        if parent is not None and self.__nLeftFiles < ioWindow:
+                            continue
+
+                        if not self.__process_left_dirs():
+                            return
+                    else:
+                        if not self.__process_files(sdir):
+                            return
+
+                        self.__finish_dir(sdir, path, parent)
+
+                    if parent is None:
+                        return sdir.dirinfo
+        finally:
+            walker.close()
+
+            # то, что успели собрать, отдаём в любом случае
+            self.__flush()
+
+            profile.wallTime += monotonic() - tstart
+
+
+class MultiScanner():
+    """Совместный обход нескольких каталогов.
+
+    Каталоги группируются по устройствам (os.stat().st_dev); для каждого
+    устройства в отдельном потоке работает свой экземпляр Scanner со своим
+    ExtractionEngine, так что медленное устройство (напр. сетевой диск)
+    не задерживает обход остальных. Каталоги одного устройства
+    обходятся по очереди.
+
+    События от всех Scanner'ов отдаются одному получателю (вызовы sink
+    не пересекаются) и образуют одно дерево: сначала - событие
+    EV_DIR_ENTER "виртуального" корневого каталога (parentId == None,
+    name и path - пустые строки), его подкаталоги - обходимые каталоги
+    (name - полный путь), в конце - EV_DIR_DONE корневого каталога
+    с общей сводкой.
+    Номера каталогов и множество пройденных каталогов и файлов
+    у Scanner'ов общие. Каталог, совпадающий с уже добавленным
+    (напр. тот же каталог по другому пути), отмечается событием
+    EV_DUPLICATE в корневом каталоге; каталог, вложенный в другой
+    обходимый каталог, обходится отдельно, а в том каталоге
+    отмечается как повтор.
+
+    Поля:
+        roots           - список кортежей вида (полный путь, кол-во процессов),
+                          см. asconfig.Config.roots (без повторов);
+        new_engine      - функция с одним параметром - кол-вом процессов,
+                          возвращающая новый (не запущенный) экземпляр
+                          asengine.ExtractionEngine;
+        sink, skipUnchanged,
+        symlinks        - см. Scanner;
+        scanners        - список экземпляров Scanner (по одному на устройство),
+                          заполняется при вызове scan();
+        nFiles, nAudioFiles, nErrors,
+        nSkippedDirs,
+        nUnreadableDirs,
+        nDuplicates,
+        nParsedFiles,
+        ioWaitTime,
+        nBytesRead      - суммы соответствующих полей scanners;
+        profile         - экземпляр asprofile.ScanProfile, сводка
+                          профилей scanners (создаётся при каждом
+                          обращении), только для чтения."""
+
+    def __init__(self, roots, new_engine, sink, skipUnchanged=False, symlinks=SYMLINKS_FOLLOW):
+        self.roots = []
+
+        paths = set()
+
+        for rootdir, nworkers in roots:
+            rootdir = os.path.abspath(rootdir)
+
+            if rootdir not in paths:
+                paths.add(rootdir)
+                self.roots.append((rootdir, nworkers))
+        self.new_engine = new_engine
+        self.sink = sink
+        self.skipUnchanged = skipUnchanged
+        self.symlinks = symlinks
+
+        self.scanners = []
+
+        self.__stopEvent = threading.Event()
+        self.__sinkLock = threading.Lock()
+        self.__nDuplicates = 0
+
+    def __sum(self, fldname):
+        return sum(getattr(scanner, fldname) for scanner in self.scanners)
+
+    nFiles = property(lambda self: self.__sum('nFiles'))
+    nAudioFiles = property(lambda self: self.__sum('nAudioFiles'))
+    nErrors = property(lambda self: self.__sum('nErrors'))
+    nSkippedDirs = property(lambda self: self.__sum('nSkippedDirs'))
+    nUnreadableDirs = property(lambda self: self.__sum('nUnreadableDirs'))
+    nDuplicates = property(lambda self: self.__sum('nDuplicates') + self.__nDuplicates)
+    nParsedFiles = property(lambda self: self.__sum('nParsedFiles'))
+    ioWaitTime = property(lambda self: self.__sum('ioWaitTime'))
+    nBytesRead = property(lambda self: self.__sum('nBytesRead'))
+
+    @property
+    def profile(self):
+        profile = ScanProfile()
+
+        for scanner in self.scanners:
+            profile.merge(scanner.profile)
+
+        return profile
+
+    def stop(self):
+        """Прерывание обхода. Может вызываться из любого потока."""
+
+        self.__stopEvent.set()
+
+        for scanner in self.scanners:
+            scanner.stop()
+
+    def is_stopped(self):
+        return self.__stopEvent.is_set()
+
+    def __sink(self, events):
+        with self.__sinkLock:
+            self.sink(events)
+
+    def get_devices(self):
+        """Группировка каталогов по устройствам.
+
+        Возвращает список кортежей вида (кол-во процессов, список кортежей
+        вида (путь, os.stat_result)); кол-во процессов - наибольшее
+        из ненулевых значений для каталогов устройства, 0 - если все
+        значения нулевые."""
+
+        devices = dict()
+
+        for rootdir, nworkers in self.roots:
+            st = os.stat(rootdir)
+
+            dev = devices.get(st.st_dev)
+            if dev is None:
+                dev = devices[st.st_dev] = [0, []]
+
+            dev[0] = max(dev[0], nworkers)
+            dev[1].append((rootdir, st))
+
+        return [tuple(dev) for dev in devices.values()]
+
+    def __scan_device(self, scanner, rootId, roots, dirinfo, errors):
+        """Обход каталогов одного устройства, выполняется в отдельном потоке."""
+
+        try:
+            scanner.engine.start()
+
+            try:
+                for rootdir in roots:
+                    rinfo = scanner.scan(rootdir, rootId)
+
+                    if rinfo is None:
+                        return
+
+                    if rinfo.nFiles:
+                        with self.__sinkLock:
+                            dirinfo.update_from_dir(rinfo)
+            finally:
+                scanner.engine.close()
+        except Exception as ex:
+            errors.append(ex)
+            self.stop()
+
+    def scan(self):
+        """Обход каталогов.
+
+        Возвращает экземпляр AudioDirectoryInfo - общую сводку,
+        или None, если обход был прерван.
+        Исключение, возникшее в каком-либо из потоков, прерывает
+        обход и передаётся дальше."""
+
+        devices = self.get_devices()
+
+        dirIds = count()
+        visited = InodeSet()
+
+        rootId = next(dirIds)
+        self.sink([(Scanner.EV_DIR_ENTER, rootId, None, '', '')])
+
+        # регистрируем все каталоги заранее - чтобы вложенные каталоги
+        # обходились "своими" потоками
+        duplicates = []
+        threads = []
+
+        for nworkers, roots in devices:
+            todo = []
+
+            for rootdir, st in roots:
+                origPath = visited.add_dir(rootdir, st)
+
+                if origPath is None:
+                    todo.append(rootdir)
+                else:
+                    duplicates.append((Scanner.EV_DUPLICATE, rootId, rootdir, True, origPath))
+
+            if todo:
+                threads.append((Scanner(self.new_engine(nworkers), self.__sink,
+                    self.skipUnchanged, self.symlinks, dirIds, visited), todo))
+
+        if duplicates:
+            self.__nDuplicates = len(duplicates)
+            self.sink(duplicates)
+
+        self.scanners = [scanner for scanner, _ in threads]
+
+        dirinfo = AudioDirectoryInfo()
+        errors = []
+
+        threads = [threading.Thread(target=self.__scan_device,
+            args=(scanner, rootId, todo, dirinfo, errors),
+            daemon=True) for scanner, todo in threads]
+
+        if self.is_stopped():
+            return
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                thread.join()
+        except BaseException:
+            # напр. KeyboardInterrupt
+            self.stop()
+
+            for thread in threads:
+                thread.join()
+
+            raise
+
+        if errors:
+            raise errors[0]
+
+        if self.is_stopped():
+            return
+
+        dirinfo.flush()
+        self.sink([(Scanner.EV_DIR_DONE, rootId, dirinfo)])
+
+        return dirinfo
+
+
+class _ScanDirectory():
+    """Состояние каталога, обход которого не завершён.
+
+    Поля:
+        dirId           - целое, номер каталога (см. Scanner);
+        dirinfo         - экземпляр AudioDirectoryInfo;
+        entries         - список экземпляров os.DirEntry - файлов,
+                          ещё не отданных ExtractionEngine;
+        st              - None или os.stat_result каталога;
+        files, subdirs,
+        links           - None или списки имён файлов, подкаталогов
+                          и символьных ссылок, если содержимое
+                          каталога следует запомнить в кэше;
+        knownSubdirs    - None или список имён подкаталогов,
+                          если содержимое каталога взято из кэша;
+        deferred        - список кортежей вида (имя файла, st_dev, st_ino,
+                          os.stat_result) - файлов неизменившегося
+                          каталога, которых нет в кэше."""
+
+    __slots__ = 'dirId', 'dirinfo', 'entries', 'st', 'files', 'subdirs', 'links', 'knownSubdirs', 'deferred'
+
+    def __init__(self, dirId):
+        self.dirId = dirId
+        self.dirinfo = AudioDirectoryInfo()
+        self.entries = []
+        self.st = None
+        self.files = None
+        self.subdirs = None
+        self.links = None
+        self.knownSubdirs = None
+        self.deferred = []
+
+
+class _FileEntry():
+    """Заменитель os.DirEntry для файла, stat() которого уже получен
+    (для ExtractionEngine.get_audio_files_info())."""
+
+    __slots__ = 'path', '__st'
+
+    def __init__(self, path, st):
+        self.path = path
+        self.__st = st
+
+    def stat(self):
+        return self.__st
+
+    def inode(self):
+        return self.__st.st_ino
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" asstatsmodel.py
+
+    Copyright 2021 MC-6312
+
+    his file is part of AudioStat.
+
+    AudioStat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    AudioStat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with AudioStat.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+from gtktools import *
+from gi.repository import Gtk, GObject
+
+from asresults import *
+
+
+class StatsTreeModel(GObject.Object, Gtk.TreeModel):
+    """Gtk.TreeModel для дерева статистики поверх экземпляра
+    asresults.ResultsTree.
+
+    В отличие от Gtk.TreeStore ничего не хранит: строки формируются,
+    когда их запрашивает Gtk.TreeView, дочерние узлы каталога -
+    когда каталог разворачивается.
+
+    Значения столбцов - "сырые" (целые числа и битовые флаги);
+    в строки и значки они превращаются функциями отображения ячеек
+    Gtk.TreeView только для видимых строк.
+
+    Gtk.TreeIter ссылается на узел ResultsTree (user_data - узел + 1)
+    и его положение среди дочерних узлов родителя (user_data2 -
+    положение + 1); нули прибавками исключаются, т.к. NULL
+    в user_data PyGObject превращает в None.
+
+    Содержимое модели не меняется, так что итераторы остаются
+    действительными всё время её существования.
+
+    Поля:
+        tree        - экземпляр ResultsTree."""
+
+    # столбцы; для файлов минимальные и максимальные значения совпадают
+    STC_NAME, STC_FLAGS,\
+    STC_SAMPLERATE_MIN, STC_SAMPLERATE_MAX,\
+    STC_CHANNELS_MIN, STC_CHANNELS_MAX,\
+    STC_BITSPERSAMPLE_MIN, STC_BITSPERSAMPLE_MAX,\
+    STC_BITRATE_MIN, STC_BITRATE_MAX = range(10)
+
+    COLUMN_TYPES = (GObject.TYPE_STRING,) + (GObject.TYPE_UINT,) * 9
+
+    # флаги в столбце STC_FLAGS
+    SRF_DIR = 1
+    SRF_LOSSY = 2
+    SRF_MISSINGTAGS = 4
+    SRF_ERRORS = 8
+    # AudioStreamInfo.resolution + 1 (0 - None)
+    SRF_RES_SHIFT = 4
+    SRF_RES_MASK = 0x30
+    # ссылка на повторно встреченный файл или каталог (параметров нет)
+    SRF_DUPLICATE = 0x40
+
+    @classmethod
+    def get_resolution(cls, flags):
+        """Возвращает значение AudioStreamInfo.resolution,
+        упакованное в flags."""
+
+        res = (flags & cls.SRF_RES_MASK) >> cls.SRF_RES_SHIFT
+
+        return None if res == 0 else res - 1
+
+    @classmethod
+    def __pack_flags(cls, nfo, errors):
+        flags = 0
+
+        if nfo.lossy:
+            flags |= cls.SRF_LOSSY
+
+        if nfo.missingTags:
+            flags |= cls.SRF_MISSINGTAGS
+
+        if errors:
+            flags |= cls.SRF_ERRORS
+
+        if nfo.resolution is not None:
+            flags |= (nfo.resolution + 1) << cls.SRF_RES_SHIFT
+
+        return flags
+
+    def __init__(self, tree):
+        GObject.Object.__init__(self)
+
+        self.tree = tree
+
+        # буфер для получения параметров файлов
+        self.__fileInfo = AudioFileInfo()
+
+        self.__stamp = id(self) & 0x7FFFFFFF
+
+        # TreeView запрашивает значения столбцов строки по одному -
+        # последнюю сформированную строку держим под рукой
+        self.__rowNode = None
+        self.__row = None
+
+    def __new_iter(self, node, pos):
+        itr = Gtk.TreeIter()
+        itr.stamp = self.__stamp
+        itr.user_data = node + 1
+        itr.user_data2 = pos + 1
+
+        return itr
+
+    def get_node(self, itr):
+        """Возвращает узел ResultsTree, на который указывает itr."""
+
+        return itr.user_data - 1
+
+    def get_node_path(self, node):
+        """Возвращает экземпляр Gtk.TreePath для узла-каталога node."""
+
+        return Gtk.TreePath.new_from_indices(self.tree.get_dir_indices(node))
+
+    def __get_row(self, node):
+        """Возвращает кортеж значений столбцов для узла node."""
+
+        name = self.tree.get_name(node)
+
+        if self.tree.is_dir(node):
+            dirinfo = self.tree.get_info(node)
+
+            return (name,
+                self.SRF_DIR | self.__pack_flags(dirinfo.minInfo, dirinfo.nErrors > 0),
+                dirinfo.minInfo.sampleRate, dirinfo.maxInfo.sampleRate,
+                dirinfo.minInfo.channels, dirinfo.maxInfo.channels,
+                dirinfo.minInfo.bitsPerSample, dirinfo.maxInfo.bitsPerSample,
+                dirinfo.minInfo.bitRate, dirinfo.maxInfo.bitRate)
+
+        if self.tree.is_duplicate(node):
+            origPath = self.tree.get_duplicate_of(node)
+
+            if origPath is not None:
+                name = '%s \u2192 %s' % (name, origPath)
+
+            return (name, self.SRF_DUPLICATE, 0, 0, 0, 0, 0, 0, 0, 0)
+
+        nfo = self.tree.get_info(node, self.__fileInfo)
+
+        if nfo.error:
+            # у файла с ошибкой параметров нет
+            return (name, self.SRF_ERRORS, 0, 0, 0, 0, 0, 0, 0, 0)
+
+        return (name,
+            self.__pack_flags(nfo, False),
+            nfo.sampleRate, nfo.sampleRate,
+            nfo.channels, nfo.channels,
+            nfo.bitsPerSample, nfo.bitsPerSample,
+            nfo.bitRate, nfo.bitRate)
+
+    def do_get_flags(self):
+        return Gtk.TreeModelFlags.ITERS_PERSIST
+
+    def do_get_n_columns(self):
+        return len(self.COLUMN_TYPES)
+
+    def do_get_column_type(self, column):
+        return self.COLUMN_TYPES[column]
+
+    def do_get_iter(self, path):
+        node = self.tree.ROOT
+        pos = -1
+
+        for pos in path.get_indices():
+            children = self.tree.get_children(node)
+
+            if pos < 0 or pos >= len(children):
+                return False, None
+
+            node = children[pos]
+
+        if pos < 0:
+            return False, None
+
+        return True, self.__new_iter(node, pos)
+
+    def do_get_path(self, itr):
+        indices = self.tree.get_dir_indices(self.tree.get_parent(itr.user_data - 1))
+        indices.append(itr.user_data2 - 1)
+
+        return Gtk.TreePath.new_from_indices(indices)
+
+    def do_get_value(self, itr, column):
+        node = itr.user_data - 1
+
+        if node != self.__rowNode:
+            self.__row = self.__get_row(node)
+            self.__rowNode = node
+
+        return self.__row[column]
+
+    def __move_iter(self, itr, delta):
+        node = itr.user_data - 1
+        pos = itr.user_data2 - 1 + delta
+
+        siblings = self.tree.get_children(self.tree.get_parent(node))
+
+        if pos < 0 or pos >= len(siblings):
+            itr.stamp = 0
+            return False
+
+        itr.user_data = siblings[pos] + 1
+        itr.user_data2 = pos + 1
+
+        return True
+
+    def do_iter_next(self, itr):
+        return self.__move_iter(itr, 1)
+
+    def do_iter_previous(self, itr):
+        return self.__move_iter(itr, -1)
+
+    def do_iter_children(self, parent):
+        return self.do_iter_nth_child(parent, 0)
+
+    def do_iter_has_child(self, itr):
+        return self.tree.has_children(itr.user_data - 1)
+
+    def do_iter_n_children(self, itr):
+        return len(self.tree.get_children(self.tree.ROOT if itr is None else itr.user_data - 1))
+
+    def do_iter_nth_child(self, parent, n):
+        children = self.tree.get_children(self.tree.ROOT if parent is None else parent.user_data - 1)
+
+        if n < 0 or n >= len(children):
+            return False, None
+
+        return True, self.__new_iter(children[n], n)
+
+    def do_iter_parent(self, child):
+        node = self.tree.get_parent(child.user_data - 1)
+
+        if node == self.tree.ROOT:
+            return False, None
+
+        return True, self.__new_iter(node, self.tree.get_dir_position(node))
+
+
+if __name__ == '__main__':
+    print('[debugging %s]' % __file__)
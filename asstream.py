@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" asstream.py
+
+    Copyright 2021 MC-6312
+
+    his file is part of AudioStat.
+
+    AudioStat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    AudioStat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with AudioStat.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+# Потоковый интерфейс обхода каталогов для использования AudioStat
+# в качестве библиотеки.
+# ВНИМАНИЕ! модуль не должен ни прямо, ни косвенно импортировать gi.
+
+
+import os.path
+import threading
+import asyncio
+from queue import Queue, Full
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from audiostat import *
+from asengine import *
+from aswalker import *
+from asscanner import *
+
+
+# кол-во пачек событий Scanner'а в очереди между потоком обхода
+# и iter_audio_files(); пачка - события за Scanner.BATCH_INTERVAL
+STREAM_QUEUE_SIZE = 4
+
+# как часто (в секундах) поток обхода, ожидающий места в очереди,
+# проверяет, не закрыт ли генератор
+__QUEUE_POLL_INTERVAL = 0.1
+
+
+def iter_audio_files(roots, ffilter=None, nworkers=1, cache=None,
+        headerOnly=True, symlinks=SYMLINKS_FOLLOW, queueSize=STREAM_QUEUE_SIZE):
+    """Генератор, обходящий каталоги и извлекающий метаданные
+    из аудиофайлов по мере обхода.
+
+    Параметры:
+        roots       - строка (путь к каталогу) или последовательность строк;
+                      каталоги на разных устройствах обходятся
+                      одновременно (см. asscanner.MultiScanner);
+        ffilter     - экземпляр AudioFileFilter или None (без фильтрации -
+                      выдаются все файлы известных типов, в т.ч. с ошибками);
+        nworkers    - целое, кол-во процессов разбора файлов
+                      (см. asengine.ExtractionEngine; 1 - разбирать
+                      в потоке обхода, 0 - по кол-ву процессоров);
+        cache       - None или экземпляр ascache.MetadataCache;
+        headerOnly  - булевское, см. AudioFilterPlan;
+        symlinks    - aswalker.SYMLINKS_*;
+        queueSize   - целое, кол-во пачек результатов, которые поток
+                      обхода может выдать вперёд, пока они не выбраны
+                      вызывающим.
+
+    Для каждого файла, прошедшего фильтрацию, возвращает кортеж вида
+    (путь к файлу, экземпляр AudioFileInfo); повторно встреченные
+    файлы и каталоги (см. aswalker.InodeSet) пропускаются.
+
+    Обход выполняется в фоновом потоке, который приостанавливается,
+    если вызывающий не успевает выбирать результаты, так что расход
+    памяти не зависит от кол-ва файлов (если вызывающий их не хранит;
+    исключение - множество уже встреченных inode).
+    Закрытие генератора (метод close() или выход из цикла for
+    с последующим удалением генератора) прерывает обход.
+    Исключение, возникшее при обходе, передаётся вызывающему."""
+
+    if isinstance(roots, str):
+        roots = [roots]
+
+    queue = Queue(max(1, queueSize))
+    cancelled = threading.Event()
+    errors = []
+
+    def __sink(events):
+        # вызывается в потоке обхода
+        while not cancelled.is_set():
+            try:
+                queue.put(events, timeout=__QUEUE_POLL_INTERVAL)
+                return
+            except Full:
+                pass
+
+    def __new_engine(n):
+        return ExtractionEngine(ffilter, n or nworkers, cache, headerOnly)
+
+    if len(roots) == 1:
+        engine = __new_engine(nworkers)
+        scanner = Scanner(engine, __sink, False, symlinks)
+    else:
+        engine = None
+        scanner = MultiScanner([(rootdir, 0) for rootdir in roots], __new_engine,
+            __sink, False, symlinks)
+
+    def __scan_thread():
+        try:
+            if engine is None:
+                scanner.scan()
+            else:
+                with engine:
+                    scanner.scan(roots[0])
+        except BaseException as ex:
+            errors.append(ex)
+        finally:
+            __sink(None)
+
+    thread = threading.Thread(target=__scan_thread, daemon=True)
+    thread.start()
+
+    # ключи - Scanner.dirId, значения - полные пути к каталогам
+    dirPaths = dict()
+
+    try:
+        while True:
+            events = queue.get()
+            if events is None:
+                break
+
+            for event in events:
+                evtype = event[0]
+
+                if evtype == Scanner.EV_FILE:
+                    _, dirId, fname, nfo = event
+
+                    yield os.path.join(dirPaths[dirId], fname), nfo
+
+                elif evtype == Scanner.EV_DIR_ENTER:
+                    _, dirId, _, _, fdir = event
+                    dirPaths[dirId] = fdir
+
+                elif evtype == Scanner.EV_DIR_DONE:
+                    del dirPaths[event[1]]
+
+        if errors:
+            raise errors[0]
+    finally:
+        cancelled.set()
+        scanner.stop()
+        thread.join()
+
+
+# параметры ascan() по умолчанию: кол-во одновременно разбираемых
+# пачек файлов, кол-во файлов в пачке и размер очереди результатов
+ASCAN_CONCURRENCY = 8
+ASCAN_BATCH = 16
+ASCAN_QUEUE_SIZE = 256
+
+
+class _FileLister():
+    """Выдача пачками путей к файлам, которые следует разобрать
+    (для ascan()): обход каталогов, отсев файлов неподходящих типов
+    и повторов. Метод next_batch() вызывается в потоке executor'а,
+    но не более чем из одного потока одновременно."""
+
+    def __init__(self, roots, plan, symlinks, batchSize, cancelled):
+        self.plan = plan
+        self.batchSize = batchSize
+        self.cancelled = cancelled
+
+        self.visited = InodeSet()
+        self.walkers = iter([walk_directory(rootdir, None, symlinks, self.visited)
+            for rootdir in roots])
+        self.walker = next(self.walkers, None)
+
+        # ключи - пути к каталогам, в которых обход находится,
+        # значения - st_dev каталогов (для проверки файлов на повторы
+        # без лишних stat(); см. asscanner.Scanner)
+        self.dirDevs = dict()
+
+    def __is_new_file(self, fpath, entry):
+        try:
+            if entry.is_symlink():
+                st = entry.stat()
+                dev, ino = st.st_dev, st.st_ino
+            else:
+                dev, ino = self.dirDevs[os.path.split(fpath)[0]], entry.inode()
+        except OSError:
+            # битая ссылка - пусть с ней разбирается mutagen
+            return True
+
+        return self.visited.add_file(dev, ino)
+
+    def next_batch(self):
+        """Возвращает список путей к файлам; пустой - если обход
+        закончен или прерван."""
+
+        batch = []
+
+        while self.walker is not None and len(batch) < self.batchSize:
+            if self.cancelled.is_set():
+                break
+
+            event = next(self.walker, None)
+
+            if event is None:
+                self.walker = next(self.walkers, None)
+                continue
+
+            evtype, path, entry = event
+
+            if evtype == WALK_FILE:
+                if self.plan.check_file(path) and self.__is_new_file(path, entry):
+                    batch.append(path)
+
+            elif evtype == WALK_DIR_ENTER:
+                self.dirDevs[path] = (os.stat(path) if entry is None else entry.stat()).st_dev
+
+            elif evtype == WALK_DIR_LEAVE:
+                del self.dirDevs[path]
+
+        return batch
+
+
+async def ascan(roots, ffilter=None, concurrency=ASCAN_CONCURRENCY,
+        queueSize=ASCAN_QUEUE_SIZE, executor=None, cache=None,
+        headerOnly=True, symlinks=SYMLINKS_FOLLOW, batchSize=ASCAN_BATCH):
+    """Асинхронный генератор - вариант iter_audio_files() для asyncio.
+
+    Параметры:
+        roots       - строка (путь к каталогу) или последовательность строк;
+                      каталоги обходятся по очереди;
+        ffilter,
+        cache,
+        headerOnly,
+        symlinks    - как у iter_audio_files();
+        concurrency - целое, кол-во одновременно разбираемых пачек файлов;
+        queueSize   - целое, кол-во результатов, которые могут
+                      накопиться, пока их не выбрал вызывающий;
+        executor    - None или экземпляр concurrent.futures.Executor
+                      (с потоками), в котором выполняются чтение каталогов
+                      и разбор файлов; если None - создаётся
+                      ThreadPoolExecutor на concurrency + 1 потоков;
+        batchSize   - целое, кол-во файлов в пачке (одно обращение
+                      к executor'у).
+
+    Для каждого файла, прошедшего фильтрацию, возвращает кортеж вида
+    (путь к файлу, экземпляр AudioFileInfo), в порядке окончания
+    разбора.
+
+    В цикле событий выполняется только передача результатов, так что
+    он не блокируется; если вызывающий не успевает выбирать
+    результаты, обход и разбор приостанавливаются.
+    Отмена задачи, выбирающей результаты (или aclose() генератора),
+    прерывает обход; уже начатые пачки дочитываются в executor'е
+    в фоне, но их результаты отбрасываются.
+    Исключение, возникшее при обходе, передаётся вызывающему."""
+
+    if isinstance(roots, str):
+        roots = [roots]
+
+    loop = asyncio.get_running_loop()
+
+    concurrency = max(1, concurrency)
+
+    ownExecutor = executor is None
+    if ownExecutor:
+        executor = ThreadPoolExecutor(concurrency + 1, thread_name_prefix='ascan')
+
+    plan = AudioFilterPlan(ffilter, headerOnly)
+    cancelled = threading.Event()
+
+    lister = _FileLister(roots, plan, symlinks, max(1, batchSize), cancelled)
+
+    # пачки путей к файлам; None - обход закончен
+    batches = asyncio.Queue(concurrency * 2)
+    # кортежи (путь, AudioFileInfo); None - разбирающая задача закончила
+    # работу; экземпляр исключения - ошибка
+    results = asyncio.Queue(max(1, queueSize))
+
+    def __probe_batch(batch):
+        # вызывается в потоке executor'а
+        r = []
+
+        for fpath in batch:
+            if cancelled.is_set():
+                break
+
+            nfo = plan.get_audio_file_info(fpath, cache)
+            if nfo is not None:
+                r.append((fpath, nfo))
+
+        return r
+
+    async def __list_files():
+        try:
+            while True:
+                batch = await loop.run_in_executor(executor, lister.next_batch)
+                if not batch:
+                    break
+
+                await batches.put(batch)
+        except Exception as ex:
+            await results.put(ex)
+
+        for _ in range(concurrency):
+            await batches.put(None)
+
+    async def __probe_files():
+        while True:
+            batch = await batches.get()
+            if batch is None:
+                break
+
+            try:
+                found = await loop.run_in_executor(executor, __probe_batch, batch)
+            except Exception as ex:
+                await results.put(ex)
+                return
+
+            for r in found:
+                await results.put(r)
+
+        await results.put(None)
+
+    tasks = [loop.create_task(__list_files())]
+    tasks += [loop.create_task(__probe_files()) for _ in range(concurrency)]
+
+    try:
+        nRunning = concurrency
+
+        while nRunning:
+            r = await results.get()
+
+            if r is None:
+                nRunning -= 1
+            elif isinstance(r, BaseException):
+                raise r
+            else:
+                yield r
+    finally:
+        cancelled.set()
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        if ownExecutor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class StatsAccumulator():
+    """Сбор статистики по потоку результатов iter_audio_files()
+    (или любой другой последовательности кортежей вида
+    (путь к файлу, экземпляр AudioFileInfo)).
+
+    Экземпляры AudioFileInfo не сохраняются; в памяти держатся
+    суммарные таблицы и (если dirRollups == True) по экземпляру
+    AudioDirectoryInfo на каталог с аудиофайлами.
+
+    Поля:
+        roots       - None или список полных путей к начальным
+                      каталогам обхода (см. get_dir_rollups());
+        summary     - экземпляр AudioSummary;
+        nFiles      - целое, кол-во учтённых файлов (в т.ч. с ошибками);
+        dirRollups  - булевское, True - собирать статистику по каталогам;
+        dirs        - словарь, где ключи - полные пути к каталогам,
+                      а значения - экземпляры AudioDirectoryInfo
+                      со статистикой файлов самого каталога (без
+                      подкаталогов; необработанные - см. get_dir_rollups())."""
+
+    # поля AudioSummary, из которых формируются таблицы
+    # (см. get_summary_tables()), и сортировка их строк
+    SUMMARY_TABLES = (('sampleRates', True), ('bitsPerSample', True),
+        ('bitRates', True), ('totals', False))
+
+    def __init__(self, roots=None, dirRollups=True):
+        """roots        - None, строка или последовательность строк;
+        dirRollups      - см. описание полей."""
+
+        if isinstance(roots, str):
+            roots = [roots]
+
+        self.roots = None if roots is None else [os.path.abspath(r) for r in roots]
+        self.dirRollups = dirRollups
+
+        self.summary = AudioSummary()
+        self.nFiles = 0
+        self.dirs = dict()
+
+    def add(self, fpath, nfo):
+        """Учёт файла fpath с параметрами nfo (экземпляром AudioFileInfo)."""
+
+        self.nFiles += 1
+        self.summary.update_from_file(nfo)
+
+        if self.dirRollups:
+            fdir = os.path.split(fpath)[0]
+
+            dirinfo = self.dirs.get(fdir)
+            if dirinfo is None:
+                dirinfo = AudioDirectoryInfo()
+                self.dirs[fdir] = dirinfo
+
+            dirinfo.update_from_file(nfo)
+
+    def consume(self, records):
+        """Учёт всех файлов из последовательности records
+        (напр. генератора iter_audio_files()). Возвращает self."""
+
+        for fpath, nfo in records:
+            self.add(fpath, nfo)
+
+        return self
+
+    def get_summary_tables(self):
+        """Возвращает OrderedDict, где ключи - имена полей AudioSummary
+        из SUMMARY_TABLES, а значения - строки таблиц
+        (см. AudioSummary.get_table())."""
+
+        return OrderedDict((name, self.summary.get_table(getattr(self.summary, name), _sort))
+            for name, _sort in self.SUMMARY_TABLES)
+
+    def get_dir_rollups(self):
+        """Возвращает словарь, где ключи - полные пути к каталогам,
+        а значения - экземпляры AudioDirectoryInfo со статистикой
+        каталога вместе с подкаталогами (как у событий
+        Scanner.EV_DIR_DONE).
+
+        В словарь попадают каталоги с аудиофайлами и все их предки
+        вплоть до начальных каталогов (поле roots), а если roots
+        не указаны - до общего предка всех каталогов."""
+
+        if not self.dirs:
+            return dict()
+
+        tops = set(self.roots) if self.roots else {os.path.commonpath(list(self.dirs))}
+
+        # родительские каталоги; None - у начальных
+        parents = dict()
+
+        for fdir in self.dirs:
+            while fdir not in parents:
+                parent = os.path.split(fdir)[0]
+
+                if fdir in tops or parent == fdir:
+                    parents[fdir] = None
+                    break
+
+                parents[fdir] = parent
+                fdir = parent
+
+        rollups = dict()
+
+        # подкаталоги - раньше родительских
+        for fdir in sorted(parents, key=lambda p: p.count(os.sep), reverse=True):
+            dirinfo = rollups.get(fdir)
+            if dirinfo is None:
+                dirinfo = AudioDirectoryInfo()
+                rollups[fdir] = dirinfo
+
+            own = self.dirs.get(fdir)
+            if own is not None:
+                dirinfo.update_from_dir(own)
+
+            dirinfo.flush()
+
+            parent = parents[fdir]
+
+            if parent is not None and dirinfo.nFiles:
+                pinfo = rollups.get(parent)
+                if pinfo is None:
+                    pinfo = AudioDirectoryInfo()
+                    rollups[parent] = pinfo
+
+                pinfo.update_from_dir(dirinfo)
+
+        return rollups
+
+
+if __name__ == '__main__':
+    print('[debugging %s]' % __file__)
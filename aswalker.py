@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" aswalker.py
+
+    Copyright 2021 MC-6312
+
+    his file is part of AudioStat.
+
+    AudioStat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    AudioStat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with AudioStat.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+import os
+import os.path
+import stat
+import threading
+
+
+WALK_DIR_ENTER, WALK_FILE, WALK_DIR_LEAVE, WALK_DUPLICATE, WALK_SKIPPED, \
+WALK_DIR_ERROR = range(6)
+
+# что делать с символьными ссылками (см. walk_directory())
+SYMLINKS_IGNORE, SYMLINKS_INSIDE, SYMLINKS_FOLLOW = range(3)
+
+# названия SYMLINKS_* для файла настроек и командной строки
+SYMLINKS_POLICIES = ('ignore', 'inside', 'follow')
+
+
+def symlink_allowed(path, rootdir, policy):
+    """Проверка, следует ли переходить по символьной ссылке path
+    при обходе каталога rootdir (полного пути) в соответствии
+    с policy (SYMLINKS_*)."""
+
+    if policy == SYMLINKS_FOLLOW:
+        return True
+
+    if policy == SYMLINKS_IGNORE:
+        return False
+
+    rootdir = os.path.realpath(rootdir)
+
+    return os.path.commonpath((rootdir, os.path.realpath(path))) == rootdir
+
+
+class InodeSet():
+    """Множество уже пройденных при обходе каталогов и файлов,
+    идентифицируемых парами (st_dev, st_ino) - чтобы не заходить
+    в один каталог дважды (в т.ч. по зацикленным символьным ссылкам)
+    и не разбирать дважды один файл (жёсткие ссылки, символьные
+    ссылки, каталоги, смонтированные с --bind, - у последних
+    st_dev и st_ino те же, что и у оригинала).
+
+    Поля:
+        dirs    - словарь, где ключи - пары (st_dev, st_ino), а значения -
+                  полные пути, по которым каталоги были пройдены впервые;
+        files   - множество пар (st_dev, st_ino)."""
+
+    def __init__(self):
+        self.dirs = dict()
+        self.files = set()
+
+        # проверка и добавление файла должны быть атомарны (см. add_file())
+        self.__filesLock = threading.Lock()
+
+    def add_dir(self, path, st):
+        """Добавление каталога path с os.stat_result st.
+        Возвращает None, если каталог встретился впервые, иначе -
+        путь, по которому он был пройден ранее."""
+
+        # setdefault() атомарен, так что экземпляр может быть общим
+        # для нескольких потоков (см. asscanner.MultiScanner) -
+        # в каталог всё равно зайдёт только один из них
+        orig = self.dirs.setdefault((st.st_dev, st.st_ino), path)
+
+        return None if orig is path else orig
+
+    def add_file(self, dev, ino):
+        """Добавление файла. Возвращает True, если файл встретился
+        впервые."""
+
+        key = (dev, ino)
+
+        # экземпляр может быть общим для нескольких потоков
+        # (см. asscanner.MultiScanner), а у множества нет аналога
+        # setdefault() - без блокировки два потока могут оба
+        # решить, что файл встретился впервые
+        with self.__filesLock:
+            if key in self.files:
+                return False
+
+            self.files.add(key)
+
+        return True
+
+
+class _KnownSubdir():
+    """Заменитель os.DirEntry для подкаталога, имя которого известно
+    заранее (см. walk_directory()); stat() получен при создании."""
+
+    __slots__ = 'name', 'path', '__st', '__symlink'
+
+    def __init__(self, fdir, name, st, symlink):
+        self.name = name
+        self.path = os.path.join(fdir, name)
+        self.__st = st
+        self.__symlink = symlink
+
+    def is_dir(self):
+        return True
+
+    def is_symlink(self):
+        return self.__symlink
+
+    def stat(self):
+        return self.__st
+
+
+class _KnownSubdirIterator():
+    """Итератор по заранее известным подкаталогам каталога fdir,
+    отдающий экземпляры _KnownSubdir; исчезнувшие подкаталоги
+    пропускаются."""
+
+    def __init__(self, fdir, names):
+        self.fdir = fdir
+        self.names = iter(names)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        for name in self.names:
+            path = os.path.join(self.fdir, name)
+
+            try:
+                st = os.lstat(path)
+
+                symlink = stat.S_ISLNK(st.st_mode)
+                if symlink:
+                    st = os.stat(path)
+            except OSError:
+                continue
+
+            if stat.S_ISDIR(st.st_mode):
+                return _KnownSubdir(self.fdir, name, st, symlink)
+
+        raise StopIteration
+
+    def close(self):
+        pass
+
+
+def walk_directory(rootdir, get_known_subdirs=None, symlinks=SYMLINKS_FOLLOW, visited=None):
+    """Генератор, обходящий дерево каталогов с корнем rootdir
+    в глубину, без рекурсии.
+
+    Содержимое каталогов читается через os.scandir() по мере обхода,
+    без построения полных списков, поэтому каталоги хоть со ста тыщами
+    файлов обходятся без лишнего расхода памяти; тип элемента
+    определяется по данным, полученным при чтении каталога
+    (DirEntry.is_dir()), а DirEntry.stat() вызывается только для
+    каталогов и символьных ссылок (и кэшируется в DirEntry).
+
+    Для каждого элемента возвращает кортеж из трёх элементов:
+    (WALK_*, полный путь, экземпляр os.DirEntry), где
+        WALK_DIR_ENTER  - начало обхода каталога;
+                          для самого rootdir DirEntry == None;
+        WALK_FILE       - файл (точнее, всё, что не каталог);
+        WALK_DIR_LEAVE  - обход каталога завершён (DirEntry == None);
+        WALK_DUPLICATE  - каталог, который уже был пройден (по другому
+                          пути - см. visited.dirs) или в котором обход
+                          уже находится (зацикленная ссылка);
+                          в него обход не заходит;
+        WALK_SKIPPED    - символьная ссылка (на файл или каталог),
+                          по которой в соответствии с symlinks
+                          переходить не следует;
+        WALK_DIR_ERROR  - каталог, для которого только что было выдано
+                          WALK_DIR_ENTER, не удалось прочитать
+                          (напр. нет прав); вместо DirEntry - экземпляр
+                          OSError; следом выдаётся WALK_DIR_LEAVE,
+                          а обход продолжается со следующего элемента
+                          родительского каталога.
+
+    Каждое событие соответствует не более чем двум обращениям
+    к ФС, так что обход можно прерывать между любыми событиями
+    (закрытием генератора).
+
+    get_known_subdirs - None или функция, вызываемая с полным путём
+    каталога после обработки события WALK_DIR_ENTER для него;
+    если она возвращает не None, а список имён подкаталогов,
+    содержимое каталога не читается: для него выдаются только
+    события для подкаталогов из списка (с заменителем os.DirEntry,
+    у которого stat() уже получен) и WALK_DIR_LEAVE.
+
+    symlinks - SYMLINKS_*, переход по символьным ссылкам:
+        SYMLINKS_IGNORE - не переходить;
+        SYMLINKS_INSIDE - переходить, только если ссылка указывает
+                          на что-то внутри rootdir;
+        SYMLINKS_FOLLOW - переходить всегда.
+
+    visited - None или экземпляр InodeSet; пополняется каталогами
+    по мере обхода. Файлы walk_directory() в visited не добавляет -
+    их проверка на повторы (если нужна) лежит на вызывающем."""
+
+    def __open_dir(fdir):
+        if get_known_subdirs is not None:
+            subdirs = get_known_subdirs(fdir)
+
+            if subdirs is not None:
+                return _KnownSubdirIterator(fdir, subdirs)
+
+        return os.scandir(fdir)
+
+    if visited is None:
+        visited = InodeSet()
+
+    rootdir = os.path.abspath(rootdir)
+
+    visited.add_dir(rootdir, os.stat(rootdir))
+
+    yield WALK_DIR_ENTER, rootdir, None
+
+    # стек кортежей вида (путь к каталогу, итератор os.scandir()
+    # или _KnownSubdirIterator)
+    stack = []
+
+    # каталог, для которого выдано WALK_DIR_ENTER, но который ещё не открыт
+    newdir = rootdir
+
+    try:
+        while True:
+            if newdir is not None:
+                try:
+                    stack.append((newdir, __open_dir(newdir)))
+                except OSError as ex:
+                    # нет прав на чтение каталога и т.п. - пропускаем его
+                    yield WALK_DIR_ERROR, newdir, ex
+                    yield WALK_DIR_LEAVE, newdir, None
+
+                newdir = None
+
+            if not stack:
+                break
+
+            fdir, itr = stack[-1]
+
+            entry = next(itr, None)
+
+            if entry is None:
+                itr.close()
+                stack.pop()
+
+                yield WALK_DIR_LEAVE, fdir, None
+
+            elif entry.is_symlink() and not symlink_allowed(entry.path, rootdir, symlinks):
+                yield WALK_SKIPPED, entry.path, entry
+
+            elif entry.is_dir():
+                try:
+                    st = entry.stat()
+                except OSError:
+                    # каталог успел исчезнуть
+                    continue
+
+                if visited.add_dir(entry.path, st) is not None:
+                    yield WALK_DUPLICATE, entry.path, entry
+                    continue
+
+                yield WALK_DIR_ENTER, entry.path, entry
+
+                newdir = entry.path
+
+            else:
+                yield WALK_FILE, entry.path, entry
+
+    finally:
+        for _, itr in stack:
+            itr.close()
+
+if __name__ == '__main__':
+    print('[debugging %s]' % __file__)
+
+    import sys
+
+    for evtype, path, entry in walk_directory(sys.argv[1] if len(sys.argv) > 1 else '.'):
+        print(('>', ' ', '<', '=', '-', '!')[evtype], path)
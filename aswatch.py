@@ -0,0 +1,652 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" aswatch.py
+
+    Copyright 2021 MC-6312
+
+    his file is part of AudioStat.
+
+    AudioStat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    AudioStat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with AudioStat.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+""" Отслеживание изменений в просканированном каталоге и обновление
+    результатов обхода (asresults.ScanResults) без полного повторного
+    обхода.
+
+    Под Linux изменения отслеживаются через inotify (обвязка - ctypes,
+    без сторонних модулей); если inotify недоступен или кончился лимит
+    на кол-во отслеживаемых каталогов (fs.inotify.max_user_watches),
+    каталоги периодически опрашиваются на предмет изменения mtime.
+
+    Модуль не должен импортировать gi."""
+
+
+import sys
+import os
+import os.path
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from time import monotonic
+
+from audiostat import *
+from asscanner import *
+from aswalker import *
+
+
+#
+# inotify
+#
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+
+def __load_libc():
+    if not sys.platform.startswith('linux'):
+        return
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        return
+
+    return libc
+
+
+_libc = __load_libc()
+
+
+class _Inotify():
+    """Минимальная обвязка inotify.
+
+    Поля:
+        fd  - файловый дескриптор (неблокирующий)."""
+
+    # заголовок struct inotify_event: wd, mask, cookie, len
+    __EVENT = struct.Struct('iIII')
+
+    def __init__(self):
+        if _libc is None:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+
+        if self.fd < 0:
+            en = ctypes.get_errno()
+            raise OSError(en, os.strerror(en))
+
+    def add_watch(self, path, mask):
+        """Возвращает дескриптор наблюдения (целое)."""
+
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+
+        if wd < 0:
+            en = ctypes.get_errno()
+            raise OSError(en, os.strerror(en), path)
+
+        return wd
+
+    def rm_watch(self, wd):
+        _libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self):
+        """Возвращает список кортежей вида (wd, mask, cookie, name)
+        для накопившихся событий."""
+
+        events = []
+
+        while True:
+            try:
+                buf = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+
+            if not buf:
+                break
+
+            offset = 0
+
+            while offset + self.__EVENT.size <= len(buf):
+                wd, mask, cookie, namelen = self.__EVENT.unpack_from(buf, offset)
+                offset += self.__EVENT.size
+
+                name = os.fsdecode(buf[offset:offset + namelen].rstrip(b'\0'))
+                offset += namelen
+
+                events.append((wd, mask, cookie, name))
+
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class WatchChanges():
+    """Накопленные изменения в дереве каталогов.
+    Повторные изменения одного и того же файла схлопываются.
+
+    Поля:
+        files       - множество полных путей созданных или изменённых
+                      файлов;
+        removed     - множество полных путей удалённых файлов
+                      и каталогов;
+        dirs        - множество полных путей появившихся каталогов
+                      (их следует обойти целиком);
+        listings    - множество полных путей каталогов, список
+                      файлов которых изменился, а какие именно файлы -
+                      неизвестно (при опросе mtime каталогов);
+        rescan      - булевское, True - изменения потеряны
+                      (переполнилась очередь событий inotify)
+                      и нужен полный повторный обход."""
+
+    def __init__(self):
+        self.files = set()
+        self.removed = set()
+        self.dirs = set()
+        self.listings = set()
+        self.rescan = False
+
+    def __bool__(self):
+        return bool(self.files or self.removed or self.dirs or self.listings or self.rescan)
+
+    def add_file(self, path):
+        self.removed.discard(path)
+        self.files.add(path)
+
+    def add_removed(self, path):
+        self.files.discard(path)
+        self.dirs.discard(path)
+        self.listings.discard(path)
+        self.removed.add(path)
+
+    def add_dir(self, path):
+        # старое содержимое каталога (если оно было) при обработке
+        # удаляется в любом случае, так что removed не трогаем
+        self.dirs.add(path)
+
+    def add_listing(self, path):
+        self.listings.add(path)
+
+
+class DirectoryWatcher():
+    """Отслеживание изменений в дереве каталогов.
+
+    Используется в фоновом потоке: start(), затем в цикле
+    wait_changes() до тех пор, пока stop() (вызываемый из любого
+    потока) не прервёт ожидание.
+
+    Поля:
+        rootdir - строка, полный путь к начальному каталогу;
+        polling - булевское, True - inotify недоступен, изменения
+                  ищутся опросом mtime каталогов (раз в POLL_INTERVAL
+                  секунд); в этом режиме видны только появление,
+                  удаление и переименование файлов, но не изменение
+                  их содержимого."""
+
+    # изменения отдаются после COALESCE_DELAY секунд "тишины",
+    # но не позднее, чем через MAX_DELAY секунд после первого изменения
+    COALESCE_DELAY = 1.0
+    MAX_DELAY = 10.0
+
+    POLL_INTERVAL = 30.0
+
+    # что отслеживаем в каталогах
+    WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE\
+        | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+    def __init__(self, rootdir):
+        self.rootdir = os.path.abspath(rootdir)
+        self.polling = False
+
+        self.__stopR, self.__stopW = os.pipe()
+
+        self.__inotify = None
+        # ключи - дескрипторы наблюдения, значения - пути к каталогам
+        self.__wdPaths = dict()
+        # ключи - пути к каталогам, значения - дескрипторы наблюдения
+        self.__pathWds = dict()
+
+        # для режима опроса: ключи - пути к каталогам, значения - st_mtime_ns
+        self.__dirMtimes = dict()
+
+    def start(self):
+        """Начало отслеживания (обход дерева каталогов)."""
+
+        try:
+            self.__inotify = _Inotify()
+            self.__add_tree(self.rootdir)
+        except OSError as ex:
+            self.__start_polling(ex)
+
+    def stop(self):
+        """Прерывание wait_changes(). Может вызываться из любого потока."""
+
+        os.write(self.__stopW, b'\0')
+
+    def close(self):
+        if self.__inotify is not None:
+            self.__inotify.close()
+            self.__inotify = None
+
+        for fd in (self.__stopR, self.__stopW):
+            os.close(fd)
+
+    def __start_polling(self, reason):
+        print('*** inotify failed (%s), falling back to polling every %g s' % (reason, self.POLL_INTERVAL),
+            file=sys.stderr)
+
+        if self.__inotify is not None:
+            self.__inotify.close()
+            self.__inotify = None
+
+        self.__wdPaths.clear()
+        self.__pathWds.clear()
+
+        self.polling = True
+        self.__add_tree(self.rootdir)
+
+    def __add_tree(self, path):
+        """Начало отслеживания каталога path и всех его подкаталогов."""
+
+        for evtype, fdir, _ in walk_directory(path):
+            if evtype != WALK_DIR_ENTER:
+                continue
+
+            if self.polling:
+                try:
+                    self.__dirMtimes[fdir] = os.stat(fdir).st_mtime_ns
+                except OSError:
+                    pass
+            else:
+                try:
+                    wd = self.__inotify.add_watch(fdir, self.WATCH_MASK)
+                except OSError as ex:
+                    if ex.errno in (errno.ENOSPC, errno.ENOMEM):
+                        # кончился лимит fs.inotify.max_user_watches
+                        raise
+
+                    # каталог успел исчезнуть или недоступен
+                    continue
+
+                self.__wdPaths[wd] = fdir
+                self.__pathWds[fdir] = wd
+
+    def __forget_tree(self, path):
+        """Прекращение отслеживания каталога path и его подкаталогов."""
+
+        prefix = path + os.sep
+
+        if self.polling:
+            for fdir in [fdir for fdir in self.__dirMtimes if fdir == path or fdir.startswith(prefix)]:
+                del self.__dirMtimes[fdir]
+        else:
+            for fdir in [fdir for fdir in self.__pathWds if fdir == path or fdir.startswith(prefix)]:
+                wd = self.__pathWds.pop(fdir)
+                del self.__wdPaths[wd]
+
+                self.__inotify.rm_watch(wd)
+
+    def __read_events(self, changes):
+        for wd, mask, cookie, name in self.__inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                changes.rescan = True
+                continue
+
+            fdir = self.__wdPaths.get(wd)
+
+            if fdir is None:
+                continue
+
+            if mask & IN_IGNORED:
+                # каталог удалён, наблюдение снято ядром
+                del self.__wdPaths[wd]
+                self.__pathWds.pop(fdir, None)
+                continue
+
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if fdir == self.rootdir:
+                    changes.rescan = True
+
+                # для прочих каталогов всё нужное сообщит родительский
+                continue
+
+            path = os.path.join(fdir, name)
+
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    changes.add_dir(path)
+
+                    try:
+                        self.__add_tree(path)
+                    except OSError as ex:
+                        # кончился лимит; что творилось в каталогах,
+                        # пока они не отслеживались - неизвестно
+                        self.__start_polling(ex)
+                        changes.rescan = True
+                        break
+
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    changes.add_removed(path)
+                    self.__forget_tree(path)
+
+            elif mask & (IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO):
+                changes.add_file(path)
+
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                changes.add_removed(path)
+
+    def __poll(self, changes):
+        """Поиск изменившихся каталогов по mtime."""
+
+        for fdir, mtime in list(self.__dirMtimes.items()):
+            if fdir not in self.__dirMtimes:
+                # удалён вместе с родительским
+                continue
+
+            try:
+                st = os.stat(fdir)
+            except OSError:
+                changes.add_removed(fdir)
+                self.__forget_tree(fdir)
+                continue
+
+            if st.st_mtime_ns == mtime:
+                continue
+
+            self.__dirMtimes[fdir] = st.st_mtime_ns
+            changes.add_listing(fdir)
+
+            # удалённые подкаталоги найдутся сами (их stat() не сработает),
+            # а новые придётся поискать
+            try:
+                with os.scandir(fdir) as itr:
+                    newDirs = [entry.path for entry in itr if entry.is_dir() and entry.path not in self.__dirMtimes]
+            except OSError:
+                continue
+
+            for path in newDirs:
+                changes.add_dir(path)
+                self.__add_tree(path)
+
+    def wait_changes(self):
+        """Ожидание изменений.
+
+        Возвращает экземпляр WatchChanges или None, если ожидание
+        было прервано вызовом stop()."""
+
+        changes = WatchChanges()
+
+        # время, не позднее которого накопленное следует отдать
+        deadline = None
+
+        while True:
+            if self.polling:
+                fds = [self.__stopR]
+                timeout = self.POLL_INTERVAL
+            else:
+                fds = [self.__stopR, self.__inotify.fd]
+                timeout = None if deadline is None else max(0.0, min(self.COALESCE_DELAY, deadline - monotonic()))
+
+            ready = select.select(fds, [], [], timeout)[0]
+
+            if self.__stopR in ready:
+                os.read(self.__stopR, 1)
+                return
+
+            if self.polling:
+                if not ready:
+                    self.__poll(changes)
+
+                    if changes:
+                        return changes
+
+            elif ready:
+                self.__read_events(changes)
+
+                if changes and deadline is None:
+                    deadline = monotonic() + self.MAX_DELAY
+
+            elif changes:
+                # "тишина" - отдаём накопленное
+                return changes
+
+
+#
+# обновление результатов обхода
+#
+
+UPD_REMOVE, UPD_DIR, UPD_LISTING, UPD_FILE, UPD_RESCAN = range(5)
+
+
+class LiveUpdater():
+    """Подготовка обновлений результатов обхода по изменениям,
+    полученным от DirectoryWatcher.
+
+    Обновление выполняется в два приёма: collect() извлекает
+    метаданные изменившихся файлов (долго, фоновый поток),
+    apply_updates() вносит их в экземпляр ScanResults (быстро,
+    в потоке, которому принадлежат результаты), так что результаты
+    не нужно защищать блокировками.
+
+    Поля:
+        engine  - экземпляр asengine.ExtractionEngine (без фильтрации,
+                  с теми же параметрами, что и при обходе)."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def __get_entries(self, fdir, names=None):
+        """Возвращает список экземпляров os.DirEntry для файлов
+        каталога fdir (если names не None - только для файлов
+        с именами из names)."""
+
+        try:
+            with os.scandir(fdir) as itr:
+                return [entry for entry in itr
+                    if (names is None or entry.name in names) and not entry.is_dir()]
+        except OSError:
+            return []
+
+    def __get_infos(self, entries):
+        """Возвращает словарь, где ключи - имена файлов, а значения -
+        экземпляры AudioFileInfo (None для файлов неподдерживаемых
+        типов)."""
+
+        return {os.path.split(fpath)[1]:nfo for fpath, nfo in self.engine.get_audio_files_info(entries)}
+
+    def collect(self, changes):
+        """Извлечение метаданных изменившихся файлов.
+
+        Параметры:
+            changes - экземпляр WatchChanges.
+
+        Возвращает список обновлений - кортежей, первый элемент которых -
+        UPD_*:
+            (UPD_REMOVE, path)
+                файл или каталог удалён;
+            (UPD_DIR, path, events)
+                появился каталог; events - список событий Scanner,
+                полученных при его обходе;
+            (UPD_LISTING, path, infos)
+                изменился список файлов каталога; infos - словарь,
+                где ключи - имена файлов, а значения - экземпляры
+                AudioFileInfo или None;
+            (UPD_FILE, path, nfo)
+                файл создан или изменён; nfo - экземпляр AudioFileInfo
+                или None (файл - не аудиофайл или уже исчез);
+            (UPD_RESCAN,)
+                нужен полный повторный обход."""
+
+        if changes.rescan:
+            return [(UPD_RESCAN,)]
+
+        updates = [(UPD_REMOVE, path) for path in sorted(changes.removed)]
+
+        # новые каталоги обходим целиком; вложенные в них изменения
+        # при этом учитываются сами собой
+        scanned = []
+
+        for path in sorted(changes.dirs):
+            if any(path.startswith(sdir + os.sep) for sdir in scanned):
+                continue
+
+            events = []
+
+            try:
+                if Scanner(self.engine, events.extend).scan(path) is None:
+                    continue
+            except OSError:
+                # каталог успел исчезнуть
+                updates.append((UPD_REMOVE, path))
+                continue
+
+            scanned.append(path)
+            updates.append((UPD_DIR, path, events))
+
+        def __in_scanned(path):
+            return any(path.startswith(sdir + os.sep) for sdir in scanned)
+
+        for fdir in sorted(changes.listings):
+            if fdir not in scanned and not __in_scanned(fdir):
+                updates.append((UPD_LISTING, fdir, self.__get_infos(self.__get_entries(fdir))))
+
+        # файлы группируем по каталогам - для os.scandir()
+        byDir = dict()
+
+        for path in changes.files:
+            if __in_scanned(path):
+                continue
+
+            fdir, fname = os.path.split(path)
+
+            if fdir not in changes.listings:
+                byDir.setdefault(fdir, set()).add(fname)
+
+        for fdir, names in sorted(byDir.items()):
+            infos = self.__get_infos(self.__get_entries(fdir, names))
+
+            for fname in sorted(names):
+                updates.append((UPD_FILE, os.path.join(fdir, fname), infos.get(fname)))
+
+        return updates
+
+
+def apply_updates(results, updates):
+    """Внесение обновлений, полученных от LiveUpdater.collect(),
+    в экземпляр asresults.ScanResults.
+
+    Возвращает False, если обновления внести нельзя и нужен
+    полный повторный обход, иначе - True."""
+
+    for upd in updates:
+        updtype = upd[0]
+
+        if updtype == UPD_RESCAN:
+            return False
+
+        elif updtype == UPD_REMOVE:
+            results.remove_path(upd[1])
+
+        elif updtype == UPD_DIR:
+            _, path, events = upd
+
+            parentIx = results.find_dir(os.path.split(path)[0])
+
+            if parentIx is not None:
+                results.remove_path(path)
+                results.add_events(events, dict(), parentIx)
+
+        elif updtype == UPD_LISTING:
+            _, fdir, infos = upd
+
+            dirIx = results.find_dir(fdir)
+
+            if dirIx is None:
+                continue
+
+            known = set()
+
+            for ix in list(results.get_dir_files(dirIx)):
+                if results.flags[ix] & results.FL_REMOVED:
+                    continue
+
+                fname = results.get_file_name(ix)
+                known.add(fname)
+
+                if results.is_duplicate(ix):
+                    # ссылки на повторы остаются как есть
+                    continue
+
+                nfo = infos.get(fname)
+
+                if nfo is None:
+                    results.remove_file(ix)
+                elif nfo.get_fields() != results.get_file_info(ix).get_fields():
+                    results.remove_file(ix)
+                    results.add_file(dirIx, fname, nfo)
+
+            for fname, nfo in infos.items():
+                if nfo is not None and fname not in known:
+                    results.add_file(dirIx, fname, nfo)
+
+        elif updtype == UPD_FILE:
+            results.update_file(upd[1], upd[2])
+
+    return True
+
+
+if __name__ == '__main__':
+    print('[debugging %s]' % __file__)
+
+    watcher = DirectoryWatcher(sys.argv[1] if len(sys.argv) > 1 else '.')
+    watcher.start()
+
+    print('polling' if watcher.polling else 'inotify')
+
+    try:
+        while True:
+            changes = watcher.wait_changes()
+
+            for fldname in ('files', 'removed', 'dirs', 'listings'):
+                for path in sorted(getattr(changes, fldname)):
+                    print(fldname, path)
+
+            if changes.rescan:
+                print('rescan')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
@@ -22,12 +22,15 @@
 
 
 from ascommon import *
+from aswalker import *
+from asprobe import *
 
 
 import sys
 import os
 import os.path
 import mutagen
+from bisect import bisect_right
 from collections import namedtuple, OrderedDict
 from enum import IntEnum
 from traceback import print_exception
@@ -99,7 +102,8 @@ class AudioStreamInfo(BaseAudioInfo):
     lossy           - булевское; True, если использовано сжатие с потерями;
     resolution      - None или RESOLUTION_*; "разрешение" потока по значениям
                       sampleRate и bitsPerSample;
-                      параметры проверки см. в функции get_audio_file_info();
+                      параметры проверки см. в методе
+                      AudioFileInfo.update_derived_fields();
     sampleRate      - целое, частота сэмплирования,
     channels        - целое, кол-во каналов;
     bitsPerSample   - целое, разрядность; м.б. 0 (неизвестно) для MP3 и
@@ -147,19 +151,75 @@ class AudioFileInfo(AudioStreamInfo):
     """Информация об аудиофайле.
 
     Поля:
-        error   - None или строка с сообщением об ошибке,
+        error   - None или непустая строка с сообщением об ошибке,
                   если произошла ошибка разбора метаданных;
                   в этом случае все прочие поля должны
-                  игнорироваться;
+                  игнорироваться; проверяется по истинности
+                  (if nfo.error), т.к. в старых записях кэша
+                  может быть и пустая строка;
         mime    - строка, mimetype;
+        tagsRead - булевское, True, если файл разбирался полностью
+                  (mutagen'ом, даже если тот формат не опознал);
+                  при False значение missingTags ничего не означает
+                  (см. read_audio_file_info()).
 
     Прочие поля наследуются от AudioStreamInfo."""
 
+    # поля, извлекаемые из файла; прочие поля вычисляются
+    # из них методом update_derived_fields()
+    FIELDS = ('mime', 'sampleRate', 'channels', 'bitsPerSample',
+        'bitRate', 'missingTags', 'error', 'tagsRead')
+
     def __init__(self):
         super().__init__()
 
         self.error = None
         self.mime = ''
+        self.tagsRead = False
+
+    @classmethod
+    def new_from_fields(cls, fields):
+        """Создание экземпляра из кортежа значений полей
+        (в порядке, указанном в FIELDS)."""
+
+        nfo = cls()
+
+        for name, value in zip(cls.FIELDS, fields):
+            setattr(nfo, name, value)
+
+        nfo.update_derived_fields()
+
+        return nfo
+
+    def get_fields(self):
+        """Возвращает кортеж значений полей в порядке, указанном в FIELDS."""
+
+        return tuple(getattr(self, name) for name in self.FIELDS)
+
+    def has_stream_parameters(self):
+        """Возвращает True, если в файле найден хотя бы один
+        параметр аудиопотока."""
+
+        return self.sampleRate > 0 or self.channels > 0\
+            or self.bitsPerSample > 0 or self.bitRate > 0
+
+    def update_derived_fields(self):
+        """Вычисление полей lossy и resolution из извлечённых
+        из файла значений."""
+
+        self.lossy = self.mime not in LOSSLESS_MIMETYPES
+
+        if self.error:
+            self.resolution = None
+        #
+        # пока проверка "на хайрез" приколочена гвоздями здесь
+        #
+        elif self.bitsPerSample < 16 or self.sampleRate < 44100:
+            self.resolution = AudioStreamInfo.RESOLUTION_LOW
+        elif self.bitsPerSample > 16 and self.sampleRate >= 44100:
+            self.resolution = AudioStreamInfo.RESOLUTION_HIGH
+        else:
+            self.resolution = AudioStreamInfo.RESOLUTION_STANDARD
 
     def get_info_strings(self):
         r = super().get_info_strings()
@@ -309,6 +369,136 @@ class AudioDirectoryInfo(BaseAudioInfo):
         return r
 
 
+class AudioSummary(Representable):
+    """Суммарная статистика по аудиофайлам.
+
+    Поля:
+        nAudioFiles     - целое, кол-во файлов без ошибок;
+        sampleRates     - словарь, где ключи - значения
+                          AudioStreamInfo.sampleRate, а значения -
+                          кол-во файлов;
+        bitsPerSample   - словарь, где ключи - значения
+                          AudioStreamInfo.bitsPerSample, а значения -
+                          кол-во файлов;
+        bitRates        - словарь, где ключи - нижние границы
+                          диапазонов битрейта (BITRATE_BUCKETS, 0 -
+                          битрейт неизвестен), а значения - кол-во файлов;
+        totals          - OrderedDict, где ключи - TS_*, а значения -
+                          кол-во файлов."""
+
+    # строки таблицы прочей статистики
+    TS_LOSSY = 'Lossy'
+
+    TS_BY_RES = ('Low res.',    # AudioStreamInfo.RESOLUTION_LOW
+                 'Std. res.',   # AudioStreamInfo.RESOLUTION_STANDARD
+                 'High res.',   # AudioStreamInfo.RESOLUTION_HIGH
+                 )
+
+    TS_MISTAGS = 'Missing tags'
+    TS_WITH_ERRORS = 'With errors'
+
+    # нижние границы диапазонов битрейта (кбит/с) для таблицы bitRates
+    BITRATE_BUCKETS = (8, 96, 128, 160, 192, 256, 320, 500, 1000, 1500, 2500, 5000)
+
+    @classmethod
+    def bitrate_bucket(cls, bitRate):
+        """Возвращает нижнюю границу диапазона, в который попадает
+        значение bitRate, или 0, если битрейт неизвестен."""
+
+        if bitRate <= 0:
+            return 0
+
+        return cls.BITRATE_BUCKETS[max(0, bisect_right(cls.BITRATE_BUCKETS, bitRate) - 1)]
+
+    @classmethod
+    def bitrate_bucket_str(cls, bucket):
+        """Возвращает строку с диапазоном битрейта для значения,
+        полученного от bitrate_bucket()."""
+
+        if not isinstance(bucket, int):
+            # '?' из get_table()
+            return str(bucket)
+
+        ix = cls.BITRATE_BUCKETS.index(bucket) + 1
+
+        if ix >= len(cls.BITRATE_BUCKETS):
+            return '%d+' % bucket
+
+        return '%d-%d' % (bucket, cls.BITRATE_BUCKETS[ix] - 1)
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.nAudioFiles = 0
+
+        self.sampleRates = dict()
+        self.bitsPerSample = dict()
+        self.bitRates = dict()
+
+        self.totals = OrderedDict()
+
+        for nres in self.TS_BY_RES:
+            self.totals[nres] = 0
+
+        self.totals[self.TS_LOSSY] = 0
+        self.totals[self.TS_MISTAGS] = 0
+        self.totals[self.TS_WITH_ERRORS] = 0
+
+    def update_from_file(self, nfo):
+        """Пополнение статистики.
+        nfo - экземпляр AudioFileInfo."""
+
+        if nfo.error:
+            self.totals[self.TS_WITH_ERRORS] += 1
+            return
+
+        self.nAudioFiles += 1
+
+        self.sampleRates[nfo.sampleRate] = self.sampleRates.get(nfo.sampleRate, 0) + 1
+        self.bitsPerSample[nfo.bitsPerSample] = self.bitsPerSample.get(nfo.bitsPerSample, 0) + 1
+
+        bucket = self.bitrate_bucket(nfo.bitRate)
+        self.bitRates[bucket] = self.bitRates.get(bucket, 0) + 1
+
+        if nfo.lossy:
+            self.totals[self.TS_LOSSY] += 1
+
+        if nfo.resolution is not None:
+            self.totals[self.TS_BY_RES[nfo.resolution]] += 1
+
+        if nfo.missingTags:
+            self.totals[self.TS_MISTAGS] += 1
+
+    def get_table(self, srcd, _sort):
+        """Возвращает список строк статистической таблицы.
+
+        Параметры:
+            srcd    - словарь (одно из полей sampleRates, bitsPerSample,
+                      bitRates, totals);
+            _sort   - булевское значение, True - сортировать таблицу по
+                      именам параметров.
+
+        Элементы списка - кортежи вида (параметр, кол-во файлов, проценты);
+        строки с нулевым кол-вом файлов пропускаются;
+        файлы, где нет соотв. параметра в метаданных (значение 0),
+        попадают в строку с параметром '?' в конце таблицы."""
+
+        __pcts = lambda n: 0 if not self.nAudioFiles else int(float(n) / self.nAudioFiles * 100.0)
+
+        dlst = srcd.items()
+        if _sort:
+            dlst = sorted(dlst)
+
+        r = [(param, n, __pcts(n)) for param, n in dlst if param != 0 and n]
+
+        n = srcd.get(0)
+        if n:
+            r.append(('?', n, __pcts(n)))
+
+        return r
+
+
 class AudioFileFilter(Representable):
     """Параметры фильтрации аудиофайлов.
 
@@ -430,151 +620,431 @@ class AudioFileFilter(Representable):
     def filetypes_to_str(self):
         return set_to_str(self.fileTypes)
 
-    def get_audio_file_info(self, fpath):
+    def needs_tags(self):
+        """Возвращает True, если для фильтрации нужен полный разбор
+        файлов mutagen'ом, т.е. параметров из заголовков файлов
+        (см. модуль asprobe) недостаточно: фильтрация по наличию тэгов
+        или по ошибкам разбора метаданных."""
+
+        return self.byMissingTags or self.byErrors
+
+    def compile(self, headerOnly=False):
+        """Возвращает экземпляр AudioFilterPlan для текущих
+        значений параметров фильтрации.
+
+        Параметры:
+            headerOnly  - булевское, см. AudioFilterPlan."""
+
+        return AudioFilterPlan(self, headerOnly)
+
+    def get_audio_file_info(self, fpath, cache=None, headerOnly=False):
         """Проверка типа файла и извлечение параметров потока
         и метаданных из аудиофайла.
 
+        Для обработки множества файлов лучше один раз получить
+        AudioFilterPlan методом compile() и пользоваться им.
+
         Параметры:
-            fpath   - строка, полный путь к файлу;
-            fexts   - множество строк - расширений (типов) файлов.
+            fpath       - строка, полный путь к файлу;
+            cache       - None или экземпляр ascache.MetadataCache;
+                          если указан, параметры неизменившихся файлов
+                          берутся из кэша без разбора файла;
+            headerOnly  - булевское, см. AudioFilterPlan.
 
         Возвращает экземпляр AudioFileInfo, если файл - поддерживаемого
         типа и соответствует параметрам фильтрации,
         в прочих случаях - None."""
 
-        def __get_info_fld(info, name, fallback):
-            if name in info.__dict__:
-                return getattr(info, name)
+        return self.compile(headerOnly).get_audio_file_info(fpath, cache)
+
+
+class AudioFilterPlan():
+    """Параметры фильтрации, "скомпилированные" для обработки
+    множества файлов (напр. на время одного обхода каталога).
+
+    Все условия фильтрации заранее превращаются в списки функций,
+    а проверки выполняются от дешёвых к дорогим:
+    1. тип (расширение) файла;
+    2. размер файла (если os.stat_result уже есть - напр. получен
+       для поиска в кэше): из пустого файла извлекать нечего;
+    3. параметры потока из заголовка файла (модуль asprobe, только для
+       поддерживаемых им форматов);
+    4. полный разбор файла mutagen'ом - только если он действительно
+       нужен для проверки оставшихся условий.
+
+    Файлы, отброшенные до полного разбора, отбрасываются и при полном
+    разборе, т.е. результаты фильтрации от способа извлечения
+    параметров не зависят.
+    Если фильтрация по ошибкам разбора включена, ранний отказ
+    невозможен (ошибка может найтись в тэгах, а файлы с ошибками
+    фильтрацию проходят) - такие файлы разбираются всегда.
+
+    Поля:
+        fileExts        - множество строк, расширения обрабатываемых
+                          файлов;
+        passErrors      - булевское, True - файлы с ошибками разбора
+                          проходят фильтрацию;
+        fullParse       - булевское, True - прошедшие фильтрацию файлы
+                          разбираются полностью (с тэгами); False -
+                          по возможности извлекаются только параметры
+                          потока из заголовков;
+        streamChecks    - кортеж функций с одним параметром -
+                          экземпляром AudioFileInfo, проверяющих
+                          параметры потока; функции возвращают True,
+                          если файл соответствует условию;
+        tagChecks       - кортеж функций, проверяющих тэги;
+        criteria        - кортеж кортежей вида (CR_*, значение) -
+                          те же условия (кроме типов файлов) в виде
+                          данных, для фильтрации без перебора файлов
+                          (см. asresults.ScanResults.select())."""
+
+    # условия фильтрации (см. поле criteria)
+    CR_ONLY_ERRORS,\
+    CR_STREAM_PARAMETERS,\
+    CR_LOSSLESS,\
+    CR_RESOLUTION,\
+    CR_MAX_BITRATE,\
+    CR_MIN_BITRATE,\
+    CR_MISSING_TAGS = range(7)
+
+    def __init__(self, ffilter, headerOnly=False):
+        """Параметры:
+            ffilter     - экземпляр AudioFileFilter или None;
+                          в последнем случае фильтрации нет - проходят
+                          все файлы известных типов, в т.ч. с ошибками
+                          (напр. для последующей фильтрации в памяти,
+                          см. asscanner.ScanResults);
+            headerOnly  - булевское, True - если фильтру не нужны тэги,
+                          извлекать только параметры потока
+                          из заголовков файлов (см. read_audio_file_info())."""
+
+        if ffilter is None:
+            self.fileExts = frozenset(DEFAULT_AUDIO_FILE_EXTS)
+            self.passErrors = True
+            self.fullParse = not headerOnly
+
+            # пустой фильтр ничего не проверяет
+            ffilter = AudioFileFilter()
+        else:
+            self.fileExts = frozenset(ffilter.fileTypes if ffilter.byFileTypes else DEFAULT_AUDIO_FILE_EXTS)
+            self.passErrors = ffilter.byErrors
+            self.fullParse = not headerOnly or ffilter.needs_tags()
+
+        streamChecks = []
+        criteria = []
+
+        if ffilter.byErrors and ffilter.onlyWithErrors:
+            # файл без ошибок, а тут мы хотим одних лишь ошибок
+            streamChecks.append(lambda nfo: False)
+            criteria.append((self.CR_ONLY_ERRORS, True))
+
+        if ffilter.byContainsStreamParameters:
+            # для тэгов hasParameters не считаем, тэги - не параметры аудиопотока
+            hasParameters = ffilter.onlyContainsStreamParameters
+            streamChecks.append(lambda nfo: nfo.has_stream_parameters() == hasParameters)
+            criteria.append((self.CR_STREAM_PARAMETERS, hasParameters))
+
+        if ffilter.byLossless and ffilter.onlyLossless:
+            streamChecks.append(lambda nfo: not nfo.lossy)
+            criteria.append((self.CR_LOSSLESS, True))
+
+        if ffilter.byResolution:
+            resolution = ffilter.resolution
+            streamChecks.append(lambda nfo: nfo.resolution == resolution)
+            criteria.append((self.CR_RESOLUTION, resolution))
+
+        if ffilter.byBitrate:
+            if ffilter.bitrateLowerThan:
+                maxBitrate = ffilter.bitrateLowerThanValue
+                streamChecks.append(lambda nfo: nfo.bitRate <= maxBitrate)
+                criteria.append((self.CR_MAX_BITRATE, maxBitrate))
             else:
-                return fallback
+                minBitrate = ffilter.bitrateGreaterThanValue
+                streamChecks.append(lambda nfo: nfo.bitRate >= minBitrate)
+                criteria.append((self.CR_MIN_BITRATE, minBitrate))
 
-        fext = os.path.splitext(fpath)[-1].lower()
+        tagChecks = []
 
-        # расширение проверяем в любом случае:
-        # если указано "проверять тип" - по выбранным типам
-        # иначе - по всем известным типам
-        if fext not in (self.fileTypes if self.byFileTypes else DEFAULT_AUDIO_FILE_EXTS):
-            return
+        if ffilter.byMissingTags:
+            missing = ffilter.onlyMissingTags
+            tagChecks.append(lambda nfo: (nfo.missingTags != 0) == missing)
+            criteria.append((self.CR_MISSING_TAGS, missing))
 
-        nfo = AudioFileInfo()
+        self.streamChecks = tuple(streamChecks)
+        self.tagChecks = tuple(tagChecks)
+        self.criteria = tuple(criteria)
 
-        def __has_tags(fnfo, tnames):
-            for n in tnames:
-                if n in fnfo:
-                    return True
+        self.__checks = self.streamChecks + self.tagChecks
+
+        # отказ по параметрам из заголовка допустим, только если файлы
+        # с ошибками всё равно отбрасываются
+        self.__rejectEarly = not self.passErrors and bool(self.streamChecks)
 
+        # из пустого файла mutagen или ничего не извлечёт, или сообщит
+        # об ошибке - и то, и другое проверяется заранее
+        emptyInfo = AudioFileInfo()
+        emptyInfo.update_derived_fields()
+
+        self.__rejectEmpty = not self.passErrors and not self.filter_file_info(emptyInfo)
+
+    def check_file(self, fpath, st=None):
+        """Проверка файла до извлечения параметров.
+
+        Параметры:
+            fpath   - строка, полный путь к файлу;
+            st      - None или os.stat_result для файла.
+
+        Возвращает False, если файл заведомо не пройдёт фильтрацию."""
+
+        if os.path.splitext(fpath)[-1].lower() not in self.fileExts:
             return False
 
-        try:
-            f = mutagen.File(fpath)
+        if st is not None and st.st_size == 0 and self.__rejectEmpty:
+            return False
 
-            #
-            # фильтрация по указанным параметрам.
-            # файлы, не прошедшие фильтрацию - отбрасываем
-            #
+        return True
 
-            if self.byErrors and self.onlyWithErrors:
-                # файл без ошибок, а тут мы хотим одних лишь ошибок
-                return
+    def __rejected_by_header(self, nfo):
+        """Возвращает True, если файл с параметрами из заголовка
+        заведомо не пройдёт фильтрацию."""
 
-            #
-            hasParameters = 0
+        if self.__rejectEarly:
+            for check in self.streamChecks:
+                if not check(nfo):
+                    return True
 
-            if f:
-                # извлекаем параметры и метаданные,
-                # фильтровать по всему этому будем потом
+        return False
 
-                #
-                nfo.mime = str(f.mime[0])
-                nfo.lossy = nfo.mime not in LOSSLESS_MIMETYPES
+    def is_complete(self, nfo):
+        """Возвращает True, если параметров nfo (экземпляра AudioFileInfo,
+        напр. взятого из кэша метаданных) достаточно для фильтрации
+        и отображения, т.е. файл не нужно разбирать заново."""
 
-                #
-                nfo.sampleRate = __get_info_fld(f.info, 'sample_rate', 0)
-                nfo.channels = __get_info_fld(f.info, 'channels', 1)
-                nfo.bitsPerSample = __get_info_fld(f.info, 'bits_per_sample', 0)
-                nfo.bitRate = int(__get_info_fld(f.info, 'bitrate', 0) / 1024)
+        return nfo.tagsRead or bool(nfo.error) or not self.fullParse\
+            or self.__rejected_by_header(nfo)
 
-                for v in (nfo.sampleRate, nfo.channels, nfo.bitsPerSample, nfo.bitRate):
-                    if v > 0:
-                        hasParameters += 1
+    def read_file_info(self, fpath, tracker=None):
+        """Извлечение параметров файла способом, достаточным
+        для фильтрации (см. описание класса).
 
-                #
-                tags = getattr(f, 'tags', None)
-                if tags:
-                    nfo.missingTags = 0
+        tracker - None или экземпляр asiosched.ReadTracker
+        (см. read_audio_file_info()).
 
-                    for ix, (_, tnames) in enumerate(TAGS):
-                        if not __has_tags(f, tnames):
-                            nfo.missingTags = nfo.missingTags or (1 << ix)
-                # для тэгов hasParameters не трогаем, тэги - не параметры аудиопотока
+        Возвращает экземпляр AudioFileInfo; фильтрацию следует
+        выполнять методом filter_file_info()."""
 
-            #
-            # теперь уже пытаемся фильтровать
-            #
+        if not self.fullParse or self.__rejectEarly:
+            nfo = read_audio_header_info(fpath, tracker)
 
-            #
-            if self.byContainsStreamParameters:
-                if self.onlyContainsStreamParameters:
-                    if not hasParameters:
-                        return
-                else:
-                    if hasParameters:
-                        return
+            if nfo is not None and (not self.fullParse or self.__rejected_by_header(nfo)):
+                return nfo
 
-            #
-            if self.byLossless and self.onlyLossless and nfo.lossy:
-                return
+        return read_audio_file_info(fpath, tracker=tracker)
 
-            #
-            # пока проверка "на хайрез" приколочена гвоздями здесь
-            #
-            # ВНИМАНИЕ! файлы
-            if nfo.bitsPerSample < 16 or nfo.sampleRate < 44100:
-                nfo.resolution = AudioStreamInfo.RESOLUTION_LOW
-            elif nfo.bitsPerSample > 16 and nfo.sampleRate >= 44100:
-                nfo.resolution = AudioStreamInfo.RESOLUTION_HIGH
-            else:
-                nfo.resolution = AudioStreamInfo.RESOLUTION_STANDARD
+    def filter_file_info(self, nfo):
+        """Фильтрация уже извлечённых из файла параметров.
 
-            if self.byResolution and self.resolution != nfo.resolution:
-                return
+        Параметры:
+            nfo     - экземпляр AudioFileInfo (напр. полученный
+                      от read_file_info() или из кэша метаданных).
 
-            #
-            if self.byBitrate:
-                if self.bitrateLowerThan:
-                    if nfo.bitRate > self.bitrateLowerThanValue:
-                        return
-                elif nfo.bitRate < self.bitrateGreaterThanValue:
-                    return
+        Возвращает True, если файл соответствует параметрам фильтрации."""
 
-            #
+        if nfo.error:
+            return self.passErrors
+
+        for check in self.__checks:
+            if not check(nfo):
+                return False
 
-            if self.byMissingTags:
-                if (self.onlyMissingTags and nfo.missingTags == 0) or\
-                        (not self.onlyMissingTags and nfo.missingTags != 0):
+        return True
+
+    def get_audio_file_info(self, fpath, cache=None):
+        """Проверка типа файла и извлечение параметров потока
+        и метаданных из аудиофайла.
+
+        Параметры:
+            fpath   - строка, полный путь к файлу;
+            cache   - None или экземпляр ascache.MetadataCache;
+                      если указан, параметры неизменившихся файлов
+                      берутся из кэша без разбора файла.
+
+        Возвращает экземпляр AudioFileInfo, если файл - поддерживаемого
+        типа и соответствует параметрам фильтрации,
+        в прочих случаях - None."""
+
+        if not self.check_file(fpath):
+            return
+
+        nfo = None
+
+        if cache is not None:
+            try:
+                st = os.stat(fpath)
+            except OSError:
+                # файл пропал или недоступен - пусть с ним разбирается mutagen,
+                # а в кэш такое не кладём
+                cache = None
+            else:
+                if not self.check_file(fpath, st):
                     return
 
-        except mutagen.MutagenError as ex:
-            # с прочими исключениями - обязательно падаем!
+                nfo = cache.lookup(fpath, st)
 
-            if not self.byErrors:
-                return
+                if nfo is not None and not self.is_complete(nfo):
+                    nfo = None
 
-            nfo.error = str(ex)
+                cache.count_lookup(nfo is not None)
 
-        return nfo
+        if nfo is None:
+            nfo = self.read_file_info(fpath)
 
+            if cache is not None:
+                cache.store(fpath, st, nfo)
 
-def __test_scan_directory(path, cfg):
-    print('\033[1m%s/\033[0m' % path)
+        if self.filter_file_info(nfo):
+            return nfo
+
+
+# имена полей AudioFileInfo, соответствующие им имена полей
+# mutagen.FileType.info и значения по умолчанию
+_STREAM_INFO_FIELDS = (('sampleRate', 'sample_rate', 0),
+    ('channels', 'channels', 1),
+    ('bitsPerSample', 'bits_per_sample', 0))
+
+# кортежи вида (битовый флаг TAG_xxx, имена тэгов) для заполнения
+# AudioStreamInfo.missingTags
+_TAG_FLAGS = tuple((1 << ix, tnames) for ix, (_, tnames) in enumerate(TAGS))
+
+
+def read_audio_header_info(fpath, tracker=None):
+    """Извлечение параметров потока из заголовка файла без разбора тэгов
+    (см. модуль asprobe).
+
+    Параметры:
+        fpath   - строка, полный путь к файлу;
+        tracker - см. read_audio_file_info().
+
+    Возвращает экземпляр AudioFileInfo (с tagsRead == False)
+    или None, если формат файла не поддерживается asprobe
+    или заголовок не удалось разобрать."""
+
+    sinfo = probe_stream_info(fpath, tracker)
+    if sinfo is None:
+        return
+
+    nfo = AudioFileInfo()
+
+    nfo.mime, nfo.sampleRate, nfo.channels, nfo.bitsPerSample, bitRate = sinfo
+    nfo.bitRate = int(bitRate / 1024)
+
+    nfo.update_derived_fields()
+
+    return nfo
+
+
+def _mutagen_file(filething):
+    """Вызов mutagen.File(filething).
+
+    Некоторые загрузчики mutagen на испорченных заголовках падают
+    не с MutagenError, а с IndexError и т.п. (напр. WavPack - при
+    недопустимом номере частоты сэмплирования); это ошибка файла,
+    а не программы, так что такие исключения превращаются в MutagenError."""
+
+    try:
+        return mutagen.File(filething)
+    except (IndexError, ValueError) as ex:
+        raise mutagen.MutagenError('%s: %s' % (ex.__class__.__name__, ex))
+
+
+def read_audio_file_info(fpath, headerOnly=False, tracker=None):
+    """Извлечение параметров потока и метаданных из аудиофайла
+    без какой-либо фильтрации.
+
+    Параметры:
+        fpath       - строка, полный путь к файлу;
+        headerOnly  - булевское; True - для форматов, поддерживаемых
+                      модулем asprobe (FLAC, WAV, AIFF, WavPack, APE),
+                      параметры потока извлекаются из заголовка файла
+                      без разбора тэгов; поле missingTags при этом
+                      не заполняется, а ошибки в метаданных
+                      не обнаруживаются;
+        tracker     - None или экземпляр asiosched.ReadTracker;
+                      если указан, файл читается через него (учёт
+                      прочитанного, удаление прочитанного из страничного
+                      кэша, ограничение скорости чтения).
 
-    for fname in os.listdir(path):
-        fpath = os.path.join(path, fname)
+    Возвращает экземпляр AudioFileInfo; если mutagen не смог
+    разобрать файл - у возвращаемого экземпляра заполнено поле error."""
 
-        if os.path.isdir(fpath):
-            __test_scan_directory(fpath, cfg)
+    if headerOnly:
+        nfo = read_audio_header_info(fpath, tracker)
+        if nfo is not None:
+            return nfo
+
+    nfo = AudioFileInfo()
+
+    try:
+        if tracker is None:
+            f = _mutagen_file(fpath)
         else:
-            print('\033[32m%s\033[0m' % fname)
+            try:
+                fobj = tracker.open(fpath)
+            except OSError as ex:
+                # mutagen.File(fpath) превратил бы это в MutagenError
+                raise mutagen.MutagenError(ex)
+
+            with fobj:
+                f = _mutagen_file(fobj)
+
+        # файл разобран полностью, даже если mutagen его не опознал -
+        # повторный разбор ничего нового не даст
+        nfo.tagsRead = True
+
+        # ВНИМАНИЕ! экземпляр mutagen.FileType без тэгов - пустой
+        # словарь, т.е. False, а параметры потока у него есть
+        if f is not None:
+            # извлекаем параметры и метаданные,
+            # фильтровать по всему этому будем потом
+
+            #
+            nfo.mime = str(f.mime[0])
+
+            #
+            info = f.info.__dict__
+
+            # некоторые параметры у mutagen бывают None
+            # (напр. разрядность OptimFROG неизвестного типа)
+            for name, mname, fallback in _STREAM_INFO_FIELDS:
+                setattr(nfo, name, int(info.get(mname) or fallback))
+
+            nfo.bitRate = int((info.get('bitrate') or 0) / 1024)
+
+            #
+            if getattr(f, 'tags', None):
+                # запоминаем только первый отсутствующий тэг
+                for flag, tnames in _TAG_FLAGS:
+                    if not any(n in f for n in tnames):
+                        nfo.missingTags = flag
+                        break
+
+    except mutagen.MutagenError as ex:
+        # с прочими исключениями - обязательно падаем!
+        # сообщение бывает пустым (напр. id3.error(OSError()) у обрезанного
+        # MP3), а пустая строка означает "ошибки нет"
+        nfo.error = str(ex) or type(ex).__name__
+
+    nfo.update_derived_fields()
+
+    return nfo
+
+
+def __test_scan_directory(path, cfg):
+    for evtype, fpath, _ in walk_directory(path):
+        if evtype == WALK_DIR_ENTER:
+            print('\033[1m%s/\033[0m' % fpath)
+        elif evtype == WALK_FILE:
+            print('\033[32m%s\033[0m' % os.path.split(fpath)[1])
             nfo = cfg.filter.get_audio_file_info(fpath)
             if nfo:
                 if not nfo.error:
@@ -584,6 +1054,11 @@ def __test_scan_directory(path, cfg):
 
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        # python3 -m audiostat scan ...
+        from ascli import main
+        sys.exit(main(sys.argv[1:]))
+
     print('[debugging %s]' % __file__)
 
     import asconfig
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" test_asexport.py
+
+    Copyright 2021 MC-6312
+
+    his file is part of AudioStat.
+
+    AudioStat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    AudioStat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with AudioStat.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+import os
+import os.path
+import json
+import sqlite3
+import tempfile
+import unittest
+
+from asexport import *
+
+
+# два разных имени, которые escape_path() превращает в одно и то же
+PATHS = (os.fsdecode(b'/music/a\xff.flac'), '/music/a\\xff.flac')
+
+
+class NonUTF8PathsTest(unittest.TestCase):
+    """Выгрузка путей с байтами, не укладывающимися в UTF-8."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def export(self, fname):
+        fpath = os.path.join(self.tmpdir.name, fname)
+
+        with new_exporter(fpath) as exporter:
+            for path in PATHS:
+                exporter.write_file(path, AudioFileInfo())
+
+        return fpath
+
+    def test_ndjson(self):
+        with open(self.export('r.ndjson'), 'rb') as f:
+            recs = [json.loads(s) for s in f.read().decode('utf-8').splitlines()]
+
+        self.assertEqual(tuple(rec['path'] for rec in recs), PATHS)
+
+    def test_csv(self):
+        with open(self.export('r.csv'), 'rb') as f:
+            f.read().decode('utf-8')
+
+    def test_sqlite(self):
+        db = sqlite3.connect(self.export('r.sqlite'))
+
+        try:
+            paths = [os.fsdecode(path) if isinstance(path, bytes) else path
+                for path, in db.execute('SELECT path FROM files;')]
+        finally:
+            db.close()
+
+        self.assertEqual(sorted(paths), sorted(PATHS))
+
+
+if __name__ == '__main__':
+    unittest.main()
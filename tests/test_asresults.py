@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" test_asresults.py
+
+    Copyright 2021 MC-6312
+
+    his file is part of AudioStat.
+
+    AudioStat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    AudioStat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with AudioStat.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+import os.path
+import struct
+import tempfile
+import unittest
+
+from asprobe import *
+from asresults import *
+
+
+def _make_wave(fpath, sampleRate):
+    fmt = struct.pack('<HHLLHH', 1, 2, sampleRate, 0, 4, 16)
+    data = bytes(4000)
+    body = b'WAVE' + b'fmt ' + struct.pack('<L', len(fmt)) + fmt\
+        + b'data' + struct.pack('<L', len(data)) + data
+
+    with open(fpath, 'wb') as f:
+        f.write(b'RIFF' + struct.pack('<L', len(body)) + body)
+
+
+class HugeStreamParamsTest(unittest.TestCase):
+    """Параметры потока из испорченных заголовков."""
+
+    def test_probe_rejects(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fpath = os.path.join(tmpdir, 'bad.wav')
+
+            _make_wave(fpath, 0xFFFFFFFF)
+            self.assertIsNone(probe_stream_info(fpath))
+
+            _make_wave(fpath, 44100)
+            self.assertEqual(probe_stream_info(fpath)[1], 44100)
+
+    def test_add_file(self):
+        results = ScanResults('', AudioFilterPlan(None))
+        dirIx = results.add_dir(-1, '')
+
+        nfo = AudioFileInfo()
+        nfo.sampleRate = 10 ** 10
+        nfo.channels = 1 << 20
+        nfo.bitsPerSample = 16
+        nfo.bitRate = 10 ** 12
+
+        results.add_file(dirIx, 'bad.aiff', nfo)
+
+        self.assertEqual(results.sampleRate[0], 0xFFFFFFFF)
+        self.assertEqual(results.channels[0], 0xFFFF)
+        self.assertEqual(results.bitsPerSample[0], 16)
+        self.assertEqual(results.bitRate[0], 0xFFFFFFFF)
+
+        for column in (results.fileDir, results.sampleRate, results.channels,
+                results.bitsPerSample, results.bitRate, results.missingTags,
+                results.flags, results.mimeIx, results.extIx):
+            self.assertEqual(len(column), 1)
+
+        self.assertEqual(results.get_file_name(0), 'bad.aiff')
+
+
+if __name__ == '__main__':
+    unittest.main()
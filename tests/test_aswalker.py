@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" test_aswalker.py
+
+    Copyright 2021 MC-6312
+
+    his file is part of AudioStat.
+
+    AudioStat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    AudioStat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with AudioStat.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+import os
+import os.path
+import tempfile
+import unittest
+from unittest import mock
+
+from aswalker import *
+
+
+class UnreadableSubdirTest(unittest.TestCase):
+    """Обход дерева с подкаталогом, который нельзя прочитать."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.rootdir = self.tmpdir.name
+
+        for path in ('a/1.flac', 'locked/2.flac', 'z/3.flac'):
+            path = os.path.join(self.rootdir, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'wb').close()
+
+        self.locked = os.path.join(self.rootdir, 'locked')
+
+    def tearDown(self):
+        os.chmod(self.locked, 0o755)
+        self.tmpdir.cleanup()
+
+    def check_walk(self):
+        events = list(walk_directory(self.rootdir))
+
+        files = sorted(os.path.relpath(path, self.rootdir) for evtype, path, _ in events if evtype == WALK_FILE)
+        self.assertEqual(files, ['a/1.flac', 'z/3.flac'])
+
+        ix = [evtype for evtype, path, _ in events if path == self.locked]
+        self.assertEqual(ix, [WALK_DIR_ENTER, WALK_DIR_ERROR, WALK_DIR_LEAVE])
+
+        err = [entry for evtype, _, entry in events if evtype == WALK_DIR_ERROR][0]
+        self.assertIsInstance(err, PermissionError)
+
+        self.assertEqual(sum(evtype == WALK_DIR_ENTER for evtype, _, _ in events),
+            sum(evtype == WALK_DIR_LEAVE for evtype, _, _ in events))
+
+    @unittest.skipIf(os.geteuid() == 0, 'root can read mode 000 directories')
+    def test_mode_000(self):
+        os.chmod(self.locked, 0)
+        self.check_walk()
+
+    def test_scandir_denied(self):
+        scandir = os.scandir
+
+        def __scandir(path):
+            if path == self.locked:
+                raise PermissionError(13, 'Permission denied', path)
+
+            return scandir(path)
+
+        with mock.patch('os.scandir', __scandir):
+            self.check_walk()
+
+
+if __name__ == '__main__':
+    unittest.main()
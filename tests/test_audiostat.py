@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" test_audiostat.py
+
+    Copyright 2021 MC-6312
+
+    his file is part of AudioStat.
+
+    AudioStat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    AudioStat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with AudioStat.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+import os.path
+import tempfile
+import unittest
+
+from audiostat import *
+
+
+class TruncatedFileTest(unittest.TestCase):
+    """Файл, на котором mutagen падает с пустым сообщением об ошибке."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fpath = os.path.join(self.tmpdir.name, 'truncated.mp3')
+
+        # тэг ID3v2.4 длиной 2048 байт, от которого осталось 10
+        with open(self.fpath, 'wb') as f:
+            f.write(b'ID3\x04\x00\x00\x00\x00\x10\x00' + bytes(10))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_error(self):
+        nfo = read_audio_file_info(self.fpath)
+
+        self.assertTrue(nfo.error)
+
+    def test_filter(self):
+        ffilter = AudioFileFilter()
+        ffilter.byErrors = True
+        ffilter.onlyWithErrors = True
+
+        plan = AudioFilterPlan(ffilter)
+        nfo = plan.read_file_info(self.fpath)
+
+        self.assertTrue(plan.filter_file_info(nfo))
+        self.assertTrue(plan.is_complete(nfo))
+
+    def test_summary(self):
+        summary = AudioSummary()
+        summary.update_from_file(read_audio_file_info(self.fpath))
+
+        self.assertEqual(summary.nAudioFiles, 0)
+        self.assertEqual(summary.totals[AudioSummary.TS_WITH_ERRORS], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
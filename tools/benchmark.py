@@ -0,0 +1,804 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" benchmark.py
+
+    Copyright 2021 MC-6312
+
+    his file is part of AudioStat.
+
+    AudioStat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    AudioStat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with AudioStat.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+# Замеры скорости отдельных стадий обработки на синтетической
+# фонотеке (см. genlibrary.py): обход каталогов, разбор файлов
+# каждого типа, сбор статистики по каталогам, суммарные таблицы,
+# фильтрация результатов в памяти, построение дерева статистики,
+# загрузка и сохранение настроек.
+#
+# Каждый замер выполняется в отдельном процессе (чтобы пиковый
+# расход памяти относился только к нему); результаты сравниваются
+# с сохранённым ранее "эталоном" (JSON), и если какая-то стадия
+# стала медленнее (или прожорливее) больше, чем на заданный порог,
+# программа завершается с кодом 1.
+
+
+import sys
+import os
+import os.path
+import json
+import shutil
+import tempfile
+import traceback
+import multiprocessing
+from array import array
+from time import perf_counter
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.split(os.path.split(os.path.abspath(__file__))[0])[0])
+
+from audiostat import *
+from asconfig import *
+from asresults import *
+from asscanner import *
+from asengine import *
+from asiosched import evict_file
+
+from genlibrary import LibraryGenerator
+
+try:
+    import resource
+except ImportError:
+    # винда
+    resource = None
+
+
+#
+# пиковый расход памяти
+#
+
+def reset_peak_rss():
+    """Сброс счётчика пикового расхода памяти процесса (VmHWM;
+    только Linux 4.0+, в прочих случаях пиковое значение
+    считается с начала работы процесса)."""
+
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def get_peak_rss():
+    """Возвращает пиковый расход памяти процесса в байтах
+    (0, если узнать его не удалось)."""
+
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for s in f:
+                if s.startswith('VmHWM:'):
+                    return int(s.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    if resource is None:
+        return 0
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # в линуксе - килобайты, в макоси - байты
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def percentile(values, pct):
+    """Возвращает значение pct-го процентиля (ближайшее к нему
+    значение из values; 0.0 для пустой последовательности)."""
+
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+#
+# замеры
+#
+
+def list_tree(rootdir):
+    """Возвращает кортеж из двух элементов:
+    1. список кортежей (путь к каталогу, номер родительского
+       каталога в этом списке или -1) в порядке обхода;
+    2. список списков путей к файлам (номер элемента - номер каталога)."""
+
+    dirs = []
+    files = []
+    stack = []
+
+    for evtype, path, _ in walk_directory(rootdir):
+        if evtype == WALK_DIR_ENTER:
+            dirs.append((path, stack[-1] if stack else -1))
+            files.append([])
+            stack.append(len(dirs) - 1)
+        elif evtype == WALK_DIR_LEAVE:
+            stack.pop()
+        elif evtype == WALK_FILE:
+            files[stack[-1]].append(path)
+
+    return dirs, files
+
+
+class Benchmark():
+    """Базовый класс замера.
+
+    Метод setup() готовит данные (время его работы не учитывается),
+    метод run() выполняет замер и возвращает кортеж из трёх элементов:
+    (кол-во обработанных единиц, общее время в секундах,
+    последовательность значений времени обработки единиц в секундах).
+
+    Поля:
+        unit    - строка, название единицы ('files', 'dirs' и т.п.);
+        rootdir - строка, путь к синтетической фонотеке."""
+
+    unit = 'files'
+
+    def __init__(self, rootdir):
+        self.rootdir = rootdir
+
+    def setup(self):
+        pass
+
+    def run(self):
+        raise NotImplementedError()
+
+    def cleanup(self):
+        """Удаление того, что создал setup()."""
+
+        pass
+
+
+class WalkBenchmark(Benchmark):
+    """Обход каталогов (aswalker.walk_directory()); время между
+    событиями WALK_FILE считается временем обработки файла.
+    Кэш каталогов ОС перед замером не сбрасывается (для этого
+    нужны права root)."""
+
+    def run(self):
+        lat = array('d')
+
+        t0 = perf_counter()
+        tprev = t0
+
+        for evtype, _, _ in walk_directory(self.rootdir):
+            if evtype == WALK_FILE:
+                t = perf_counter()
+                lat.append(t - tprev)
+                tprev = t
+
+        return len(lat), perf_counter() - t0, lat
+
+
+class ExtractBenchmark(Benchmark):
+    """Извлечение метаданных (AudioFilterPlan.get_audio_file_info())
+    из файлов одного типа.
+
+    Параметры:
+        ext         - строка, расширение имени файла;
+        headerOnly  - булевское, см. AudioFilterPlan;
+        sample      - целое, максимальное кол-во файлов (берутся
+                      равномерно из всех файлов этого типа);
+        cold        - булевское, True - перед каждым замером
+                      удалять файлы из страничного кэша."""
+
+    def __init__(self, rootdir, ext, headerOnly=False, sample=300, cold=False):
+        super().__init__(rootdir)
+
+        self.ext = ext
+        self.headerOnly = headerOnly
+        self.sample = sample
+        self.cold = cold
+
+        self.fpaths = []
+
+    def setup(self):
+        _, files = list_tree(self.rootdir)
+
+        fpaths = sorted(fpath for dfiles in files for fpath in dfiles
+            if os.path.splitext(fpath)[1] == self.ext)
+
+        step = max(1, len(fpaths) // max(1, self.sample))
+        self.fpaths = fpaths[::step][:self.sample]
+
+        self.plan = AudioFilterPlan(None, self.headerOnly)
+
+        # первый разбор - вхолостую: при нём загружаются модули mutagen
+        if self.fpaths:
+            self.plan.get_audio_file_info(self.fpaths[0])
+
+    def run(self):
+        if self.cold:
+            for fpath in self.fpaths:
+                evict_file(fpath)
+
+        lat = array('d')
+        get_audio_file_info = self.plan.get_audio_file_info
+
+        t0 = perf_counter()
+
+        for fpath in self.fpaths:
+            t = perf_counter()
+            get_audio_file_info(fpath)
+            lat.append(perf_counter() - t)
+
+        return len(lat), perf_counter() - t0, lat
+
+
+class _InfoBenchmark(Benchmark):
+    """Базовый класс замеров, которым нужны параметры всех файлов:
+    setup() разбирает все файлы фонотеки (только заголовки)."""
+
+    def setup(self):
+        self.dirs, files = list_tree(self.rootdir)
+
+        plan = AudioFilterPlan(None, True)
+
+        self.infos = [[nfo for nfo in map(plan.get_audio_file_info, dfiles) if nfo is not None]
+            for dfiles in files]
+
+
+class FileAggregateBenchmark(_InfoBenchmark):
+    """Сбор статистики по каталогам из параметров файлов
+    (AudioDirectoryInfo.update_from_file())."""
+
+    def run(self):
+        lat = array('d')
+
+        t0 = perf_counter()
+
+        for dinfos in self.infos:
+            dirinfo = AudioDirectoryInfo()
+
+            for nfo in dinfos:
+                t = perf_counter()
+                dirinfo.update_from_file(nfo)
+                lat.append(perf_counter() - t)
+
+            dirinfo.flush()
+
+        return len(lat), perf_counter() - t0, lat
+
+
+class DirAggregateBenchmark(_InfoBenchmark):
+    """Сведение статистики подкаталогов в статистику родительских
+    каталогов (AudioDirectoryInfo.update_from_dir())."""
+
+    unit = 'dirs'
+
+    def setup(self):
+        super().setup()
+
+        self.children = [[] for _ in self.dirs]
+
+        for ix, (_, parentIx) in enumerate(self.dirs):
+            if parentIx >= 0:
+                self.children[parentIx].append(ix)
+
+        self.fileStats = []
+
+        for dinfos in self.infos:
+            dirinfo = AudioDirectoryInfo()
+
+            for nfo in dinfos:
+                dirinfo.update_from_file(nfo)
+
+            self.fileStats.append(dirinfo)
+
+    def run(self):
+        lat = array('d')
+        rollups = [None] * len(self.dirs)
+
+        t0 = perf_counter()
+
+        # подкаталоги - раньше родительских каталогов
+        for ix in range(len(self.dirs) - 1, -1, -1):
+            t = perf_counter()
+
+            dirinfo = AudioDirectoryInfo()
+            dirinfo.update_from_dir(self.fileStats[ix])
+
+            for subIx in self.children[ix]:
+                dirinfo.update_from_dir(rollups[subIx])
+
+            dirinfo.flush()
+            rollups[ix] = dirinfo
+
+            lat.append(perf_counter() - t)
+
+        return len(lat), perf_counter() - t0, lat
+
+
+class SummaryBenchmark(_InfoBenchmark):
+    """Построение суммарных таблиц (AudioSummary); время
+    get_table() учитывается только в общем времени."""
+
+    def run(self):
+        lat = array('d')
+
+        t0 = perf_counter()
+
+        summary = AudioSummary()
+
+        for dinfos in self.infos:
+            for nfo in dinfos:
+                t = perf_counter()
+                summary.update_from_file(nfo)
+                lat.append(perf_counter() - t)
+
+        for srcd, _sort in ((summary.sampleRates, True), (summary.bitsPerSample, True),
+                (summary.bitRates, True), (summary.totals, False)):
+            summary.get_table(srcd, _sort)
+
+        return len(lat), perf_counter() - t0, lat
+
+
+class _ResultsBenchmark(Benchmark):
+    """Базовый класс замеров над результатами обхода:
+    setup() обходит фонотеку (как GUI - без фильтрации,
+    только заголовки) в экземпляр ScanResults."""
+
+    def setup(self):
+        with ExtractionEngine(None, 1, None, True) as engine:
+            self.results = ScanResults(self.rootdir, engine.plan)
+            Scanner(engine, self.results, False).scan(self.rootdir)
+
+        self.plan = AudioFileFilter().compile(True)
+
+
+class SelectBenchmark(_ResultsBenchmark):
+    """Фильтрация результатов в памяти, суммарные таблицы
+    и статистика по каталогам (ScanResults.select(), get_summary(),
+    get_dir_rollups()) - т.е. работа кнопки "Apply filters";
+    время обработки файла - время прохода, делённое на кол-во файлов."""
+
+    PASSES = 5
+
+    def run(self):
+        lat = array('d')
+        nfiles = max(1, self.results.nFiles)
+
+        t0 = perf_counter()
+
+        for _ in range(self.PASSES):
+            t = perf_counter()
+
+            selected = self.results.select(self.plan)
+            self.results.get_summary(selected)
+            self.results.get_dir_rollups(selected)
+
+            lat.append((perf_counter() - t) / nfiles)
+
+        return nfiles * self.PASSES, perf_counter() - t0, lat
+
+
+class TreeBenchmark(_ResultsBenchmark):
+    """Построение дерева статистики (ResultsTree) с разворачиванием
+    всех каталогов - то, что делает модель дерева в GUI при
+    отображении строк; время обработки строки - время get_children()
+    её каталога, делённое на кол-во строк, плюс время get_info()."""
+
+    unit = 'rows'
+
+    def run(self):
+        lat = array('d')
+
+        t0 = perf_counter()
+
+        selected = self.results.select(self.plan)
+        tree = ResultsTree(self.results, selected)
+
+        nfo = AudioFileInfo()
+        stack = [ResultsTree.ROOT]
+
+        while stack:
+            t = perf_counter()
+            children = tree.get_children(stack.pop())
+            tchildren = (perf_counter() - t) / max(1, len(children))
+
+            for node in children:
+                t = perf_counter()
+
+                if tree.is_dir(node):
+                    tree.get_info(node)
+                    stack.append(node)
+                else:
+                    tree.get_info(node, nfo)
+
+                lat.append(perf_counter() - t + tchildren)
+
+        return len(lat), perf_counter() - t0, lat
+
+
+class ConfigBenchmark(Benchmark):
+    """Загрузка (save == False) или сохранение (save == True)
+    файла настроек (Config.load(), Config.save()) во временном
+    каталоге рядом с фонотекой."""
+
+    unit = 'ops'
+
+    OPS = 200
+    ROOTS = 64
+
+    def __init__(self, rootdir, save=False):
+        super().__init__(rootdir)
+
+        self.save = save
+
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='cfg-', dir=os.path.split(self.rootdir)[0])
+
+        self.cfg = Config()
+        self.cfg.pathConfig = os.path.join(self.tmpdir, 'audiostat.cfg')
+        self.cfg.roots = [('/mnt/music%d' % n, n % 4) for n in range(self.ROOTS)]
+        self.cfg.save()
+
+    def run(self):
+        lat = array('d')
+        op = self.cfg.save if self.save else self.cfg.load
+
+        t0 = perf_counter()
+
+        for _ in range(self.OPS):
+            t = perf_counter()
+            op()
+            lat.append(perf_counter() - t)
+
+        return len(lat), perf_counter() - t0, lat
+
+    def cleanup(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+BENCHMARKS = {cls.__name__:cls for cls in (WalkBenchmark, ExtractBenchmark,
+    FileAggregateBenchmark, DirAggregateBenchmark, SummaryBenchmark,
+    SelectBenchmark, TreeBenchmark, ConfigBenchmark)}
+
+
+class BenchResult():
+    """Результат замера.
+
+    Поля:
+        unit    - строка, см. Benchmark.unit;
+        n       - целое, кол-во обработанных единиц;
+        seconds - вещественное, общее время;
+        rate    - вещественное, кол-во единиц в секунду;
+        p50,
+        p99     - вещественные, медиана и 99-й процентиль времени
+                  обработки единицы в секундах;
+        peakRSS - целое, пиковый расход памяти процесса в байтах."""
+
+    FIELDS = ('unit', 'n', 'seconds', 'rate', 'p50', 'p99', 'peakRSS')
+
+    def __init__(self, unit='', n=0, seconds=0.0, lat=(), peakRSS=0):
+        self.unit = unit
+        self.n = n
+        self.seconds = seconds
+        self.rate = n / seconds if seconds > 0 else 0.0
+        self.p50 = percentile(lat, 50)
+        self.p99 = percentile(lat, 99)
+        self.peakRSS = peakRSS
+
+    def to_dict(self):
+        return {name:getattr(self, name) for name in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, d):
+        r = cls()
+
+        for name in cls.FIELDS:
+            setattr(r, name, d[name])
+
+        return r
+
+
+def _run_benchmark(conn, clsname, kwargs, repeat):
+    """Выполнение замера в дочернем процессе; лучший (по общему
+    времени) из repeat результатов (или строка с сообщением
+    об ошибке) отправляется в conn."""
+
+    try:
+        bench = BENCHMARKS[clsname](**kwargs)
+        bench.setup()
+
+        try:
+            reset_peak_rss()
+
+            best = None
+
+            for _ in range(max(1, repeat)):
+                r = bench.run()
+
+                if best is None or r[1] < best[1]:
+                    best = r
+        finally:
+            bench.cleanup()
+
+        n, seconds, lat = best
+
+        conn.send(BenchResult(bench.unit, n, seconds, lat, get_peak_rss()).to_dict())
+    except BaseException:
+        conn.send(traceback.format_exc())
+    finally:
+        conn.close()
+
+
+def run_benchmark(clsname, kwargs, repeat):
+    """Выполнение замера в отдельном процессе.
+    Возвращает экземпляр BenchResult или None, если замеряемой
+    работы не нашлось; в случае ошибки - генерирует исключение."""
+
+    ctx = multiprocessing.get_context('spawn')
+
+    rconn, wconn = ctx.Pipe(False)
+
+    proc = ctx.Process(target=_run_benchmark, args=(wconn, clsname, kwargs, repeat))
+    proc.start()
+    wconn.close()
+
+    try:
+        r = rconn.recv()
+    except EOFError:
+        r = 'benchmark process exited with code %s' % proc.exitcode
+    finally:
+        proc.join()
+
+    if isinstance(r, str):
+        raise RuntimeError('%s failed:\n%s' % (clsname, r))
+
+    r = BenchResult.from_dict(r)
+
+    return r if r.n else None
+
+
+def get_benchmarks(locations, rootdirs, args):
+    """Возвращает список кортежей (имя замера, имя класса, словарь
+    параметров конструктора)."""
+
+    r = []
+
+    for location in locations:
+        rootdir = rootdirs[location]
+
+        r.append(('%s/walk' % location, 'WalkBenchmark', dict(rootdir=rootdir)))
+
+        for ext in sorted(DEFAULT_AUDIO_FILE_EXTS):
+            r.append(('%s/extract%s' % (location, ext), 'ExtractBenchmark',
+                dict(rootdir=rootdir, ext=ext, sample=args.sample, cold=location != 'tmpfs')))
+
+        for ext in sorted(PROBED_FILE_EXTS):
+            r.append(('%s/probe%s' % (location, ext), 'ExtractBenchmark',
+                dict(rootdir=rootdir, ext=ext, headerOnly=True, sample=args.sample,
+                    cold=location != 'tmpfs')))
+
+        r.append(('%s/config.load' % location, 'ConfigBenchmark', dict(rootdir=rootdir)))
+        r.append(('%s/config.save' % location, 'ConfigBenchmark', dict(rootdir=rootdir, save=True)))
+
+    # прочее от ФС не зависит
+    rootdir = rootdirs[locations[0]]
+
+    r.append(('aggregate.file', 'FileAggregateBenchmark', dict(rootdir=rootdir)))
+    r.append(('aggregate.dir', 'DirAggregateBenchmark', dict(rootdir=rootdir)))
+    r.append(('summary', 'SummaryBenchmark', dict(rootdir=rootdir)))
+    r.append(('select', 'SelectBenchmark', dict(rootdir=rootdir)))
+    r.append(('tree', 'TreeBenchmark', dict(rootdir=rootdir)))
+
+    return r
+
+
+def compare_results(results, baseline, threshold):
+    """Сравнение результатов с эталоном.
+
+    results, baseline   - словари, где ключи - имена замеров,
+                          а значения - экземпляры BenchResult;
+    threshold           - вещественное, допустимое ухудшение
+                          (доля, напр. 0.2 - 20%).
+
+    Возвращает словарь, где ключи - имена замеров, а значения -
+    списки строк с описаниями ухудшений (пустые, если их нет)."""
+
+    r = dict()
+
+    for name, res in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+
+        regs = []
+
+        if base.rate > 0 and res.rate < base.rate * (1.0 - threshold):
+            regs.append('%s/s %.1f -> %.1f' % (res.unit, base.rate, res.rate))
+
+        # мелкие колебания расхода памяти (меньше мегабайта) - не в счёт
+        if base.peakRSS > 0 and res.peakRSS > base.peakRSS * (1.0 + threshold) + 2**20:
+            regs.append('peak RSS %.1f -> %.1f MiB' % (base.peakRSS / 2**20, res.peakRSS / 2**20))
+
+        r[name] = regs
+
+    return r
+
+
+def format_result(name, res, base=None):
+    s = '%-22s %-5s %8d %12.1f %10.1f %10.1f %8.1f' % (name, res.unit, res.n,
+        res.rate, res.p50 * 1e6, res.p99 * 1e6, res.peakRSS / 2**20)
+
+    if base is not None and base.rate > 0:
+        s += ' %+7.1f%%' % ((res.rate / base.rate - 1.0) * 100.0)
+
+    return s
+
+
+BASELINE_VERSION = 1
+
+
+def load_baseline(fpath):
+    """Загрузка эталона из JSON-файла.
+    Возвращает кортеж (параметры, словарь результатов - см.
+    compare_results()) или (None, None), если файла нет."""
+
+    if not os.path.exists(fpath):
+        return None, None
+
+    with open(fpath, 'r', encoding='utf-8') as f:
+        d = json.load(f)
+
+    if d.get('version') != BASELINE_VERSION:
+        raise ValueError('unsupported version of baseline file "%s"' % fpath)
+
+    return d['parameters'], {name:BenchResult.from_dict(v) for name, v in d['results'].items()}
+
+
+def save_baseline(fpath, params, results):
+    with open(fpath, 'w', encoding='utf-8') as f:
+        json.dump({'version':BASELINE_VERSION,
+            'parameters':params,
+            'results':{name:res.to_dict() for name, res in results.items()}},
+            f, indent=1, sort_keys=True)
+
+
+DEFAULT_LOCATIONS = ('tmpfs=/dev/shm', 'disk=%s' % tempfile.gettempdir())
+
+
+def main(argv):
+    parser = ArgumentParser(prog=os.path.split(sys.argv[0])[1],
+        description='AudioStat benchmark suite')
+
+    parser.add_argument('-n', '--files', type=int, default=20000,
+        help='number of files in the generated library (default: %(default)s)')
+    parser.add_argument('-l', '--location', action='append', metavar='NAME=DIR',
+        help='where to generate the library; may be given several times '
+        '(default: %s; page cache is dropped before extraction everywhere '
+        'except location named "tmpfs")' % ' '.join(DEFAULT_LOCATIONS))
+    parser.add_argument('--sample', type=int, default=300,
+        help='max. number of files of every type to extract metadata from (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=5,
+        help='number of runs of every benchmark, the best one counts (default: %(default)s)')
+    parser.add_argument('--only', default=None, metavar='SUBSTRING',
+        help='run only benchmarks with names containing SUBSTRING (comparison is still done)')
+    parser.add_argument('-b', '--baseline', default='benchmark-baseline.json', metavar='FILE',
+        help='baseline file; created if it does not exist (default: %(default)s)')
+    parser.add_argument('-u', '--update-baseline', action='store_true',
+        help='overwrite the baseline with results of this run')
+    parser.add_argument('-t', '--threshold', type=float, default=20.0, metavar='PERCENT',
+        help='allowed regression of throughput and peak RSS (default: %(default)s%%)')
+    parser.add_argument('--keep', action='store_true',
+        help='do not remove generated libraries')
+
+    args = parser.parse_args(argv)
+
+    locations = []
+    rootdirs = dict()
+
+    for s in args.location or DEFAULT_LOCATIONS:
+        name, _, dpath = s.partition('=')
+
+        if not name or not dpath:
+            parser.error('invalid location "%s"' % s)
+
+        if not os.path.isdir(dpath):
+            print('Warning: directory "%s" for location "%s" does not exist, skipped' % (dpath, name),
+                file=sys.stderr)
+            continue
+
+        locations.append(name)
+        rootdirs[name] = dpath
+
+    if not locations:
+        parser.error('no locations')
+
+    params = {'files':args.files, 'sample':args.sample}
+
+    try:
+        baseParams, baseline = load_baseline(args.baseline)
+    except (OSError, ValueError, KeyError) as ex:
+        print('Error: cannot load baseline - %s' % ex, file=sys.stderr)
+        return 2
+
+    if baseline is not None and baseParams != params:
+        print('Warning: baseline "%s" was made with different parameters (%s), not comparing' % (
+            args.baseline, ', '.join('%s=%s' % i for i in sorted(baseParams.items()))),
+            file=sys.stderr)
+        baseline = None
+
+    tmpdirs = []
+    results = dict()
+
+    try:
+        for name in locations:
+            tmpdir = tempfile.mkdtemp(prefix='audiostat-bench-', dir=rootdirs[name])
+            tmpdirs.append(tmpdir)
+
+            rootdirs[name] = os.path.join(tmpdir, 'library')
+
+            print('Generating %d files in %s...' % (args.files, rootdirs[name]), file=sys.stderr)
+
+            gen = LibraryGenerator(rootdirs[name], args.files, seed=1)
+            gen.generate()
+
+        print('%-22s %-5s %8s %12s %10s %10s %8s' % ('benchmark', 'unit', 'n',
+            'rate/s', 'p50 us', 'p99 us', 'RSS MiB'))
+
+        for name, clsname, kwargs in get_benchmarks(locations, rootdirs, args):
+            if args.only and args.only not in name:
+                continue
+
+            res = run_benchmark(clsname, kwargs, args.repeat)
+            if res is None:
+                continue
+
+            results[name] = res
+
+            print(format_result(name, res, None if baseline is None else baseline.get(name)))
+            sys.stdout.flush()
+    finally:
+        if not args.keep:
+            for tmpdir in tmpdirs:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+
+    if baseline is None or args.update_baseline:
+        if args.only and baseline is not None:
+            # частичный прогон не должен терять прочие результаты эталона
+            baseline.update(results)
+            results = baseline
+
+        save_baseline(args.baseline, params, results)
+        print('\nBaseline saved to %s' % args.baseline)
+        return 0
+
+    regressions = [(name, regs) for name, regs in sorted(compare_results(results, baseline,
+        args.threshold / 100.0).items()) if regs]
+
+    if not regressions:
+        print('\nNo regressions (threshold %g%%)' % args.threshold)
+        return 0
+
+    print('\nRegressions (threshold %g%%):' % args.threshold)
+
+    for name, regs in regressions:
+        print('  %-22s %s' % (name, '; '.join(regs)))
+
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
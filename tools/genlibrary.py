@@ -0,0 +1,992 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+""" genlibrary.py
+
+    Copyright 2021 MC-6312
+
+    his file is part of AudioStat.
+
+    AudioStat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    AudioStat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with AudioStat.  If not, see <http://www.gnu.org/licenses/>."""
+
+
+# Генератор синтетической фонотеки для проверки AudioStat
+# на больших объёмах и замеров производительности.
+#
+# Файлы - минимальные, но правильные (разбираются mutagen и asprobe)
+# файлы всех типов из audiostat.AUDIO_FILE_TYPES: заголовки, тэги
+# и (по желанию) обложки настоящие, а на месте звука - "дыры"
+# разреженного файла (или жёсткие ссылки на образцы), так что
+# фонотека в миллионы файлов помещается на диск ноутбука.
+# При одинаковых параметрах (включая --seed) дерево получается
+# одинаковым.
+
+
+import sys
+import os
+import os.path
+import struct
+import csv
+import base64
+from random import Random
+from argparse import ArgumentParser
+
+sys.path.insert(0, os.path.split(os.path.split(os.path.abspath(__file__))[0])[0])
+
+from audiostat import AUDIO_FILE_TYPES
+
+from mutagen.ogg import OggPage
+
+
+#
+# кусочки файлов
+#
+# Файл собирается из списка "кусков": экземпляр bytes записывается
+# как есть, целое число - длина "дыры" (нулевых байт, которые
+# не записываются, а пропускаются seek'ом).
+#
+
+def parts_size(parts):
+    return sum(p if isinstance(p, int) else len(p) for p in parts)
+
+
+def write_parts(fpath, parts):
+    with open(fpath, 'wb') as f:
+        for p in parts:
+            if isinstance(p, int):
+                f.seek(p, os.SEEK_CUR)
+            else:
+                f.write(p)
+
+        # "дыра" в конце файла сама по себе его не удлиняет
+        f.truncate()
+
+
+# значения тэгов, см. audiostat.TAGS
+TAG_NAMES = ('title', 'artist', 'albumartist', 'album', 'tracknumber', 'genre', 'date')
+
+# ключи Vorbis comment используются и в тэгах APEv2 - их и ищет AudioStat
+VORBIS_KEYS = ('TITLE', 'ARTIST', 'ALBUMARTIST', 'ALBUM', 'TRACKNUMBER', 'GENRE', 'DATE')
+ID3_FRAMES = ('TIT2', 'TPE1', 'TPE2', 'TALB', 'TRCK', 'TCON', 'TDRC')
+MP4_KEYS = (b'\xa9nam', b'\xa9ART', b'aART', b'\xa9alb', None, b'\xa9gen', b'\xa9day')
+
+
+class TrackSpec():
+    """Параметры генерируемого файла.
+
+    Поля:
+        ext             - строка, расширение имени файла (с точкой);
+        sampleRate,
+        channels,
+        bitsPerSample   - целые, параметры потока;
+        bitRate         - целое, битрейт в кбит/с (для форматов
+                          со сжатием с потерями);
+        duration        - целое, длительность в секундах;
+        tags            - словарь, где ключи - TAG_NAMES, а значения -
+                          строки (отсутствующие тэги в словарь
+                          не попадают);
+        coverSize       - целое, размер обложки в байтах, 0 - без обложки;
+        corrupt         - None или строка, способ порчи заголовка
+                          (см. CORRUPTIONS)."""
+
+    def __init__(self, ext, sampleRate, channels, bitsPerSample, bitRate,
+            duration, tags, coverSize, corrupt):
+        self.ext = ext
+        self.sampleRate = sampleRate
+        self.channels = channels
+        self.bitsPerSample = bitsPerSample
+        self.bitRate = bitRate
+        self.duration = duration
+        self.tags = tags
+        self.coverSize = coverSize
+        self.corrupt = corrupt
+
+    def key(self):
+        """Возвращает кортеж значений всех полей - для поиска
+        одинаковых файлов (см. --link hard)."""
+
+        return (self.ext, self.sampleRate, self.channels, self.bitsPerSample,
+            self.bitRate, self.duration, tuple(sorted(self.tags.items())),
+            self.coverSize, self.corrupt)
+
+    def nsamples(self):
+        return self.sampleRate * self.duration
+
+    def pcm_size(self, ratio=1.0):
+        """Размер звуковых данных (в байтах) при коэффициенте сжатия ratio."""
+
+        return int(self.nsamples() * self.channels * self.bitsPerSample // 8 * ratio)
+
+    def lossy_size(self):
+        return self.bitRate * 1000 // 8 * self.duration
+
+
+#
+# тэги
+#
+
+def vorbis_comment(spec, vendor=b'genlibrary', framing=False, picture=False):
+    """Тело Vorbis comment (FLAC, Ogg Vorbis, Opus).
+    Если picture == True, обложка добавляется в виде
+    METADATA_BLOCK_PICTURE (base64)."""
+
+    comments = ['%s=%s' % (VORBIS_KEYS[TAG_NAMES.index(n)], v) for n, v in spec.tags.items()]
+
+    comments = [c.encode('utf-8') for c in comments]
+
+    if picture and spec.coverSize:
+        comments.append(b'METADATA_BLOCK_PICTURE=' + base64.b64encode(flac_picture_body(spec, b'\0' * spec.coverSize)))
+
+    r = struct.pack('<I', len(vendor)) + vendor + struct.pack('<I', len(comments))
+
+    for c in comments:
+        r += struct.pack('<I', len(c)) + c
+
+    if framing:
+        r += b'\x01'
+
+    return r
+
+
+def flac_picture_parts(spec):
+    """Куски блока PICTURE FLAC (без заголовка блока); данные
+    картинки - "дыра"."""
+
+    mime = b'image/jpeg'
+
+    return [struct.pack('>II', 3, len(mime)) + mime + struct.pack('>IIIIII', 0, 3000, 3000, 24, 0, spec.coverSize),
+        spec.coverSize]
+
+
+def flac_picture_body(spec, data):
+    mime = b'image/jpeg'
+
+    return struct.pack('>II', 3, len(mime)) + mime + struct.pack('>IIIIII', 0, 3000, 3000, 24, 0, len(data)) + data
+
+
+def syncsafe(n):
+    return bytes(((n >> 21) & 0x7f, (n >> 14) & 0x7f, (n >> 7) & 0x7f, n & 0x7f))
+
+
+def id3_parts(spec):
+    """Куски тэга ID3v2.4; данные обложки (APIC) - "дыра"."""
+
+    frames = []
+
+    for n, v in spec.tags.items():
+        data = b'\x03' + v.encode('utf-8')
+        frames.append(ID3_FRAMES[TAG_NAMES.index(n)].encode('ascii') + syncsafe(len(data)) + b'\0\0' + data)
+
+    parts = [b''.join(frames)]
+
+    if spec.coverSize:
+        head = b'\x00image/jpeg\x00\x03\x00'
+        parts.append(b'APIC' + syncsafe(len(head) + spec.coverSize) + b'\0\0' + head)
+        parts.append(spec.coverSize)
+
+    return [b'ID3\x04\x00\x00' + syncsafe(parts_size(parts))] + parts
+
+
+def apev2_parts(spec):
+    """Куски тэга APEv2 (с заголовком и "подвалом"); данные
+    обложки - "дыра"."""
+
+    items = []
+
+    for n, v in spec.tags.items():
+        value = v.encode('utf-8')
+        items.append(struct.pack('<II', len(value), 0) + VORBIS_KEYS[TAG_NAMES.index(n)].encode('ascii') + b'\0' + value)
+
+    parts = [b''.join(items)]
+    nitems = len(items)
+
+    if spec.coverSize:
+        # двоичный элемент: описание, '\0', данные
+        fname = b'cover.jpg\0'
+        parts.append(struct.pack('<II', len(fname) + spec.coverSize, 2 << 1) + b'Cover Art (Front)\0' + fname)
+        parts.append(spec.coverSize)
+        nitems += 1
+
+    size = parts_size(parts) + 32
+
+    def __hdr(flags):
+        return b'APETAGEX' + struct.pack('<IIII', 2000, size, nitems, flags) + b'\0' * 8
+
+    return [__hdr(0xA0000000)] + parts + [__hdr(0x80000000)]
+
+
+def iff_chunk(chunkid, parts, bigEndian):
+    """Куски чанка RIFF/IFF (с выравниванием на чётную границу)."""
+
+    size = parts_size(parts)
+
+    r = [chunkid + struct.pack('>I' if bigEndian else '<I', size)] + parts
+
+    if size & 1:
+        r.append(b'\0')
+
+    return r
+
+
+#
+# форматы файлов
+#
+
+def gen_flac(spec):
+    total = spec.nsamples()
+
+    si = struct.pack('>HH', 4096, 4096) + b'\0\0\x10' + b'\0\x30\0'
+    v = (spec.sampleRate << 44) | ((spec.channels - 1) << 41) | ((spec.bitsPerSample - 1) << 36) | total
+    si += v.to_bytes(8, 'big') + b'\0' * 16
+
+    blocks = [(0, [si])]
+
+    if spec.tags:
+        blocks.append((4, [vorbis_comment(spec)]))
+
+    if spec.coverSize:
+        blocks.append((6, flac_picture_parts(spec)))
+
+    blocks.append((1, [b'\0' * 1024]))
+
+    parts = [b'fLaC']
+
+    for i, (btype, bparts) in enumerate(blocks):
+        last = 0x80 if i == len(blocks) - 1 else 0
+        parts.append(bytes([btype | last]) + parts_size(bparts).to_bytes(3, 'big'))
+        parts += bparts
+
+    parts += [b'\xff\xf8', spec.pcm_size(0.6)]
+
+    return parts
+
+
+def gen_wav(spec):
+    fmt = struct.pack('<HHIIHH', 1, spec.channels, spec.sampleRate,
+        spec.sampleRate * spec.channels * spec.bitsPerSample // 8,
+        spec.channels * spec.bitsPerSample // 8, spec.bitsPerSample)
+
+    body = [b'WAVE'] + iff_chunk(b'fmt ', [fmt], False) + iff_chunk(b'data', [spec.pcm_size()], False)
+
+    if spec.tags or spec.coverSize:
+        body += iff_chunk(b'id3 ', id3_parts(spec), False)
+
+    return iff_chunk(b'RIFF', body, False)
+
+
+def ext80(x):
+    """80-битное число с плавающей точкой (частота в AIFF)."""
+
+    e = x.bit_length() - 1
+
+    return struct.pack('>HQ', 16383 + e, x << (63 - e))
+
+
+def gen_aiff(spec, aifc=False):
+    nframes = spec.nsamples()
+
+    comm = struct.pack('>hIh', spec.channels, nframes, spec.bitsPerSample) + ext80(spec.sampleRate)
+
+    if aifc:
+        name = b'not compressed'
+        comm += b'NONE' + bytes([len(name)]) + name + (b'' if len(name) & 1 else b'\0')
+
+    body = [b'AIFC' if aifc else b'AIFF']
+
+    if aifc:
+        body += iff_chunk(b'FVER', [struct.pack('>I', 0xA2805140)], True)
+
+    body += iff_chunk(b'COMM', [comm], True)
+    body += iff_chunk(b'SSND', [struct.pack('>II', 0, 0), spec.pcm_size()], True)
+
+    if spec.tags or spec.coverSize:
+        body += iff_chunk(b'ID3 ', id3_parts(spec), True)
+
+    return iff_chunk(b'FORM', body, True)
+
+
+# частоты, которые бывают у WavPack (индекс - в флагах блока)
+WAVPACK_RATES = (6000, 8000, 9600, 11025, 12000, 16000, 22050, 24000,
+    32000, 44100, 48000, 64000, 88200, 96000, 192000)
+
+
+def gen_wavpack(spec):
+    flags = (spec.bitsPerSample // 8 - 1) | (4 if spec.channels == 1 else 0)\
+        | (WAVPACK_RATES.index(spec.sampleRate) << 23)
+
+    hdr = b'wvpk' + struct.pack('<IHBBIIII', 1000, 0x410, 0, 0, spec.nsamples(), 0, 4096, flags) + struct.pack('<I', 0)
+
+    return [hdr, spec.pcm_size(0.6)] + apev2_parts(spec)
+
+
+def gen_ape(spec):
+    desc = b'MAC ' + struct.pack('<HH', 3990, 0) + struct.pack('<IIIIIII', 52, 24, 0, 0, 0, 0, 0) + b'\0' * 16
+
+    blocksPerFrame = 73728
+    nframes = spec.nsamples() // blocksPerFrame + 1
+    finalBlocks = spec.nsamples() % blocksPerFrame or blocksPerFrame
+
+    hdr = struct.pack('<HHIIIHHI', 2000, 0, blocksPerFrame, finalBlocks, nframes,
+        spec.bitsPerSample, spec.channels, spec.sampleRate)
+
+    return [desc + hdr, spec.pcm_size(0.6)] + apev2_parts(spec)
+
+
+# OptimFROG: тип сэмплов для разрядности
+OFR_SAMPLE_TYPES = {8:0, 16:2, 24:4, 32:6}
+
+
+def gen_optimfrog(spec):
+    total = spec.nsamples() * spec.channels
+
+    hdr = b'OFR ' + struct.pack('<IIHBBIHB', 15, total & 0xFFFFFFFF, total >> 32,
+        OFR_SAMPLE_TYPES[spec.bitsPerSample], spec.channels - 1, spec.sampleRate, 0x1B0, 10)
+    hdr += b'\0' * (76 - len(hdr))
+
+    return [hdr, spec.pcm_size(0.55)] + apev2_parts(spec)
+
+
+# MPEG-1 Layer III: допустимые битрейты и частоты
+MP3_BITRATES = (32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+MP3_RATES = (44100, 48000, 32000)
+
+
+def gen_mp3(spec):
+    brix = MP3_BITRATES.index(spec.bitRate) + 1
+    srix = MP3_RATES.index(spec.sampleRate)
+
+    flen = 144000 * spec.bitRate // spec.sampleRate
+
+    # стерео или моно, без CRC
+    frame = bytes((0xFF, 0xFB, (brix << 4) | (srix << 2), 0xC0 if spec.channels == 1 else 0x00))
+    frame += b'\0' * (flen - len(frame))
+
+    parts = id3_parts(spec) if (spec.tags or spec.coverSize) else []
+
+    # несколько настоящих кадров - чтобы mutagen нашёл поток,
+    # дальше - "дыра"
+    parts += [frame * 8, max(0, spec.lossy_size() - flen * 8)]
+
+    return parts
+
+
+# размер страницы Ogg (не больше 255 сегментов по 255 байт)
+OGG_PAGE_SIZE = 250 * 255
+
+
+def ogg_parts(spec, packets, granule):
+    """Куски потока Ogg: страницы с заголовками из packets,
+    "дыра" на месте звука и последняя страница с позицией granule."""
+
+    serial = 0x41530001
+
+    # первый заголовок должен быть один на первой странице;
+    # страницы побольше - иначе from_packets() режет пакет с обложкой
+    # на 4-килобайтные куски очень долго
+    pages = OggPage.from_packets(packets[:1])\
+        + OggPage.from_packets(packets[1:], 1, OGG_PAGE_SIZE, 255)
+
+    for page in pages:
+        page.serial = serial
+        page.position = 0
+
+    pages[0].first = True
+
+    last = OggPage()
+    last.serial = serial
+    last.sequence = pages[-1].sequence + 1
+    last.position = granule
+    last.last = True
+    last.packets = [b'\0' * 64]
+
+    return [b''.join(page.write() for page in pages), max(0, spec.lossy_size()), last.write()]
+
+
+def gen_vorbis(spec):
+    ident = b'\x01vorbis' + struct.pack('<IBIiii', 0, spec.channels, spec.sampleRate,
+        0, spec.bitRate * 1000, 0) + b'\xb8\x01'
+
+    comment = b'\x03vorbis' + vorbis_comment(spec, framing=True, picture=True)
+
+    setup = b'\x05vorbis' + b'\0' * 32
+
+    return ogg_parts(spec, [ident, comment, setup], spec.nsamples())
+
+
+def gen_opus(spec):
+    ident = b'OpusHead' + struct.pack('<BBHIhB', 1, spec.channels, 312, spec.sampleRate, 0, 0)
+
+    tags = b'OpusTags' + vorbis_comment(spec, picture=True)
+
+    # позиция в Opus - всегда в сэмплах 48 кГц
+    return ogg_parts(spec, [ident, tags], 48000 * spec.duration + 312)
+
+
+def mp4_atom(name, parts):
+    return [struct.pack('>I', 8 + parts_size(parts)) + name] + parts
+
+
+# частоты AAC (индекс - в AudioSpecificConfig)
+AAC_RATES = (96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050,
+    16000, 12000, 11025, 8000)
+
+
+def gen_mp4(spec):
+    timescale = spec.sampleRate
+    duration = spec.nsamples()
+
+    def __desc(tag, body):
+        return bytes((tag, len(body))) + body
+
+    asc = struct.pack('>H', (2 << 11) | (AAC_RATES.index(spec.sampleRate) << 7) | (spec.channels << 3))
+
+    dcd = __desc(0x04, struct.pack('>BB', 0x40, 0x15) + b'\0\x18\0'
+        + struct.pack('>II', spec.bitRate * 1000, spec.bitRate * 1000) + __desc(0x05, asc))
+
+    esds = b'\0\0\0\0' + __desc(0x03, struct.pack('>HB', 1, 0) + dcd + __desc(0x06, b'\x02'))
+
+    mp4a = b'\0' * 6 + struct.pack('>H', 1) + b'\0' * 8\
+        + struct.pack('>HHHHI', spec.channels, 16, 0, 0, min(timescale, 0xFFFF) << 16)
+    mp4a = mp4_atom(b'mp4a', [mp4a] + mp4_atom(b'esds', [esds]))
+
+    stsd = mp4_atom(b'stsd', [struct.pack('>II', 0, 1)] + mp4a)
+    stbl = mp4_atom(b'stbl', stsd
+        + mp4_atom(b'stts', [struct.pack('>II', 0, 0)])
+        + mp4_atom(b'stsc', [struct.pack('>II', 0, 0)])
+        + mp4_atom(b'stsz', [struct.pack('>III', 0, 0, 0)])
+        + mp4_atom(b'stco', [struct.pack('>II', 0, 0)]))
+
+    minf = mp4_atom(b'minf', mp4_atom(b'smhd', [b'\0' * 8]) + stbl)
+    hdlr = mp4_atom(b'hdlr', [b'\0' * 8 + b'soun' + b'\0' * 12 + b'\0'])
+    mdhd = mp4_atom(b'mdhd', [struct.pack('>IIIIIHH', 0, 0, 0, timescale, duration, 0x55C4, 0)])
+    mdia = mp4_atom(b'mdia', mdhd + hdlr + minf)
+
+    tkhd = mp4_atom(b'tkhd', [struct.pack('>IIIIII', 7, 0, 0, 1, 0, duration) + b'\0' * 60])
+    trak = mp4_atom(b'trak', tkhd + mdia)
+
+    mvhd = mp4_atom(b'mvhd', [struct.pack('>IIIII', 0, 0, 0, timescale, duration) + b'\0' * 80])
+
+    items = []
+
+    for n, v in spec.tags.items():
+        key = MP4_KEYS[TAG_NAMES.index(n)]
+
+        if key is None:
+            # номер дорожки - двоичный
+            items += mp4_atom(b'trkn', mp4_atom(b'data', [struct.pack('>II', 0, 0)
+                + struct.pack('>HHHH', 0, int(v), 0, 0)]))
+        else:
+            items += mp4_atom(key, mp4_atom(b'data', [struct.pack('>II', 1, 0) + v.encode('utf-8')]))
+
+    if spec.coverSize:
+        items += mp4_atom(b'covr', mp4_atom(b'data', [struct.pack('>II', 13, 0), spec.coverSize]))
+
+    moovParts = mvhd + trak
+
+    if items:
+        meta = mp4_atom(b'meta', [b'\0' * 4]
+            + mp4_atom(b'hdlr', [b'\0' * 8 + b'mdir' + b'appl' + b'\0' * 9])
+            + mp4_atom(b'ilst', items))
+        moovParts += mp4_atom(b'udta', meta)
+
+    return mp4_atom(b'ftyp', [b'M4A \0\0\0\0M4A mp42isom']) + mp4_atom(b'moov', moovParts)\
+        + mp4_atom(b'mdat', [spec.lossy_size()])
+
+
+def gen_webm(spec):
+    # только заголовок EBML - mutagen такое не разбирает,
+    # а в фонотеке оно попадается
+    doctype = b'webm'
+    ebml = b'\x42\x82' + bytes((0x80 | len(doctype),)) + doctype
+
+    return [b'\x1a\x45\xdf\xa3' + bytes((0x80 | len(ebml),)) + ebml, spec.lossy_size()]
+
+
+class FormatInfo():
+    """Описание генерируемого формата.
+
+    Поля:
+        generate    - функция, получающая экземпляр TrackSpec
+                      и возвращающая список кусков файла;
+        lossy       - булевское, True - параметр потока - битрейт,
+                      а не разрядность;
+        sampleRates - None (любые) или кортеж допустимых частот;
+        bits        - кортеж допустимых разрядностей;
+        bitRates    - None (любые) или кортеж допустимых битрейтов."""
+
+    def __init__(self, generate, lossy=False, sampleRates=None, bits=(16, 24), bitRates=None):
+        self.generate = generate
+        self.lossy = lossy
+        self.sampleRates = sampleRates
+        self.bits = bits
+        self.bitRates = bitRates
+
+
+FORMATS = {'.flac':FormatInfo(gen_flac),
+    '.wv':FormatInfo(gen_wavpack, sampleRates=WAVPACK_RATES),
+    '.ape':FormatInfo(gen_ape),
+    '.mp3':FormatInfo(gen_mp3, True, MP3_RATES, (16,), MP3_BITRATES),
+    '.m4a':FormatInfo(gen_mp4, True, AAC_RATES, (16,)),
+    '.ogg':FormatInfo(gen_vorbis, True, bits=(16,)),
+    '.oga':FormatInfo(gen_vorbis, True, bits=(16,)),
+    '.opus':FormatInfo(gen_opus, True, bits=(16,)),
+    '.ofr':FormatInfo(gen_optimfrog, bits=(8, 16, 24)),
+    '.aif':FormatInfo(gen_aiff),
+    '.aiff':FormatInfo(gen_aiff),
+    '.aifc':FormatInfo(lambda spec: gen_aiff(spec, True)),
+    '.wav':FormatInfo(gen_wav),
+    '.webm':FormatInfo(gen_webm, True, bits=(16,)),
+    }
+
+
+# способы порчи заголовка
+CORRUPTIONS = ('magic', 'truncated', 'garbage')
+
+
+def corrupt_parts(parts, how, rng):
+    """Порча заголовка файла (первого куска parts)."""
+
+    head = bytearray(parts[0])
+
+    if how == 'magic':
+        head[:4] = b'\0\0\0\0'
+    elif how == 'truncated':
+        return [bytes(head[:min(len(head), 12)])]
+    else:
+        for i in range(4, min(len(head), 64)):
+            head[i] = rng.randrange(256)
+
+    return [bytes(head)] + parts[1:]
+
+
+#
+# дерево каталогов
+#
+
+def parse_range(s, name):
+    """Разбор строки вида "N" или "MIN-MAX". Возвращает кортеж (MIN, MAX)."""
+
+    try:
+        lo, _, hi = s.partition('-')
+        lo = int(lo)
+        hi = int(hi) if hi else lo
+    except ValueError:
+        raise ValueError('invalid %s "%s"' % (name, s))
+
+    if lo < 1 or hi < lo:
+        raise ValueError('invalid %s "%s"' % (name, s))
+
+    return lo, hi
+
+
+def parse_int_list(s, name):
+    try:
+        r = tuple(int(v) for v in s.split(',') if v.strip())
+    except ValueError:
+        raise ValueError('invalid %s "%s"' % (name, s))
+
+    if not r or min(r) <= 0:
+        raise ValueError('invalid %s "%s"' % (name, s))
+
+    return r
+
+
+def parse_formats(s):
+    """Разбор строки вида "ext=вес,..." (напр. "flac=3,mp3=1").
+    Пустая строка - все типы из AUDIO_FILE_TYPES с равными весами
+    (вес типа делится между его расширениями).
+    Возвращает список кортежей (расширение, вес)."""
+
+    if not s:
+        r = []
+
+        for _, exts in AUDIO_FILE_TYPES:
+            for ext in sorted(exts):
+                r.append((ext, 1.0 / len(exts)))
+
+        return r
+
+    r = []
+
+    for item in s.split(','):
+        ext, _, w = item.strip().partition('=')
+        ext = '.' + ext.lstrip('.').lower()
+
+        if ext not in FORMATS:
+            raise ValueError('unknown format "%s" (known: %s)' % (ext, ', '.join(sorted(FORMATS))))
+
+        try:
+            w = float(w) if w else 1.0
+        except ValueError:
+            raise ValueError('invalid format weight "%s"' % item)
+
+        if w > 0:
+            r.append((ext, w))
+
+    if not r:
+        raise ValueError('no formats')
+
+    return r
+
+
+def nearest(value, choices):
+    return min(choices, key=lambda c: (abs(c - value), c))
+
+
+class LibraryGenerator():
+    """Генератор дерева каталогов.
+
+    Каталоги альбомов лежат на глубине depth; у каждого альбома - один
+    формат и одни параметры потока; тэги, обложки и порча заголовков
+    распределяются по файлам случайно (с заданными долями).
+    Случайные значения берутся из random.Random(seed), так что при
+    одинаковых параметрах дерево получается одинаковым.
+
+    Поля (параметры генерации):
+        rootdir     - строка, путь к корню дерева;
+        nfiles      - целое, кол-во файлов;
+        depth       - целое, глубина каталогов альбомов (>= 1);
+        albumSize   - кортеж (MIN, MAX), кол-во файлов в альбоме;
+        formats     - см. parse_formats();
+        sampleRates,
+        bits,
+        bitRates,
+        channels    - кортежи целых, из которых выбираются параметры
+                      потока (для каждого формата берутся ближайшие
+                      допустимые значения);
+        duration    - кортеж (MIN, MAX), длительность файлов в секундах;
+        missingTags - вещественное, доля файлов без части тэгов;
+        noTags      - вещественное, доля файлов вовсе без тэгов;
+        cover       - вещественное, доля файлов с обложкой;
+        coverSize   - целое, размер обложки в байтах;
+        corrupt     - вещественное, доля файлов с испорченным заголовком;
+        hardlinks   - булевское, True - одинаковые файлы делать жёсткими
+                      ссылками на образцы (AudioStat считает их
+                      повторами и не разбирает - это проверка обхода),
+                      иначе - разреженными файлами;
+        seed        - целое, начальное значение генератора случайных чисел;
+        templateDir - строка, путь к каталогу образцов для жёстких ссылок
+                      (рядом с rootdir).
+
+    Поля (статистика):
+        nGenerated  - целое, кол-во созданных файлов;
+        byFormat    - словарь, где ключи - расширения, значения - кол-во файлов;
+        nCorrupt,
+        nCovers,
+        nMissingTags- целые, кол-во соотв. файлов;
+        nBytes      - целое, "видимый" суммарный размер файлов."""
+
+    def __init__(self, rootdir, nfiles, depth=3, albumSize=(8, 14), formats=None,
+            sampleRates=(44100, 48000, 88200, 96000, 192000), bits=(16, 24),
+            bitRates=(128, 192, 256, 320), channels=(2,), duration=(120, 420),
+            missingTags=0.1, noTags=0.02, cover=0.05, coverSize=3 << 20,
+            corrupt=0.01, hardlinks=False, seed=0):
+        self.rootdir = os.path.abspath(rootdir)
+        self.nfiles = nfiles
+        self.depth = max(1, depth)
+        self.albumSize = albumSize
+        self.formats = parse_formats('') if formats is None else formats
+        self.sampleRates = sampleRates
+        self.bits = bits
+        self.bitRates = bitRates
+        self.channels = channels
+        self.duration = duration
+        self.missingTags = missingTags
+        self.noTags = noTags
+        self.cover = cover
+        self.coverSize = coverSize
+        self.corrupt = corrupt
+        self.hardlinks = hardlinks
+        self.seed = seed
+
+        self.nGenerated = 0
+        self.byFormat = dict()
+        self.nCorrupt = 0
+        self.nCovers = 0
+        self.nMissingTags = 0
+        self.nBytes = 0
+
+        # образцы для жёстких ссылок: ключи - TrackSpec.key(),
+        # значения - кортежи (путь, размер)
+        self.__templates = dict()
+        self.templateDir = self.rootdir + '.templates'
+
+    def __album_dir(self, ixalbum, nalbums):
+        """Путь к каталогу альбома номер ixalbum из nalbums."""
+
+        fanout = max(2, int(round(nalbums ** (1.0 / self.depth) + 0.5)))
+
+        names = []
+        n = ixalbum
+
+        for level in range(self.depth - 1):
+            n, ix = divmod(n, fanout)
+            names.append('%s %04d' % (('Artist', 'Year', 'Series', 'Box')[min(level, 3)], ix))
+
+        names.reverse()
+        names.append('Album %06d' % ixalbum)
+
+        return os.path.join(self.rootdir, *names)
+
+    def __album_params(self, rng):
+        """Выбор формата и параметров потока альбома.
+        Возвращает кортеж (ext, sampleRate, channels, bitsPerSample, bitRate)."""
+
+        ext = rng.choices([e for e, _ in self.formats], [w for _, w in self.formats])[0]
+        fmt = FORMATS[ext]
+
+        sampleRate = rng.choice(self.sampleRates)
+        if fmt.sampleRates is not None:
+            sampleRate = nearest(sampleRate, fmt.sampleRates)
+
+        bits = nearest(rng.choice(self.bits), fmt.bits)
+
+        bitRate = 0
+        if fmt.lossy:
+            bitRate = rng.choice(self.bitRates)
+            if fmt.bitRates is not None:
+                bitRate = nearest(bitRate, fmt.bitRates)
+
+        channels = rng.choice(self.channels)
+        if ext == '.mp3':
+            channels = min(2, channels)
+
+        return ext, sampleRate, channels, bits, bitRate
+
+    def __track_spec(self, rng, album, ixalbum, ntrack):
+        ext, sampleRate, channels, bits, bitRate = album
+
+        tags = {'title':'Track %d' % ntrack,
+            'artist':'Artist %d' % (ixalbum % 997),
+            'albumartist':'Artist %d' % (ixalbum % 997),
+            'album':'Album %d' % ixalbum,
+            'tracknumber':str(ntrack),
+            'genre':('Rock', 'Jazz', 'Classical', 'Electronic', 'Folk')[ixalbum % 5],
+            'date':str(1950 + ixalbum % 70)}
+
+        duration = rng.randint(*self.duration)
+
+        if self.hardlinks:
+            # чтобы одинаковых файлов (а значит, и жёстких ссылок на образцы)
+            # было побольше, тэги у всех файлов одинаковые,
+            # а длительность округляется до минут
+            tags = {name:'1' if name == 'tracknumber' else 'Synthetic %s' % name for name in TAG_NAMES}
+            duration = max(self.duration[0], duration - duration % 60)
+
+        r = rng.random()
+        if r < self.noTags:
+            tags = dict()
+        elif r < self.noTags + self.missingTags:
+            # убираем один или несколько тэгов
+            for name in rng.sample(TAG_NAMES, rng.randint(1, 3)):
+                del tags[name]
+
+        coverSize = self.coverSize if rng.random() < self.cover else 0
+        corrupt = rng.choice(CORRUPTIONS) if rng.random() < self.corrupt else None
+
+        return TrackSpec(ext, sampleRate, channels, bits, bitRate,
+            duration, tags, coverSize, corrupt)
+
+    def __make_parts(self, spec, rng):
+        parts = FORMATS[spec.ext].generate(spec)
+
+        if spec.corrupt is not None:
+            parts = corrupt_parts(parts, spec.corrupt, rng)
+
+        return parts
+
+    def __write_track(self, fpath, spec, rng):
+        """Создание файла. Возвращает его размер."""
+
+        if not self.hardlinks:
+            parts = self.__make_parts(spec, rng)
+            write_parts(fpath, parts)
+            return parts_size(parts)
+
+        key = spec.key()
+        tpath, size = self.__templates.get(key, (None, 0))
+
+        if tpath is None:
+            parts = self.__make_parts(spec, rng)
+            size = parts_size(parts)
+
+            tpath = os.path.join(self.templateDir, '%06d%s' % (len(self.__templates), spec.ext))
+            os.makedirs(self.templateDir, exist_ok=True)
+            write_parts(tpath, parts)
+            self.__templates[key] = (tpath, size)
+
+        os.link(tpath, fpath)
+
+        return size
+
+    def generate(self, manifest=None, progress=None):
+        """Создание дерева.
+
+        manifest    - None или csv.writer для записей о файлах
+                      (см. MANIFEST_COLUMNS);
+        progress    - None или функция, вызываемая с кол-вом уже
+                      созданных файлов через каждые PROGRESS_INTERVAL."""
+
+        rng = Random(self.seed)
+
+        avgAlbum = (self.albumSize[0] + self.albumSize[1]) / 2.0
+        nalbums = max(1, int(self.nfiles / avgAlbum + 0.5))
+
+        ixalbum = 0
+
+        while self.nGenerated < self.nfiles:
+            album = self.__album_params(rng)
+
+            adir = self.__album_dir(ixalbum, nalbums)
+            os.makedirs(adir, exist_ok=True)
+
+            ntracks = min(rng.randint(*self.albumSize), self.nfiles - self.nGenerated)
+
+            for ntrack in range(1, ntracks + 1):
+                spec = self.__track_spec(rng, album, ixalbum, ntrack)
+
+                fpath = os.path.join(adir, '%02d - Track %d%s' % (ntrack, ntrack, spec.ext))
+
+                self.nBytes += self.__write_track(fpath, spec, rng)
+
+                self.nGenerated += 1
+                self.byFormat[spec.ext] = self.byFormat.get(spec.ext, 0) + 1
+
+                if spec.corrupt is not None:
+                    self.nCorrupt += 1
+
+                if spec.coverSize:
+                    self.nCovers += 1
+
+                if 0 < len(spec.tags) < len(TAG_NAMES):
+                    self.nMissingTags += 1
+
+                if manifest is not None:
+                    manifest.writerow((fpath, spec.ext, spec.sampleRate, spec.channels,
+                        spec.bitsPerSample, spec.bitRate, spec.duration,
+                        len(spec.tags), spec.coverSize, spec.corrupt or ''))
+
+                if progress is not None and self.nGenerated % self.PROGRESS_INTERVAL == 0:
+                    progress(self.nGenerated)
+
+            ixalbum += 1
+
+    PROGRESS_INTERVAL = 10000
+
+
+MANIFEST_COLUMNS = ('path', 'ext', 'sampleRate', 'channels', 'bitsPerSample',
+    'bitRate', 'duration', 'tags', 'coverSize', 'corrupt')
+
+
+def main(argv):
+    parser = ArgumentParser(prog=os.path.split(sys.argv[0])[1],
+        description='Generate a reproducible synthetic audio library for AudioStat testing')
+
+    parser.add_argument('directory',
+        help='root directory of the library (must not exist or be empty)')
+    parser.add_argument('-n', '--files', type=int, default=10000,
+        help='number of files (default: %(default)s)')
+    parser.add_argument('--depth', type=int, default=3,
+        help='depth of album directories below the root (default: %(default)s)')
+    parser.add_argument('--album-size', default='8-14', metavar='MIN[-MAX]',
+        help='files per album (default: %(default)s)')
+    parser.add_argument('--formats', default='', metavar='EXT=WEIGHT,...',
+        help='format mix, e.g. "flac=3,mp3=2,m4a=1" (default: all types of AUDIO_FILE_TYPES equally)')
+    parser.add_argument('--sample-rates', default='44100,48000,88200,96000,192000', metavar='HZ,...',
+        help='sample rates (nearest supported value is used for each format)')
+    parser.add_argument('--bits', default='16,24', metavar='N,...',
+        help='bits per sample of lossless formats')
+    parser.add_argument('--bitrates', default='128,192,256,320', metavar='KBPS,...',
+        help='bitrates of lossy formats')
+    parser.add_argument('--channels', default='2', metavar='N,...',
+        help='numbers of channels')
+    parser.add_argument('--duration', default='120-420', metavar='MIN[-MAX]',
+        help='track duration in seconds (affects apparent file size only)')
+    parser.add_argument('--missing-tags', type=float, default=0.1, metavar='FRACTION',
+        help='fraction of files with some tags missing')
+    parser.add_argument('--no-tags', type=float, default=0.02, metavar='FRACTION',
+        help='fraction of files without tags at all')
+    parser.add_argument('--cover', type=float, default=0.05, metavar='FRACTION',
+        help='fraction of files with embedded cover art')
+    parser.add_argument('--cover-size', type=int, default=3072, metavar='KIB',
+        help='cover art size (default: %(default)s KiB)')
+    parser.add_argument('--corrupt', type=float, default=0.01, metavar='FRACTION',
+        help='fraction of files with deliberately damaged headers')
+    parser.add_argument('--link', choices=('sparse', 'hard'), default='sparse',
+        help='sparse - every file is a sparse file (default); hard - identical files '
+        'are hardlinks to templates in DIRECTORY.templates (AudioStat reports them as duplicates)')
+    parser.add_argument('--seed', type=int, default=0,
+        help='random seed (default: %(default)s)')
+    parser.add_argument('--manifest', default=None, metavar='FILE',
+        help='write CSV with expected parameters of every file')
+    parser.add_argument('-q', '--quiet', action='store_true',
+        help='do not report progress')
+
+    args = parser.parse_args(argv)
+
+    try:
+        gen = LibraryGenerator(args.directory, args.files,
+            depth=args.depth,
+            albumSize=parse_range(args.album_size, 'album size'),
+            formats=parse_formats(args.formats),
+            sampleRates=parse_int_list(args.sample_rates, 'sample rates'),
+            bits=parse_int_list(args.bits, 'bits per sample'),
+            bitRates=parse_int_list(args.bitrates, 'bitrates'),
+            channels=parse_int_list(args.channels, 'channels'),
+            duration=parse_range(args.duration, 'duration'),
+            missingTags=args.missing_tags,
+            noTags=args.no_tags,
+            cover=args.cover,
+            coverSize=max(1, args.cover_size) * 1024,
+            corrupt=args.corrupt,
+            hardlinks=args.link == 'hard',
+            seed=args.seed)
+    except ValueError as ex:
+        parser.error(str(ex))
+
+    # в каталоге образцов нельзя ничего перезаписывать - на старые
+    # образцы могут ссылаться файлы другого дерева
+    for dpath in (gen.rootdir, gen.templateDir) if gen.hardlinks else (gen.rootdir,):
+        if os.path.exists(dpath) and os.listdir(dpath):
+            parser.error('directory "%s" is not empty' % dpath)
+
+    def __progress(n):
+        print('%d files...' % n, file=sys.stderr)
+
+    manf = None
+    manifest = None
+
+    if args.manifest:
+        manf = open(args.manifest, 'w', encoding='utf-8', newline='')
+        manifest = csv.writer(manf)
+        manifest.writerow(MANIFEST_COLUMNS)
+
+    try:
+        gen.generate(manifest, None if args.quiet else __progress)
+    finally:
+        if manf is not None:
+            manf.close()
+
+    if not args.quiet:
+        print('Files: %d (apparent size %.1f GiB), corrupt: %d, with cover: %d, missing tags: %d' % (
+            gen.nGenerated, gen.nBytes / 2**30, gen.nCorrupt, gen.nCovers, gen.nMissingTags))
+
+        for ext, n in sorted(gen.byFormat.items()):
+            print('  %-6s %d' % (ext, n))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))